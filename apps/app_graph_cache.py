@@ -0,0 +1,89 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class AppGraphCache:
+    # Keeps the resolved merkle graph of apps: an app manifest, the app's per-platform layers indexes,
+    # and manifests/indexes of the app's images. All graph nodes are addressed by digest and never change,
+    # so once an app graph is resolved it can be reused by any fetcher without going to the registry.
+    # The graphs are persisted on disk if a cache directory is specified, one file per app digest.
+    CacheDirEnv = 'APPS_GRAPH_CACHE_DIR'
+    GraphFileExt = '.json'
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir or os.environ.get(self.CacheDirEnv)
+        if self._cache_dir:
+            os.makedirs(self._cache_dir, exist_ok=True)
+        self._nodes = {}
+        # app uri -> digests of the nodes loaded from the app's graph file, they are kept when it's stored again
+        self._graphs = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str):
+        with self._lock:
+            node = self._nodes.get(digest)
+            if node is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return node
+
+    def __contains__(self, digest: str):
+        with self._lock:
+            return digest in self._nodes
+
+    def add(self, digest: str, data: bytes):
+        with self._lock:
+            self._nodes[digest] = data
+
+    def load(self, app_uri: str) -> bool:
+        graph_file = self._graph_file(app_uri)
+        if not graph_file or not os.path.exists(graph_file):
+            return False
+        try:
+            with open(graph_file) as f:
+                graph = json.load(f)
+            nodes = {}
+            for digest, node in graph['nodes'].items():
+                data = base64.b64decode(node)
+                if 'sha256:' + hashlib.sha256(data).hexdigest() != digest:
+                    raise Exception('Incorrect node hash; digest: {}'.format(digest))
+                nodes[digest] = data
+        except Exception as exc:
+            logger.warning('Failed to load app graph, ignoring it; app: {}, err: {}'.format(app_uri, exc))
+            return False
+        with self._lock:
+            self._nodes.update(nodes)
+            self._graphs[app_uri] = set(nodes)
+        logger.info('App graph is loaded from the cache; app: {}, nodes: {}'.format(app_uri, len(nodes)))
+        return True
+
+    def store(self, app_uri: str, digests):
+        graph_file = self._graph_file(app_uri)
+        if not graph_file:
+            return
+        with self._lock:
+            digests = set(digests) | self._graphs.get(app_uri, set())
+            nodes = {d: base64.b64encode(self._nodes[d]).decode() for d in digests if d in self._nodes}
+            self._graphs[app_uri] = set(nodes)
+        tmp_file = '{}.{}.tmp'.format(graph_file, threading.get_ident())
+        with open(tmp_file, 'w') as f:
+            json.dump({'uri': app_uri, 'nodes': nodes}, f)
+        os.replace(tmp_file, graph_file)
+
+    def _graph_file(self, app_uri: str):
+        if not self._cache_dir:
+            return None
+        return os.path.join(self._cache_dir, app_uri.split('@sha256:')[-1] + self.GraphFileExt)
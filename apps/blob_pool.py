@@ -0,0 +1,239 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class BlobPool:
+    # A content-addressed pool of blobs shared by all Targets fetched to the same directory.
+    # A blob is downloaded to the pool once and placed to each Target's blob dir as a hardlink,
+    # or as a reflink if hardlinking is not possible, or as a copy as the last resort.
+    # If no pool dir is specified then blobs are downloaded directly to their destinations.
+    #
+    # A pool can be persistent and shared by parallel builds on the same host (e.g. a blob cache on
+    # the bitbake persistent volume). If `max_size` is specified then the least recently used blobs
+    # are evicted by `evict()` to keep the pool size under it, a blob's atime is updated on each use.
+    # Processes take a shared lock on the pool to use it and an exclusive one to evict blobs from it.
+    TmpFileSuffix = '.partial'
+    LockFile = '.lock'
+    # Temporary files older than this are leftovers of crashed processes
+    StaleTmpFileAge = 24 * 3600
+    # ioctl_ficlone(2)
+    FICLONE = 0x40049409
+    ChunkSize = 1024 * 1024
+
+    def __init__(self, pool_dir=None, max_size=None):
+        self.dir = os.path.join(pool_dir, 'sha256') if pool_dir else None
+        self.max_size = max_size
+        if self.dir:
+            os.makedirs(self.dir, exist_ok=True)
+            self._lock_file = os.path.join(pool_dir, self.LockFile)
+        self._lock = threading.Lock()
+        self._blob_locks = {}
+        self.downloaded = 0
+        self.reused = 0
+        self.hardlinks = 0
+        self.reflinks = 0
+        self.copies = 0
+        self.evicted = 0
+        self.imported = 0
+
+    def path(self, digest):
+        return os.path.join(self.dir, digest[len('sha256:'):]) if self.dir else None
+
+    def get(self, digest, dst, fetch):
+        # Places the blob to `dst`, the blob is fetched to the pool by `fetch(<file path>)` if it's missing there.
+        # `fetch` must create the file only if the received blob matches the digest.
+        if not self.dir:
+            fetch(dst)
+            self._count('downloaded')
+            return
+        pool_file = self.path(digest)
+        with self._file_lock(fcntl.LOCK_SH), self._blob_lock(digest):
+            if os.path.exists(pool_file):
+                self._touch(pool_file)
+                self._count('reused')
+            else:
+                fetch(pool_file)
+                self._count('downloaded')
+            self.place(pool_file, dst)
+
+    def seed(self, digest, dst):
+        # Places the blob to `dst` if it's present in the pool, returns True if it is
+        if not self.dir or os.path.exists(dst):
+            return False
+        pool_file = self.path(digest)
+        with self._file_lock(fcntl.LOCK_SH):
+            if not os.path.exists(pool_file):
+                return False
+            self._touch(pool_file)
+            self.place(pool_file, dst)
+        self._count('reused')
+        return True
+
+    def put(self, digest, data: bytes, dst):
+        def write(path):
+            f = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.',
+                                            suffix=self.TmpFileSuffix, delete=False)
+            with f:
+                f.write(data)
+            os.replace(f.name, path)
+        self.get(digest, dst, write)
+
+    def add(self, digest, src, mtime=None):
+        # Adds the blob read from the `src` file object to the pool if it's missing there, returns True if it's added.
+        # The blob is verified against the digest. `mtime` is the blob's last use time, the blob is evicted
+        # before the ones used after it.
+        if not self.dir:
+            return False
+        pool_file = self.path(digest)
+        with self._file_lock(fcntl.LOCK_SH), self._blob_lock(digest):
+            if os.path.exists(pool_file):
+                return False
+            f = tempfile.NamedTemporaryFile(dir=self.dir, prefix=os.path.basename(pool_file) + '.',
+                                            suffix=self.TmpFileSuffix, delete=False)
+            try:
+                h = hashlib.sha256()
+                with f:
+                    for chunk in iter(lambda: src.read(self.ChunkSize), b''):
+                        h.update(chunk)
+                        f.write(chunk)
+                if 'sha256:' + h.hexdigest() != digest:
+                    raise Exception('Incorrect blob hash; expected: {}, received: sha256:{}'
+                                    .format(digest, h.hexdigest()))
+                if mtime is not None:
+                    os.utime(f.name, (mtime, mtime))
+                os.replace(f.name, pool_file)
+            except BaseException:
+                if os.path.exists(f.name):
+                    os.remove(f.name)
+                raise
+        self._count('imported')
+        return True
+
+    def adopt(self, digest, blob_file):
+        # Moves a blob stored by a third party (e.g. skopeo) to the pool and links it back,
+        # so it's shared with other Targets
+        if not self.dir:
+            return
+        pool_file = self.path(digest)
+        with self._file_lock(fcntl.LOCK_SH), self._blob_lock(digest):
+            if not os.path.exists(pool_file):
+                try:
+                    os.link(blob_file, pool_file)
+                    return
+                except OSError:
+                    self.place(blob_file, pool_file)
+            self._touch(pool_file)
+            self.place(pool_file, blob_file)
+
+    def discard(self, digest):
+        # Removes the blob from the pool, e.g. it's found corrupted, so it's fetched again on the next use
+        if not self.dir:
+            return
+        pool_file = self.path(digest)
+        with self._file_lock(fcntl.LOCK_SH), self._blob_lock(digest):
+            if os.path.exists(pool_file):
+                os.remove(pool_file)
+
+    def evict(self):
+        # Removes the least recently used blobs until the pool size is under the max size
+        if not self.dir or not self.max_size:
+            return
+        with self._file_lock(fcntl.LOCK_EX):
+            blobs = []
+            size = 0
+            now = time.time()
+            for entry in os.scandir(self.dir):
+                st = entry.stat(follow_symlinks=False)
+                if entry.name.endswith(self.TmpFileSuffix):
+                    if now - st.st_mtime > self.StaleTmpFileAge:
+                        os.remove(entry.path)
+                    continue
+                blobs.append((st.st_atime, st.st_size, entry.path))
+                size += st.st_size
+            blobs.sort()
+            evicted_size = 0
+            for _, blob_size, blob_file in blobs:
+                if size <= self.max_size:
+                    break
+                os.remove(blob_file)
+                size -= blob_size
+                evicted_size += blob_size
+                self.evicted += 1
+        logger.info('Blob pool size: {}, max size: {}, evicted blobs: {}, evicted size: {}'
+                    .format(size, self.max_size, self.evicted, evicted_size))
+
+    def place(self, src, dst):
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return
+        tmp_file = '{}.{}{}'.format(dst, threading.get_ident(), self.TmpFileSuffix)
+        try:
+            os.link(src, tmp_file)
+            self._count('hardlinks')
+        except OSError:
+            # e.g. the pool and the destination are on different filesystems, or the link limit is reached
+            if self._reflink(src, tmp_file):
+                self._count('reflinks')
+            else:
+                shutil.copyfile(src, tmp_file)
+                self._count('copies')
+        os.replace(tmp_file, dst)
+
+    def log_stats(self):
+        logger.info('Blob pool; downloaded: {}, reused: {}, imported: {}, hardlinks: {}, reflinks: {}, copies: {}'
+                    .format(self.downloaded, self.reused, self.imported, self.hardlinks, self.reflinks,
+                            self.copies))
+
+    @contextmanager
+    def _file_lock(self, operation):
+        # Each use opens the lock file, so the lock is held by this use only and not by all the process threads
+        with open(self._lock_file, 'a') as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _touch(path):
+        # atime is not updated on reads if the filesystem is mounted with `noatime` or `relatime`
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+
+    def _reflink(self, src, dst):
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), self.FICLONE, s.fileno())
+            return True
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+            return False
+
+    def _blob_lock(self, digest):
+        with self._lock:
+            return self._blob_locks.setdefault(digest, threading.Lock())
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def parse_size(size: str) -> int:
+    # <number>[K|M|G|T], e.g. 512M, 20G
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
@@ -1,13 +1,19 @@
 # Copyright (c) 2020 Foundries.io
 # SPDX-License-Identifier: BSD-3-Clause
 
+import hashlib
+import json
 import logging
 import os
+import re
+import threading
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 
 from expandvars import expandvars
 
 from helpers import cmd as cmd_exe
+from apps.compose_validator import ComposeValidator
 from apps.image_downloader import DockerDownloader
 
 
@@ -16,10 +22,30 @@ logger = logging.getLogger(__name__)
 
 class ComposeApps:
     DisabledSuffix = '.disabled'
+    # Apps are validated concurrently, a `docker compose config` validation starts a docker CLI process
+    ValidationWorkersEnv = 'COMPOSE_VALIDATION_WORKERS'
+    DefaultValidationWorkers = 8
 
     class App:
         DockerComposeTool = 'docker'
         ComposeFile = 'docker-compose.yml'
+        EnvFile = '.env'
+        # Compose files are validated by `docker compose config` by default, the in-process validator is used
+        # if it's requested
+        ValidatorEnv = 'COMPOSE_VALIDATOR'
+        NativeValidator = 'native'
+        DockerValidator = 'docker'
+        # The successful `docker compose config` validations are cached on disk if a cache dir is specified.
+        # They are keyed by the compose file, the environment it depends on and the compose version,
+        # so the apps that haven't changed are not validated again by the following runs.
+        ConfigCacheDirEnv = 'COMPOSE_CONFIG_CACHE_DIR'
+        EnvVarPattern = re.compile(rb'\$\{?([A-Za-z_][A-Za-z0-9_]*)')
+        # The libyaml based loader and dumper are used if available, their output is the same as the pure python ones.
+        # The compose file is validated as YAML 1.2 by the native validator, but it's loaded and saved as before.
+        YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+        _compose_version = None
+        _compose_version_lock = threading.Lock()
 
         @staticmethod
         def is_compose_app_dir(app_dir):
@@ -29,7 +55,7 @@ class ComposeApps:
                 raise ValueError('docker-compose.yaml file found. This must be named docker-compose.yml')
             return exists
 
-        def __init__(self, name, app_dir, image_downloader_cls=DockerDownloader, quiet=False):
+        def __init__(self, name, app_dir, image_downloader_cls=DockerDownloader, quiet=False, validate=True):
             if not self.is_compose_app_dir(app_dir):
                 raise Exception('Compose App dir {} does not contain a compose file {}'
                                 .format(app_dir, self.ComposeFile))
@@ -38,14 +64,72 @@ class ComposeApps:
             self.file = os.path.join(self.dir, self.ComposeFile)
 
             self._image_downloader_cls = image_downloader_cls
-
+            # The compose file is validated and parsed on the first use of the app config
+            self._quiet = quiet
+            self._validate = validate
+            self._desc = None
+            self._lock = threading.Lock()
+
+        def load(self, buffered=False):
+            with self._lock:
+                if self._desc is None:
+                    with open(self.file, 'rb') as compose_file:
+                        try:
+                            desc = yaml.load(compose_file, Loader=self.YamlLoader)
+                        except yaml.YAMLError as exc:
+                            raise Exception('Invalid compose file {}: {}'.format(self.file, exc))
+                    if self._validate:
+                        self.validate(self._quiet, buffered)
+                    self._desc = desc
+                return self._desc
+
+        def validate(self, quiet=False, buffered=False):
+            if os.environ.get(self.ValidatorEnv, self.DockerValidator) == self.NativeValidator:
+                ComposeValidator().validate(self.file)
+                return
+            cache_file = self._get_config_cache_file(quiet)
+            if cache_file and os.path.exists(cache_file):
+                logger.info('App config has been already validated; app: {}'.format(self.name))
+                return
             args = [self.DockerComposeTool, 'compose', '-f', self.ComposeFile, 'config']
             if quiet:
                 args.append('--quiet')
-            cmd_exe(*args, cwd=self.dir)
-
-            with open(self.file) as compose_file:
-                self._desc = yaml.safe_load(compose_file)
+            cmd_exe(*args, cwd=self.dir, buffered=buffered)
+            if cache_file:
+                try:
+                    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                    with open(cache_file, 'w') as f:
+                        json.dump({'app': self.name}, f)
+                except OSError as exc:
+                    logger.warning('Failed to cache app config validation; app: {}, err: {}'.format(self.name, exc))
+
+        def _get_config_cache_file(self, quiet):
+            cache_dir = os.environ.get(self.ConfigCacheDirEnv)
+            if not cache_dir:
+                return None
+            h = hashlib.sha256()
+            with open(self.file, 'rb') as f:
+                data = f.read()
+            h.update(data)
+            env_file = os.path.join(self.dir, self.EnvFile)
+            if os.path.exists(env_file):
+                with open(env_file, 'rb') as f:
+                    h.update(f.read())
+            # The variables the compose file refers to, e.g. FACTORY and TAG, and the compose settings
+            env = {var: os.environ.get(var) for var in
+                   {m.decode() for m in self.EnvVarPattern.findall(data)} |
+                   {var for var in os.environ if var.startswith('COMPOSE_') and var != self.ConfigCacheDirEnv}}
+            h.update(json.dumps({'tool': self.DockerComposeTool, 'version': self._get_compose_version(),
+                                 'quiet': quiet, 'env': env}, sort_keys=True).encode())
+            return os.path.join(cache_dir, h.hexdigest())
+
+        @classmethod
+        def _get_compose_version(cls):
+            with cls._compose_version_lock:
+                if cls._compose_version is None:
+                    cls._compose_version = cmd_exe(cls.DockerComposeTool, 'compose', 'version', '--short',
+                                                   capture=True).decode().strip()
+                return cls._compose_version
 
         def services(self):
             return self['services'].items()
@@ -57,17 +141,21 @@ class ComposeApps:
                     img = expandvars(img)
                 yield img
 
+        def get_image_downloader(self, docker_host='unix:///var/run/docker.sock'):
+            return self._image_downloader_cls(docker_host)
+
         def download_images(self, platform=None, docker_host='unix:///var/run/docker.sock'):
-            downloader = self._image_downloader_cls(docker_host)
+            downloader = self.get_image_downloader(docker_host)
             for image in self.images():
                 downloader.pull(image, platform)
 
         def save(self):
+            desc = self.load()
             with open(self.file, 'w') as compose_file:
-                yaml.dump(self._desc, compose_file)
+                yaml.dump(desc, compose_file, Dumper=self.YamlDumper)
 
         def __getitem__(self, item):
-            return self._desc[item]
+            return self.load()[item]
 
     @property
     def apps(self):
@@ -93,6 +181,13 @@ class ComposeApps:
             logger.debug('Found Compose App: '.format(app))
             self._apps.append(self.App(app, app_dir, quiet=quiet))
 
+    def load(self):
+        # Validates and parses all apps up front, otherwise each app is loaded on its first use
+        workers = int(os.environ.get(self.ValidationWorkersEnv, self.DefaultValidationWorkers))
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='compose-config') as executor:
+            list(executor.map(lambda app: app.load(buffered=len(self._apps) > 1), self._apps))
+        return self
+
     def __iter__(self):
         return self._apps.__iter__()
 
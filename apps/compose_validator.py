@@ -0,0 +1,266 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import logging
+import os
+import re
+
+import yaml
+
+
+logger = logging.getLogger(__name__)
+
+
+class ComposeYamlLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):
+    # compose-go parses compose files as YAML 1.2: only true/false are booleans and there are neither
+    # sexagesimal numbers nor timestamps, so e.g. `restart: no` is the "no" string and `22:22` is not a number.
+    yaml_implicit_resolvers = {
+        first: [(tag, regexp) for tag, regexp in resolvers
+                if tag not in ('tag:yaml.org,2002:bool', 'tag:yaml.org,2002:int', 'tag:yaml.org,2002:float',
+                               'tag:yaml.org,2002:timestamp')]
+        for first, resolvers in getattr(yaml, 'CSafeLoader', yaml.SafeLoader).yaml_implicit_resolvers.items()
+    }
+
+
+ComposeYamlLoader.add_implicit_resolver(
+    'tag:yaml.org,2002:bool', re.compile(r'^(?:true|True|TRUE|false|False|FALSE)$'), list('tTfF'))
+ComposeYamlLoader.add_implicit_resolver(
+    'tag:yaml.org,2002:int',
+    re.compile(r'^(?:[-+]?0b[0-1_]+|[-+]?0[0-7_]+|[-+]?(?:0|[1-9][0-9_]*)|[-+]?0x[0-9a-fA-F_]+)$'),
+    list('-+0123456789'))
+ComposeYamlLoader.add_implicit_resolver(
+    'tag:yaml.org,2002:float',
+    re.compile(r'''^(?:[-+]?(?:[0-9][0-9_]*)\.[0-9_]*(?:[eE][-+]?[0-9]+)?
+                 |\.[0-9][0-9_]*(?:[eE][-+]?[0-9]+)?
+                 |[-+]?[0-9][0-9_]*[eE][-+]?[0-9]+
+                 |[-+]?\.(?:inf|Inf|INF)
+                 |\.(?:nan|NaN|NAN))$''', re.X),
+    list('-+0123456789.'))
+
+
+class ComposeValidator:
+    # An in-process equivalent of `docker compose -f docker-compose.yml config --quiet` for the compose subset
+    # that apps use: the file is interpolated with the environment and the app's `.env` file the same way
+    # the compose CLI does it, then the structure of the top-level elements and the services is checked,
+    # as well as the references of the services to other services, named volumes and networks.
+    EnvFile = '.env'
+    TopLevelKeys = {'version', 'name', 'services', 'networks', 'volumes', 'secrets', 'configs', 'include', 'models'}
+    # The service properties of the compose spec schema (compose-go), including the legacy ones it still accepts
+    ServiceKeys = {
+        'annotations', 'attach', 'blkio_config', 'build', 'cap_add', 'cap_drop', 'cgroup', 'cgroup_parent',
+        'command', 'configs', 'container_name', 'cpu_count', 'cpu_percent', 'cpu_period', 'cpu_quota',
+        'cpu_rt_period', 'cpu_rt_runtime', 'cpu_shares', 'cpus', 'cpuset', 'credential_spec', 'depends_on',
+        'deploy', 'develop', 'device_cgroup_rules', 'devices', 'dns', 'dns_opt', 'dns_search', 'domainname',
+        'entrypoint', 'env_file', 'environment', 'expose', 'extends', 'external_links', 'extra_hosts', 'gpus',
+        'group_add', 'healthcheck', 'hostname', 'image', 'init', 'ipc', 'isolation', 'label_file', 'labels',
+        'links', 'logging', 'mac_address', 'mem_limit', 'mem_reservation', 'mem_swappiness', 'memswap_limit',
+        'models', 'network_mode', 'networks', 'oom_kill_disable', 'oom_score_adj', 'pid', 'pids_limit',
+        'platform', 'ports', 'post_start', 'pre_stop', 'privileged', 'profiles', 'provider', 'pull_policy',
+        'pull_refresh_after', 'read_only', 'restart', 'runtime', 'scale', 'secrets', 'security_opt', 'shm_size',
+        'stdin_open', 'stop_grace_period', 'stop_signal', 'storage_opt', 'sysctls', 'tmpfs', 'tty', 'ulimits',
+        'use_api_socket', 'user', 'userns_mode', 'uts', 'volumes', 'volumes_from', 'working_dir',
+    }
+    ServiceNamePattern = re.compile(r'^[a-zA-Z0-9._-]+$')
+    RestartPattern = re.compile(r'^(no|always|unless-stopped|on-failure(:\d+)?)$')
+    VarNamePattern = re.compile(r'[_a-zA-Z][_a-zA-Z0-9]*')
+    # The braced variable modifiers: a default if unset (or empty), an error if unset (or empty),
+    # a replacement if set (and not empty)
+    VarModifiers = (':-', '-', ':?', '?', ':+', '+')
+
+    YamlLoader = ComposeYamlLoader
+
+    def __init__(self, env: dict = None):
+        self._env = os.environ if env is None else env
+
+    def validate(self, compose_file, desc=None) -> dict:
+        # Returns the interpolated compose config, `desc` is the compose file content if it's been already parsed
+        if desc is None:
+            with open(compose_file, 'rb') as f:
+                try:
+                    desc = yaml.load(f, Loader=self.YamlLoader)
+                except yaml.YAMLError as exc:
+                    raise Exception('Invalid compose file {}: {}'.format(compose_file, exc))
+        if not isinstance(desc, dict):
+            raise Exception('Invalid compose file {}: Top-level object must be a mapping'.format(compose_file))
+        env = dict(self._load_env_file(os.path.join(os.path.dirname(compose_file), self.EnvFile)))
+        env.update(self._env)
+        try:
+            config = self._interpolate(desc, env, '')
+            self._check(config)
+        except Exception as exc:
+            raise Exception('Invalid compose file {}: {}'.format(compose_file, exc))
+        return config
+
+    @staticmethod
+    def _load_env_file(env_file):
+        if not os.path.exists(env_file):
+            return
+        with open(env_file) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#') or '=' not in line:
+                    continue
+                name, value = line.split('=', 1)
+                name = name.strip()
+                if name.startswith('export '):
+                    name = name[len('export '):].strip()
+                value = value.strip()
+                if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+                    value = value[1:-1]
+                yield name, value
+
+    def _interpolate(self, node, env, path):
+        if isinstance(node, dict):
+            return {key: self._interpolate(value, env, '{}.{}'.format(path, key) if path else str(key))
+                    for key, value in node.items()}
+        if isinstance(node, list):
+            return [self._interpolate(value, env, '{}[{}]'.format(path, i)) for i, value in enumerate(node)]
+        if isinstance(node, str):
+            return self._substitute(node, env, path)
+        return node
+
+    def _substitute(self, value, env, path):
+        out = []
+        i = 0
+        while i < len(value):
+            c = value[i]
+            if c != '$':
+                out.append(c)
+                i += 1
+                continue
+            nxt = value[i + 1] if i + 1 < len(value) else ''
+            if nxt == '$':
+                out.append('$')
+                i += 2
+            elif nxt == '{':
+                end = self._find_closing_brace(value, i + 2)
+                if end < 0:
+                    raise Exception('Invalid interpolation format for {}: "{}"'.format(path, value))
+                out.append(self._substitute_braced(value[i + 2:end], env, path, value))
+                i = end + 1
+            else:
+                m = self.VarNamePattern.match(value, i + 1)
+                if not m:
+                    raise Exception('Invalid interpolation format for {}: "{}". You may need to escape any $ with'
+                                    ' another $'.format(path, value))
+                out.append(self._get_var(m.group(0), env, path))
+                i = m.end()
+        return ''.join(out)
+
+    @staticmethod
+    def _find_closing_brace(value, start):
+        depth = 1
+        i = start
+        while i < len(value):
+            if value.startswith('${', i):
+                depth += 1
+                i += 2
+                continue
+            if value[i] == '}':
+                depth -= 1
+                if depth == 0:
+                    return i
+            i += 1
+        return -1
+
+    def _substitute_braced(self, expr, env, path, value):
+        m = self.VarNamePattern.match(expr)
+        if not m:
+            raise Exception('Invalid interpolation format for {}: "{}"'.format(path, value))
+        name, rest = m.group(0), expr[m.end():]
+        if not rest:
+            return self._get_var(name, env, path)
+        modifier = next((mod for mod in self.VarModifiers if rest.startswith(mod)), None)
+        if not modifier:
+            raise Exception('Invalid interpolation format for {}: "{}"'.format(path, value))
+        arg = rest[len(modifier):]
+        var = env.get(name)
+        unset = var is None or (modifier.startswith(':') and var == '')
+        if modifier in (':-', '-'):
+            return self._substitute(arg, env, path) if unset else var
+        if modifier in (':?', '?'):
+            if unset:
+                raise Exception('Required variable "{}" is missing a value: {}'
+                                .format(name, self._substitute(arg, env, path)))
+            return var
+        return '' if unset else self._substitute(arg, env, path)
+
+    @staticmethod
+    def _get_var(name, env, path):
+        if name not in env:
+            logger.warning('The "{}" variable is not set. Defaulting to a blank string; element: {}'
+                           .format(name, path))
+        return env.get(name, '')
+
+    def _check(self, config):
+        for key in config:
+            if key not in self.TopLevelKeys and not str(key).startswith('x-'):
+                raise Exception('Additional property {} is not allowed'.format(key))
+        for key in ('networks', 'volumes', 'secrets', 'configs'):
+            if config.get(key) is not None and not isinstance(config[key], dict):
+                raise Exception('{} must be a mapping'.format(key))
+        services = config.get('services')
+        if not isinstance(services, dict) or not services:
+            raise Exception('services must be a non-empty mapping')
+        volumes = set(config.get('volumes') or {})
+        networks = set(config.get('networks') or {}) | {'default'}
+        for name, service in services.items():
+            self._check_service(str(name), service, services, volumes, networks)
+
+    def _check_service(self, name, service, services, volumes, networks):
+        if not self.ServiceNamePattern.match(name):
+            raise Exception('Invalid service name "{}"'.format(name))
+        if not isinstance(service, dict):
+            raise Exception('services.{} must be a mapping'.format(name))
+        for key in service:
+            if key not in self.ServiceKeys and not str(key).startswith('x-'):
+                raise Exception('services.{} Additional property {} is not allowed'.format(name, key))
+        if 'image' not in service and 'build' not in service:
+            raise Exception('Service {} has neither an image nor a build context specified'.format(name))
+        if 'image' in service and (not isinstance(service['image'], str) or not service['image']):
+            raise Exception('services.{}.image must be a non-empty string'.format(name))
+        if 'restart' in service and (not isinstance(service['restart'], str)
+                                     or not self.RestartPattern.match(service['restart'])):
+            raise Exception('services.{}.restart: invalid restart policy "{}"'.format(name, service['restart']))
+
+        environment = service.get('environment')
+        if environment is not None:
+            if isinstance(environment, dict):
+                if any(isinstance(v, (dict, list)) for v in environment.values()):
+                    raise Exception('services.{}.environment values must be scalars'.format(name))
+            elif not isinstance(environment, list) or not all(isinstance(v, str) for v in environment):
+                raise Exception('services.{}.environment must be a mapping or a list of strings'.format(name))
+
+        depends_on = service.get('depends_on') or []
+        if not isinstance(depends_on, (list, dict)):
+            raise Exception('services.{}.depends_on must be a mapping or a list'.format(name))
+        for dep in depends_on:
+            if dep not in services:
+                raise Exception('Service "{}" depends on undefined service "{}"'.format(name, dep))
+
+        service_networks = service.get('networks') or []
+        if not isinstance(service_networks, (list, dict)):
+            raise Exception('services.{}.networks must be a mapping or a list'.format(name))
+        for network in service_networks:
+            if network not in networks:
+                raise Exception('Service "{}" refers to undefined network {}'.format(name, network))
+
+        service_volumes = service.get('volumes') or []
+        if not isinstance(service_volumes, list):
+            raise Exception('services.{}.volumes must be a list'.format(name))
+        for volume in service_volumes:
+            source = self._get_named_volume(volume)
+            if source and source not in volumes:
+                raise Exception('Service "{}" refers to undefined volume {}'.format(name, source))
+
+    @staticmethod
+    def _get_named_volume(volume):
+        # Returns the volume source if it's a named volume, i.e. neither a path nor an anonymous volume
+        if isinstance(volume, dict):
+            return volume.get('source') if volume.get('type', 'volume') == 'volume' else None
+        if not isinstance(volume, str) or ':' not in volume:
+            return None
+        source = volume.split(':', 1)[0]
+        if not source or source.startswith(('.', '/', '~', '$')):
+            return None
+        return source
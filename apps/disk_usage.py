@@ -0,0 +1,90 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import logging
+import os
+import stat
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class DiskUsage:
+    # A running total of the disk space taken by the files of a directory tree, i.e. what `du -sk` reports for it,
+    # kept by the writers of the files: each written file and its parent directories are added once written.
+    # The usage is the blocks allocated to the files, a file with many hardlinks and a file that is added again
+    # are counted once.
+    SidecarFileExt = '.size.json'
+    BlockSize = 512
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        # path -> (device, inode)
+        self._paths = {}
+        # (device, inode) -> allocated bytes
+        self._inodes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def usage(self):
+        with self._lock:
+            return sum(self._inodes[key] for key in set(self._paths.values()))
+
+    @property
+    def files(self):
+        with self._lock:
+            return len(set(self._paths.values()))
+
+    def add(self, path, st: os.stat_result = None):
+        # Adds the file or refreshes its usage if it's been added before, e.g. a directory that has grown
+        path = os.path.abspath(path)
+        st = st or os.lstat(path)
+        with self._lock:
+            self._add(path, st)
+            # The parent directories up to the root are added once
+            parent = os.path.dirname(path)
+            while parent not in self._paths and (parent + os.sep).startswith(self.root + os.sep):
+                self._add(parent, os.lstat(parent))
+                parent = os.path.dirname(parent)
+
+    def add_tree(self, path):
+        # Adds the tree written by a tool that doesn't account its usage, e.g. dockerd or skopeo
+        self.add(path)
+        dirs = [path]
+        while dirs:
+            with os.scandir(dirs.pop()) as entries:
+                for entry in entries:
+                    st = entry.stat(follow_symlinks=False)
+                    if stat.S_ISDIR(st.st_mode):
+                        dirs.append(entry.path)
+                    self.add(entry.path, st)
+
+    def discard(self, path):
+        # Discards the file and the tree under it, e.g. once the tree is removed
+        path = os.path.abspath(path)
+        with self._lock:
+            for p in [p for p in self._paths if p == path or p.startswith(path + os.sep)]:
+                del self._paths[p]
+
+    def save(self, sidecar_file):
+        with open(sidecar_file, 'w') as f:
+            json.dump({'usage': self.usage, 'files': self.files}, f)
+
+    @classmethod
+    def load(cls, sidecar_file):
+        # Returns the usage saved to the sidecar file, if any
+        try:
+            with open(sidecar_file) as f:
+                return json.load(f)['usage']
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning('Failed to load disk usage, ignoring it; file: {}, err: {}'.format(sidecar_file, exc))
+            return None
+
+    def _add(self, path, st):
+        key = (st.st_dev, st.st_ino)
+        self._paths[path] = key
+        self._inodes[key] = st.st_blocks * self.BlockSize
@@ -1,48 +1,151 @@
 # Copyright (c) 2020 Foundries.io
 # SPDX-License-Identifier: BSD-3-Clause
 
+import io
 import os
 import sys
 import base64
+import shutil
 import tarfile
 import subprocess
 import json
 import hashlib
+import logging
+import time
+import tempfile
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO as BIO
 from pathlib import Path
 
-from helpers import fio_dnsbase, http_get, status
+from helpers import HostRateController, fio_dnsbase, http_get, rate_controller, status
+from apps.registry_mirrors import registry_mirrors
+
+
+logger = logging.getLogger(__name__)
 
 
 class DockerRegistryClient:
     DefaultRegistryHost = 'hub.' + fio_dnsbase()
-
-    def __init__(self, token: str, registry_host=DefaultRegistryHost, schema='https', client='docker'):
+    DefaultRegistrySchema = 'https'
+    FactoryAuthUser = 'ci-script-client'
+    BlobChunkSize = 1024 * 1024
+    TmpFileSuffix = '.partial'
+    # A blob pull interrupted by a transient error is resumed from the last received byte
+    BlobPullRetries = int(os.environ.get('APPS_BLOB_PULL_RETRIES', 5))
+    BlobPullMaxRetryDelay = 30
+    TransientErrors = (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                       requests.exceptions.Timeout, requests.exceptions.HTTPError)
+    TransientHttpCodes = (408, 429, 500, 502, 503, 504)
+    # https://distribution.github.io/distribution/spec/auth/token/#token-response-fields
+    DefaultTokenExpiresIn = 60
+    TokenExpiryMargin = 10
+    # The maximum number of blobs and manifests fetched concurrently
+    MaxWorkersEnv = 'APPS_FETCH_WORKERS'
+    DefaultMaxWorkers = 8
+
+    def __init__(self, token: str, registry_host=None, schema=None, client='docker',
+                 max_workers=None, auth=None, graph_cache=None, mirrors=None):
+        registry_host = registry_host or self.DefaultRegistryHost
+        schema = schema or self.DefaultRegistrySchema
         self._token = token
+        # Manifests are addressed by digest, so they are served from the app graph cache if present there
+        self._graph_cache = graph_cache
+        # (user, password) to get a token from a 3rd party registry, anonymous access if not specified
+        self._auth = auth
         self.registry_url = '{}://{}'.format(schema, registry_host)
         self.registry_host = registry_host
         self._client = client
-
-        self._jwt_token = None
+        self.max_workers = max_workers or int(os.environ.get(self.MaxWorkersEnv, self.DefaultMaxWorkers))
+        self._executor = None
+        # Clients of the registry's pull-through mirrors, they are tried in order before the registry itself.
+        # A mirror of the factory registry is authenticated with the factory credentials.
+        if mirrors is None:
+            mirrors = []
+            mirror_auth = (self.FactoryAuthUser, token) if self.is_factory_registry else None
+            for mirror_url in registry_mirrors.get(registry_host):
+                mirror_schema, mirror_host = mirror_url.split('://', 1)
+                mirrors.append(DockerRegistryClient(token, registry_host=mirror_host, schema=mirror_schema,
+                                                    max_workers=self.max_workers, auth=mirror_auth, mirrors=[]))
+        self._mirrors = mirrors
+
+        self._session = requests.Session()
+        # The session is shared by the apps, images and blobs fetched concurrently, they all go through
+        # the rate controller, so it caps the number of connections to a host
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_workers,
+                                                pool_maxsize=max(self.max_workers, rate_controller.max_limit))
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._challenge_lock = threading.Lock()
+        # (realm, service, scope) -> (token, expiration time)
+        self._tokens = {}
+        # (realm, service, scopes) -> the lock of the token request
+        self._token_locks = {}
+        self._auth_challenge = None
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+        self.token_requests = 0
 
     def download_compose_app(self, app_uri, dest_dir, extract=True):
-        app_layers = self.download_layers(app_uri, self.download_manifest(app_uri))
-        compose_app_archive = app_layers[0]
-        if extract:
-            tar = tarfile.open(fileobj=BIO(compose_app_archive))
-            tar.extractall(dest_dir)
-        else:
-            return compose_app_archive
+        uri = self.parse_image_uri(app_uri)
+        app_archive_digest = self.download_manifest(app_uri)['layers'][0]['digest']
+        if not extract:
+            return self.pull_layer(uri, app_archive_digest)
+
+        # The archive is extracted while it's being received, the extracted files are moved to
+        # the destination directory only if the received archive matches its digest.
+        os.makedirs(dest_dir, exist_ok=True)
+        extract_dir = tempfile.mkdtemp(dir=dest_dir, prefix='.extract-')
+        try:
+            archive_chunks = self._iter_blob(uri, app_archive_digest)
+            with tarfile.open(fileobj=io.BufferedReader(ChunkReader(archive_chunks), self.BlobChunkSize),
+                              mode='r|*') as tar:
+                tar.extractall(extract_dir)
+            # drain the rest of the archive (e.g. tar padding), the digest is verified once it's fully received
+            for _ in archive_chunks:
+                pass
+            for entry in os.listdir(extract_dir):
+                dst = os.path.join(dest_dir, entry)
+                if os.path.isdir(dst) and not os.path.islink(dst):
+                    shutil.rmtree(dst)
+                os.replace(os.path.join(extract_dir, entry), dst)
+        finally:
+            shutil.rmtree(extract_dir, ignore_errors=True)
 
     def pull_manifest(self, uri, format='application/vnd.oci.image.manifest.v1+json'):
+        if self._graph_cache:
+            manifest = self._graph_cache.get(uri.digest)
+            if manifest is not None:
+                return manifest
+
+        manifest = None
+        for mirror in self._mirrors:
+            try:
+                manifest = mirror._pull_manifest(uri, format)
+                registry_mirrors.hit(mirror.registry_url, len(manifest))
+                break
+            except Exception as exc:
+                registry_mirrors.miss(mirror.registry_url)
+                logger.warning('Failed to pull manifest from mirror; mirror: {}, manifest: {}/{}@{}, err: {}'
+                               .format(mirror.registry_url, self.registry_host, uri.name, uri.digest, exc))
+        if manifest is None:
+            manifest = self._pull_manifest(uri, format)
+            if self._mirrors:
+                registry_mirrors.hit(self.registry_url, len(manifest))
+        if self._graph_cache:
+            self._graph_cache.add(uri.digest, manifest)
+        return manifest
+
+    def _pull_manifest(self, uri, format):
         manifest_url = '{}/v2/{}/manifests/{}'.format(self.registry_url, uri.name, uri.digest)
         req_headers = {'accept': format}
-        if uri.factory:
-            registry_jwt_token = self.__get_registry_jwt_token(manifest_url)
+        registry_jwt_token = self.__get_registry_jwt_token(manifest_url)
+        if registry_jwt_token:
             req_headers['authorization'] = 'bearer {}'.format(registry_jwt_token['token'])
 
-        manifest_resp = http_get(manifest_url, headers=req_headers)
+        manifest_resp = http_get(manifest_url, headers=req_headers, session=self._session)
         rec_hash = hashlib.sha256(manifest_resp.content).hexdigest()
         if rec_hash != uri.hash:
             raise Exception("Incorrect manifest hash; expected: {}, received: {}".format(uri.hash, rec_hash))
@@ -52,22 +155,36 @@ class DockerRegistryClient:
         uri = self.parse_image_uri(image_uri)
         return json.loads(self.pull_manifest(uri))
 
-    def pull_layer(self, image_uri, layer_digest, token=None):
-        layer_url = '{}/v2/{}/blobs/{}'.format(self.registry_url, image_uri.name, layer_digest)
-
-        if not token and image_uri.factory:
-            registry_jwt_token = self.__get_registry_jwt_token(layer_url)
-            token = registry_jwt_token['token']
-
-        archive_resp = http_get(layer_url, headers={'authorization': 'bearer {}'.format(token)})
-        layer_hash = layer_digest[len('sha256:'):]
-        rec_hash = hashlib.sha256(archive_resp.content).hexdigest()
-        if rec_hash != layer_hash:
-            raise Exception("Incorrect layer blob hash; expected: {}, received: {}".format(layer_hash, rec_hash))
-
-        return archive_resp.content
-
-    def download_layers(self, image_uri, manifest=None):
+    def pull_layer(self, image_uri, layer_digest, token=None, dst=None):
+        # If `dst` is not specified then the layer blob is returned as bytes, otherwise it is streamed
+        # to `dst` that can be either a path to a destination file or a writable file-like object.
+        # In the case of a file path, the file is created only if the received blob matches
+        # the given digest, no partially written or corrupted file is left behind.
+        if dst is None:
+            blob = BIO()
+            self._pull_blob(image_uri, layer_digest, blob, token)
+            return blob.getvalue()
+
+        if not isinstance(dst, (str, os.PathLike)):
+            self._pull_blob(image_uri, layer_digest, dst, token)
+            return dst
+
+        # The same blob can be pulled concurrently to the same destination, e.g. if it's shared by apps,
+        # so each pull writes to its own temporary file
+        dst = str(dst)
+        f = tempfile.NamedTemporaryFile(dir=os.path.dirname(dst), prefix=os.path.basename(dst) + '.',
+                                        suffix=self.TmpFileSuffix, delete=False)
+        try:
+            with f:
+                self._pull_blob(image_uri, layer_digest, f, token)
+            os.replace(f.name, dst)
+        except BaseException:
+            if os.path.exists(f.name):
+                os.remove(f.name)
+            raise
+        return dst
+
+    def download_layers(self, image_uri, manifest=None, dst_dir=None):
         if not manifest:
             manifest = self.download_manifest(image_uri)
 
@@ -79,10 +196,134 @@ class DockerRegistryClient:
             registry_jwt_token = self.__get_registry_jwt_token(layer_url)
             token = registry_jwt_token['token']
 
-        layer_archives = []
-        for layer in manifest['layers']:
-            layer_archives.append(self.pull_layer(uri, layer['digest'], token))
-        return layer_archives
+        # If `dst_dir` is specified then the layers are streamed to files named by their hashes,
+        # and a list of the file paths is returned instead of the layers' content.
+        def pull(layer):
+            dst = None
+            if dst_dir:
+                dst = os.path.join(dst_dir, layer['digest'][len('sha256:'):])
+            return self.pull_layer(uri, layer['digest'], token, dst=dst)
+
+        return self.map(pull, manifest['layers'])
+
+    def map(self, func, *iterables):
+        # Run `func` over the given items in the client's worker pool, results are returned in order.
+        # The pool is dedicated to registry requests, so `func` must not submit tasks to it.
+        with self._lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='registry-client')
+        return list(self._executor.map(func, *iterables))
+
+    def _pull_blob(self, image_uri, blob_digest, writer, token=None):
+        rewind = None
+        if getattr(writer, 'seekable', lambda: False)():
+            # the writer can be rewound if a mirror fails in the middle of a blob pull
+            start = writer.tell()
+
+            def rewind():
+                writer.seek(start)
+                writer.truncate()
+        for chunk in self._iter_blob(image_uri, blob_digest, token, rewind):
+            writer.write(chunk)
+
+    def _iter_blob(self, image_uri, blob_digest, token=None, rewind=None):
+        # Yields the blob chunks as they are received and verifies the blob digest after the last one.
+        # The registry mirrors are tried first, a mirror that fails after some chunks have been yielded
+        # is fallen back from only if the consumer can `rewind` to the blob beginning.
+        for mirror in self._mirrors:
+            received = 0
+            try:
+                for chunk in mirror._iter_registry_blob(image_uri, blob_digest):
+                    received += len(chunk)
+                    yield chunk
+                registry_mirrors.hit(mirror.registry_url, received)
+                return
+            except Exception as exc:
+                registry_mirrors.miss(mirror.registry_url)
+                if received > 0 and not rewind:
+                    raise
+                logger.warning('Failed to pull blob from mirror; mirror: {}, blob: {}/{}@{}, err: {}'
+                               .format(mirror.registry_url, self.registry_host, image_uri.name, blob_digest, exc))
+                if received > 0:
+                    rewind()
+
+        received = 0
+        for chunk in self._iter_registry_blob(image_uri, blob_digest, token):
+            received += len(chunk)
+            yield chunk
+        if self._mirrors:
+            registry_mirrors.hit(self.registry_url, received)
+
+    def _iter_registry_blob(self, image_uri, blob_digest, token=None):
+        blob_url = '{}/v2/{}/blobs/{}'.format(self.registry_url, image_uri.name, blob_digest)
+        blob_hash = blob_digest[len('sha256:'):]
+        hasher = hashlib.sha256()
+        received = 0
+        retries = 0
+
+        while True:
+            if not token or retries > 0:
+                # the token might have expired while a blob was being pulled, so re-get it on retry
+                registry_jwt_token = self.__get_registry_jwt_token(blob_url)
+                token = registry_jwt_token['token'] if registry_jwt_token else None
+
+            headers = {}
+            if token:
+                headers['authorization'] = 'bearer {}'.format(token)
+            if received > 0:
+                # resume the interrupted pull from the first byte that has not been received yet
+                headers['range'] = 'bytes={}-'.format(received)
+            try:
+                # a throttled pull is retried by this loop only, the rate controller just pauses the host
+                with http_get(blob_url, headers=headers, stream=True, session=self._session,
+                              throttle_retries=0) as blob_resp:
+                    skip = self._get_resume_offset(blob_resp, received)
+                    for chunk in blob_resp.iter_content(chunk_size=self.BlobChunkSize):
+                        if skip > 0:
+                            # the registry ignored the range request, skip the bytes that have been received
+                            skipped = min(skip, len(chunk))
+                            chunk = chunk[skipped:]
+                            skip -= skipped
+                        hasher.update(chunk)
+                        received += len(chunk)
+                        yield chunk
+                break
+            except self.TransientErrors as exc:
+                if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None and \
+                        exc.response.status_code == 416 and received > 0:
+                    # the connection was interrupted right after the last blob byte had been received
+                    break
+                if isinstance(exc, requests.exceptions.HTTPError) and \
+                        (exc.response is None or exc.response.status_code not in self.TransientHttpCodes):
+                    raise
+                retries += 1
+                if retries > self.BlobPullRetries:
+                    raise
+                delay = min(2 ** (retries - 1), self.BlobPullMaxRetryDelay)
+                if isinstance(exc, requests.exceptions.HTTPError) and \
+                        exc.response.status_code in HostRateController.ThrottleCodes:
+                    # the requests to the registry are paused for the time it has asked for (`Retry-After`)
+                    delay = 0
+                logger.warning('Failed to pull blob, retrying in {}s; blob: {}, received bytes: {}, attempt: {}/{},'
+                               ' err: {}'.format(delay, blob_url, received, retries, self.BlobPullRetries, exc))
+                time.sleep(delay)
+
+        rec_hash = hasher.hexdigest()
+        if rec_hash != blob_hash:
+            raise Exception("Incorrect layer blob hash; expected: {}, received: {}".format(blob_hash, rec_hash))
+
+    @staticmethod
+    def _get_resume_offset(blob_resp, received):
+        # Returns the number of bytes at the beginning of the response body that have been already received
+        if received == 0 or blob_resp.status_code != 206:
+            return received
+        content_range = blob_resp.headers.get('content-range', '')
+        # Content-Range: bytes <start>-<end>/<size>
+        if not content_range.startswith('bytes {}-'.format(received)):
+            raise Exception('Unexpected content range of a resumed blob pull; expected start: {}, received: {}'
+                            .format(received, content_range))
+        return 0
 
     @staticmethod
     def parse_image_uri(image_uri):
@@ -116,8 +357,112 @@ class DockerRegistryClient:
 
         return URI(image_uri)
 
-    def __get_registry_jwt_token(self, uri):
-        r = requests.get(uri)
+    def prefetch_tokens(self, image_uris):
+        # Get a single token granting access to all the given factory repositories,
+        # so the follow-up requests to the repositories are served from the token cache.
+        repos = set()
+        probe_uri = None
+        for image_uri in image_uris:
+            uri = self.parse_image_uri(image_uri)
+            if uri.factory:
+                repos.add(uri.name)
+                probe_uri = probe_uri or uri
+        if not repos or self._has_tokens(repos):
+            return
+        probe_url = '{}/v2/{}/manifests/{}'.format(self.registry_url, probe_uri.name, probe_uri.digest)
+        self.__get_registry_jwt_token(probe_url, repositories=sorted(repos))
+
+    def _has_tokens(self, repositories):
+        # Whether valid tokens of all the repositories are cached, so no challenge nor token request is needed
+        with self._challenge_lock:
+            auth_params = self._auth_challenge
+        if auth_params is None:
+            return False
+        if not auth_params:
+            # the registry allows anonymous access
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens = [self._tokens.get((auth_params['realm'], auth_params.get('service'),
+                                        'repository:{}:pull'.format(repo))) for repo in repositories]
+        return all(t and t[1] > now for t in tokens)
+
+    @property
+    def is_factory_registry(self):
+        return self.registry_host == self.DefaultRegistryHost
+
+    @property
+    def token_stats(self):
+        return {'hits': self.token_cache_hits, 'misses': self.token_cache_misses,
+                'token_requests': self.token_requests}
+
+    def log_stats(self):
+        logger.info('Registry token cache; hits: {}, misses: {}, token requests: {}'
+                    .format(self.token_cache_hits, self.token_cache_misses, self.token_requests))
+
+    def __get_registry_jwt_token(self, uri, repositories=None):
+        if not repositories:
+            # <registry-url>/v2/<repo-name>/{manifests|blobs}/<digest>
+            repositories = [uri[len(self.registry_url + '/v2/'):].rsplit('/', 2)[0]]
+        scopes = ['repository:{}:pull'.format(repo) for repo in repositories]
+
+        with self._challenge_lock:
+            auth_params = self.__get_auth_challenge(uri)
+        if not auth_params:
+            # the registry allows anonymous access
+            return None
+        realm = auth_params['realm']
+        service = auth_params.get('service')
+
+        # Tokens of different scopes are requested concurrently, a token of the same scopes is requested once
+        with self._token_lock((realm, service, tuple(scopes))):
+            with self._lock:
+                now = time.monotonic()
+                tokens = [self._tokens.get((realm, service, scope)) for scope in scopes]
+                if all(t and t[1] > now for t in tokens) and len(set(t[0] for t in tokens)) == 1:
+                    self.token_cache_hits += 1
+                    return {'token': tokens[0][0]}
+                self.token_cache_misses += 1
+
+            token_params = {'scope': scopes}
+            if service:
+                token_params['service'] = service
+
+            headers = {}
+            user_pass = None
+            if self.is_factory_registry:
+                user_pass = '{}:{}'.format(self.FactoryAuthUser, self._token)
+            elif self._auth:
+                user_pass = '{}:{}'.format(*self._auth)
+            if user_pass:
+                headers['Authorization'] = 'Basic ' + base64.b64encode(user_pass.encode()).decode()
+
+            token_req = http_get(realm, headers=headers, params=token_params, session=self._session)
+            token = token_req.json()
+
+            expires_in = token.get('expires_in', self.DefaultTokenExpiresIn)
+            expires_at = now + max(expires_in - self.TokenExpiryMargin, 0)
+            with self._lock:
+                self.token_requests += 1
+                for scope in scopes:
+                    self._tokens[(realm, service, scope)] = (token['token'], expires_at)
+            return token
+
+    def _token_lock(self, key):
+        with self._lock:
+            return self._token_locks.setdefault(key, threading.Lock())
+
+    def __get_auth_challenge(self, uri):
+        if self._auth_challenge is not None:
+            return self._auth_challenge
+
+        if not self.is_factory_registry:
+            # A 3rd party registry is expected to challenge requests to its base endpoint if it requires auth
+            uri = self.registry_url + '/v2/'
+        r = rate_controller.get(uri, session=self._session)
+        if r.status_code != 401 and not self.is_factory_registry:
+            self._auth_challenge = {}
+            return self._auth_challenge
         if r.status_code != 401:
             raise Exception('No expected status code `401` is received;'
                             f' uri: {uri}, code: {r.status_code}, status: {r.text}')
@@ -139,18 +484,15 @@ class DockerRegistryClient:
             k, v = p.split('=')
             auth_params[k.strip()] = v.strip().strip('"')
 
-        auth_endpoint = auth_params.get('realm')
-        if not auth_endpoint:
+        if not auth_params.get('realm'):
             raise Exception('No `realm` is found in `www-authenticate` value;'
                             f' uri: {uri}, www-authenticate: {auth_header}')
 
-        del auth_params['realm']
-
-        user_pass = '{}:{}'.format('ci-script-client', self._token)
-        headers = {'Authorization': 'Basic ' + base64.b64encode(user_pass.encode()).decode()}
-
-        token_req = http_get(auth_endpoint, headers=headers, params=auth_params)
-        return token_req.json()
+        # A scope is specific to a given request/repository, the rest of the challenge
+        # is the same for all requests to the registry
+        auth_params.pop('scope', None)
+        self._auth_challenge = auth_params
+        return self._auth_challenge
 
     def login(self):
         login_process = subprocess.Popen(
@@ -164,6 +506,27 @@ class DockerRegistryClient:
             raise Exception(f'Failed to login at {self.registry_host}')
 
 
+class ChunkReader(io.RawIOBase):
+    # A readable stream over an iterator of data chunks
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+
 # TODO: Refactor this implementation, subclass for each Registry type, and inheritance from DockerRegistryClient
 class ThirdPartyRegistry:
     def __init__(self, registries_creds, client='docker'):
@@ -8,6 +8,8 @@ import tempfile
 import shutil
 import subprocess
 
+from apps.registry_mirrors import registry_mirrors
+
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +49,9 @@ class ContainerDaemon:
 
 
 class DockerDaemon:
+    # The max number of layers the daemon downloads concurrently, for all images being pulled
+    MaxConcurrentDownloads = 10
+
     def __init__(self, dst_dir: str, graphdriver='overlay2', output_logs=False):
         self.data_root = dst_dir
         self._graphdriver = graphdriver
@@ -67,7 +72,10 @@ class DockerDaemon:
                                           '--storage-driver', self._graphdriver,
                                           '--data-root', self.data_root,
                                           '--containerd', self._containerd.address,
-                                          '--experimental', '--max-concurrent-downloads', '10']
+                                          '--experimental',
+                                          '--max-concurrent-downloads', str(self.MaxConcurrentDownloads)]
+        # the daemon pulls images from Docker Hub via its mirrors if any, other registries can't be mirrored
+        cmd += registry_mirrors.docker_daemon_args()
 
         if self._output_logs:
             self._process = subprocess.Popen(cmd)
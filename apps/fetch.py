@@ -10,16 +10,34 @@ import traceback
 import os
 import sys
 
+from apps.blob_pool import parse_size
+from apps.fetched_apps import FetchedAppsArchive
+from apps.registry_mirrors import registry_mirrors
 from apps.target_apps_fetcher import SkopeAppFetcher
 from factory_client import FactoryClient
-from helpers import cmd
+from helpers import cmd, rate_controller
 
 
-def fetch_target_apps(targets: dict, apps_shortlist: set[str], token: str, dst_dir: str) -> dict[str, set[str]]:
-    apps_fetcher = SkopeAppFetcher(token, dst_dir)
+def fetch_target_apps(targets: dict, apps_shortlist: set[str], token: str, dst_dir: str,
+                      max_workers: int = None, blob_cache_dir: str = None,
+                      blob_cache_size: int = None, incremental: bool = False,
+                      prev_fetched_apps: str = None, plan: bool = False) -> dict[str, set[str]]:
+    apps_fetcher = SkopeAppFetcher(token, dst_dir, max_workers=max_workers,
+                                   blob_cache_dir=blob_cache_dir, blob_cache_size=blob_cache_size)
     fetched_target_apps: dict[str, set[str]] = {}
+    seeded_archives: set[str] = set()
     for target_name, target_json in targets.items():
         target = FactoryClient.Target(target_name, target_json)
+        if incremental:
+            # A new Target refers to the fetched apps archive of the Target it's based on, if any
+            archive = prev_fetched_apps or (target_json.get('custom', {}).get('fetched-apps') or {}).get('uri')
+            if archive and archive not in seeded_archives:
+                seeded_archives.add(archive)
+                try:
+                    apps_fetcher.seed(FetchedAppsArchive(archive, token))
+                except Exception as exc:
+                    logging.warning(f'Failed to seed the fetch with the previously fetched apps, fetching'
+                                    f' all apps from the registry; archive: {archive}, err: {exc}')
         target_apps = set(app for app, _ in target.apps())
         target_app_shortlist: set[str] = None
         excluded_apps: set[str] = None
@@ -36,6 +54,13 @@ def fetch_target_apps(targets: dict, apps_shortlist: set[str], token: str, dst_d
                          f'because they are not among target apps: {",".join(target_apps)}')
         logging.info(f'"{",".join(target_app_shortlist if target_app_shortlist else target_apps)}"'
                      f' will be pulled for {target_name}')
+        if plan:
+            try:
+                target_plan = apps_fetcher.plan_target(target, target_app_shortlist)
+                logging.info(f'Expected fetch of {target_name}: {target_plan.download} bytes to download,'
+                             f' {apps_fetcher.get_planned_apps_size(target_plan)} bytes of storage')
+            except Exception as exc:
+                logging.warning(f'Failed to plan the apps fetch of {target_name}: {exc}')
         apps_fetcher.fetch_target(target, target_app_shortlist, force=True)
         fetched_target_apps[target_name] = target_app_shortlist
 
@@ -66,6 +91,23 @@ def get_args():
     parser.add_argument('-dd', '--disable',
                         help='TUF targets to be updated with URI to fetched app archive',
                         default=False, action='store_true')
+    parser.add_argument('-w', '--fetch-workers', type=int,
+                        help='Maximum number of app blobs and manifests to fetch concurrently,'
+                             ' overrides the `APPS_FETCH_WORKERS` environment variable', default=None)
+    parser.add_argument('-c', '--blob-cache-dir',
+                        help='A directory of a persistent blob cache shared by builds, if not specified then'
+                             ' blobs are shared only by Targets fetched to the fetch dir', default=None)
+    parser.add_argument('-z', '--blob-cache-size', type=parse_size,
+                        help='The max size of the blob cache, e.g. 20G, the least recently used blobs'
+                             ' are evicted to keep the cache under it', default=None)
+    parser.add_argument('-i', '--incremental', default=False, action='store_true',
+                        help='Reuse the blobs of the fetched apps archive the Targets refer to'
+                             ' (`custom.fetched-apps.uri`), only the changed blobs are pulled from Registries')
+    parser.add_argument('-p', '--prev-fetched-apps', default=None,
+                        help='A path or URI of the fetched apps archive to reuse in the incremental mode,'
+                             ' overrides the archive the Targets refer to')
+    parser.add_argument('--plan', default=False, action='store_true',
+                        help='Log the expected download and storage of each Target\'s apps before fetching them')
 
     args = parser.parse_args()
     return args
@@ -89,7 +131,10 @@ def main(args: argparse.Namespace):
             shortlist = set([x.strip() for x in args.apps_shortlist.split(',') if x]) \
                 if args.apps_shortlist else None
 
-            fetched_target_apps = fetch_target_apps(targets, shortlist, token, args.fetch_dir)
+            fetched_target_apps = fetch_target_apps(targets, shortlist, token, args.fetch_dir,
+                                                    args.fetch_workers, args.blob_cache_dir,
+                                                    args.blob_cache_size, args.incremental,
+                                                    args.prev_fetched_apps, args.plan)
             for target, target_json in targets.items():
                 out_file = os.path.join(args.dst_dir, f"{target}.apps.tar")
                 logging.info(f"Tarring fetched apps of {target} to {out_file}...")
@@ -116,6 +161,8 @@ def main(args: argparse.Namespace):
     except Exception as exc:
         logging.error('Failed to pull Target apps and images: {}\n{}'.format(exc, traceback.format_exc()))
         exit_code = os.EX_SOFTWARE
+    rate_controller.report()
+    registry_mirrors.report()
     return exit_code
 
 
@@ -0,0 +1,101 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tarfile
+from contextlib import contextmanager
+
+from helpers import http_get
+
+
+logger = logging.getLogger(__name__)
+
+
+class FetchedAppsArchive:
+    # An archive of a Target's fetched apps, i.e. a tarball of the Target's fetch dir referred by
+    # the Target's `custom.fetched-apps.uri`. The archive blobs are content-addressed, so the blobs of
+    # a previous Target's archive can be reused by the fetch of a new Target, and only the blobs
+    # that have changed since the previous Target are pulled from the registry.
+    # The archive is read as a stream, either from a local file or from its URI.
+    BlobsDir = 'blobs/sha256'
+    BlobHashPattern = re.compile(r'^[0-9a-f]{64}$')
+    # The app dirs' manifests and archives are hardlinks to the blobs, a tarball stores the file content once,
+    # for the file that comes first, and the others as links to it
+    AppBlobPattern = re.compile(r'^apps/[^/]+/(?:(?P<app_hash>[0-9a-f]{64})/manifest\.json|[0-9a-f]{64}/'
+                                r'(?P<archive_hash>[0-9a-f]{64})\.tgz)$')
+    # Manifests and indexes are small JSON blobs, they are also added to the app graph cache,
+    # so they are not pulled from the registry either
+    MaxManifestSize = 4 * 1024 * 1024
+    ReadBufferSize = 1024 * 1024
+
+    def __init__(self, src: str, token: str = None):
+        self.src = src
+        self._token = token
+        self.blobs = 0
+        self.imported = 0
+        self.manifests = 0
+
+    def seed(self, blob_pool, graph_cache=None):
+        seen = set()
+        with self._open() as f, tarfile.open(fileobj=f, mode='r|*') as ts:
+            for m in ts:
+                blob_hash = self._get_blob_hash(m.name)
+                if not m.isfile() or not blob_hash or blob_hash in seen:
+                    continue
+                seen.add(blob_hash)
+                digest = 'sha256:' + blob_hash
+                self.blobs += 1
+                blob = ts.extractfile(m)
+                # A blob that doesn't match its digest is skipped, it's pulled from the registry then
+                try:
+                    if m.size <= self.MaxManifestSize:
+                        data = blob.read()
+                        if hashlib.sha256(data).hexdigest() != blob_hash:
+                            raise Exception('Incorrect blob hash')
+                        if graph_cache and self.is_manifest(data):
+                            graph_cache.add(digest, data)
+                            self.manifests += 1
+                        blob = io.BytesIO(data)
+                    if blob_pool.add(digest, blob, mtime=m.mtime):
+                        self.imported += 1
+                except Exception as exc:
+                    logger.warning('Failed to seed blob from the fetched apps archive, skipping it;'
+                                   ' blob: {}, err: {}'.format(digest, exc))
+        logger.info('Blobs are seeded from the fetched apps archive; archive: {}, blobs: {}, imported: {},'
+                    ' manifests: {}'.format(self.src, self.blobs, self.imported, self.manifests))
+
+    @classmethod
+    def _get_blob_hash(cls, name):
+        path = os.path.normpath(name)
+        blob_dir, blob_hash = os.path.split(path)
+        if blob_dir == cls.BlobsDir and cls.BlobHashPattern.match(blob_hash):
+            return blob_hash
+        m = cls.AppBlobPattern.match(path)
+        return (m.group('app_hash') or m.group('archive_hash')) if m else None
+
+    @contextmanager
+    def _open(self):
+        if '://' not in self.src:
+            with open(self.src, 'rb') as f:
+                yield f
+            return
+        resp = http_get(self.src, headers={'OSF-TOKEN': self._token}, stream=True)
+        try:
+            with io.BufferedReader(resp.raw, buffer_size=self.ReadBufferSize) as f:
+                yield f
+        finally:
+            resp.close()
+
+    @staticmethod
+    def is_manifest(data: bytes):
+        if not data.startswith(b'{'):
+            return False
+        try:
+            return 'schemaVersion' in json.loads(data)
+        except ValueError:
+            return False
@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+
+from apps.fetched_apps import FetchedAppsArchive
+
+
+logger = logging.getLogger(__name__)
+
+
+class FetchedAppsVerifier:
+    # Verifies a Target's fetched apps tree (`<fetch-dir>/<target>` or an extracted fetched apps archive):
+    # walks the merkle graph from the app manifests down to the layers indexes, the image manifests, configs
+    # and layers, and checks that each graph node is present in the blobs dir and matches its digest.
+    # Nodes are hashed in a thread pool, hashlib releases the GIL while hashing, large blobs are mmap'ed.
+    AppsDir = 'apps'
+    BlobsDir = 'blobs/sha256'
+    ImagesDir = 'images'
+    ManifestFile = 'manifest.json'
+    OciIndexFile = 'index.json'
+    ArchiveFileExt = '.tgz'
+
+    class Result:
+        def __init__(self):
+            self.verified = set()
+            # digest -> the size the node is expected to be of, None if it's unknown
+            self.missing = {}
+            self.corrupted = {}
+            # digest -> paths of the corrupted copies of the node, e.g. the blob and the app dir's copy
+            self.corrupted_paths = {}
+            # digest -> data of the verified manifests and indexes
+            self.manifests = {}
+            self.verified_size = 0
+
+        @property
+        def ok(self):
+            return not self.missing and not self.corrupted
+
+        @property
+        def missing_size(self):
+            return sum(size or 0 for size in self.missing.values())
+
+        @property
+        def corrupted_size(self):
+            return sum(size or 0 for size in self.corrupted.values())
+
+        def to_json(self):
+            return {
+                'verified': len(self.verified),
+                'verified_size': self.verified_size,
+                'missing': self.missing,
+                'missing_size': self.missing_size,
+                'corrupted': self.corrupted,
+                'corrupted_size': self.corrupted_size,
+            }
+
+    def __init__(self, target_dir, arch=None, max_workers=None):
+        # The layers indexes of the other architectures are not fetched, so they are verified only if `arch`
+        # is specified
+        self.target_dir = target_dir
+        self.arch = arch
+        self._blobs_dir = os.path.join(target_dir, self.BlobsDir)
+        self._max_workers = max_workers or os.cpu_count()
+
+    def blob_path(self, digest):
+        return os.path.join(self._blobs_dir, digest[len('sha256:'):])
+
+    def verify(self) -> Result:
+        result = self.Result()
+        apps_dir = os.path.join(self.target_dir, self.AppsDir)
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='fsck') as executor:
+            # future -> (digest, expected size, path, the node's children getter)
+            pending = {}
+            submitted = set()
+
+            def submit(digest, size=None, path=None, get_children=None):
+                if (digest, path) in submitted:
+                    return
+                submitted.add((digest, path))
+                path = path or self.blob_path(digest)
+                future = executor.submit(self._verify_node, digest, path)
+                pending[future] = (digest, size, path, get_children)
+
+            for app_name in sorted(os.listdir(apps_dir)) if os.path.isdir(apps_dir) else []:
+                for app_hash in sorted(os.listdir(os.path.join(apps_dir, app_name))):
+                    app_dir = os.path.join(apps_dir, app_name, app_hash)
+                    digest = 'sha256:' + app_hash
+                    submit(digest, get_children=partial(self._get_app_children, app_dir))
+                    # the app dir's copy of the app manifest
+                    submit(digest, path=os.path.join(app_dir, self.ManifestFile))
+                    for image_dir in self._find_image_dirs(os.path.join(app_dir, self.ImagesDir)):
+                        image_digest = 'sha256:' + os.path.basename(image_dir)
+                        submit(image_digest)
+                        try:
+                            with open(os.path.join(image_dir, self.OciIndexFile)) as f:
+                                desc = json.load(f)['manifests'][0]
+                        except (OSError, ValueError, KeyError, IndexError) as exc:
+                            logger.warning('Invalid image OCI layout; dir: {}, err: {}'.format(image_dir, exc))
+                            result.missing[image_digest] = None
+                            continue
+                        submit(desc['digest'], desc.get('size'), get_children=self._get_image_children)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    digest, size, path, get_children = pending.pop(future)
+                    status, data, node_size = future.result()
+                    if status == 'missing':
+                        result.missing[digest] = size
+                    elif status == 'corrupted':
+                        result.corrupted[digest] = size or node_size
+                        result.corrupted_paths.setdefault(digest, []).append(path)
+                    else:
+                        if digest not in result.verified:
+                            result.verified.add(digest)
+                            result.verified_size += node_size
+                        if data is not None:
+                            result.manifests[digest] = data
+                        if get_children and data is not None:
+                            for child in get_children(digest, json.loads(data)):
+                                submit(*child)
+
+        logger.info('Fetched apps are verified; dir: {}, verified: {} ({} bytes), missing: {} ({} bytes),'
+                    ' corrupted: {} ({} bytes)'.format(self.target_dir, len(result.verified), result.verified_size,
+                                                       len(result.missing), result.missing_size,
+                                                       len(result.corrupted), result.corrupted_size))
+        return result
+
+    def _get_app_children(self, app_dir, digest, manifest):
+        # (digest, size, path, children getter)
+        layers = manifest.get('layers', [])
+        children = [(layer['digest'], layer.get('size')) for layer in layers[:2]]
+        if layers:
+            # the app dir's copy of the app archive
+            children.append((layers[0]['digest'], layers[0].get('size'),
+                             os.path.join(app_dir, layers[0]['digest'][len('sha256:'):] + self.ArchiveFileExt)))
+        if layers and 'org.foundries.app.bundle.index.digest' in layers[0].get('annotations', {}):
+            children.append((layers[0]['annotations']['org.foundries.app.bundle.index.digest'], None))
+        for lm in manifest.get('manifests', []):
+            if self.arch and lm.get('platform', {}).get('architecture') == self.arch:
+                children.append((lm['digest'], lm.get('size')))
+        return children
+
+    def _get_image_children(self, digest, manifest):
+        # only the platform manifest of an image index is fetched, the OCI layout refers to it
+        if 'manifests' in manifest:
+            return []
+        return [(manifest['config']['digest'], manifest['config'].get('size'))] + \
+            [(layer['digest'], layer.get('size')) for layer in manifest.get('layers', [])]
+
+    @staticmethod
+    def _find_image_dirs(images_dir):
+        # <images dir>/<host>/<name>/<hash> dirs containing an OCI layout
+        image_dirs = []
+        for dir_path, dir_names, file_names in os.walk(images_dir):
+            if FetchedAppsVerifier.OciIndexFile in file_names:
+                image_dirs.append(dir_path)
+                dir_names.clear()
+        return sorted(image_dirs)
+
+    def _verify_node(self, digest, path):
+        # Returns the node status, its data if it's a manifest, and its size
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                data = None
+                # Manifests are read to get their children, larger blobs are hashed in place
+                if size <= FetchedAppsArchive.MaxManifestSize:
+                    data = f.read()
+                    h = hashlib.sha256(data)
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                        h = hashlib.sha256(m)
+        except FileNotFoundError:
+            return 'missing', None, 0
+        if 'sha256:' + h.hexdigest() != digest:
+            logger.warning('Blob is corrupted; digest: {}, path: {}'.format(digest, path))
+            return 'corrupted', None, size
+        if data is not None and not FetchedAppsArchive.is_manifest(data):
+            data = None
+        return 'ok', data, size
+
+
+def get_args():
+    parser = argparse.ArgumentParser('Verify that fetched Target apps are complete and not corrupted')
+    parser.add_argument('-d', '--target-dir', required=True,
+                        help='A fetched Target dir (<fetch-dir>/<target>) or an extracted fetched apps archive')
+    parser.add_argument('-a', '--arch', default=None,
+                        help='The Target architecture, e.g. arm64, the apps layers indexes are verified if set')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='The number of blobs to hash concurrently, defaults to the number of CPUs')
+    parser.add_argument('-o', '--out-file', default=None,
+                        help='A json file to output the missing and corrupted digests to')
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    result = FetchedAppsVerifier(args.target_dir, args.arch, args.workers).verify()
+    if args.out_file:
+        with open(args.out_file, 'w') as f:
+            json.dump(result.to_json(), f, indent=2)
+    for digest, size in result.missing.items():
+        logging.error('Missing: {}, size: {}'.format(digest, size))
+    for digest, size in result.corrupted.items():
+        logging.error('Corrupted: {}, size: {}'.format(digest, size))
+    return os.EX_OK if result.ok else os.EX_DATAERR
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(levelname)s: Apps fsck: %(module)s: %(message)s', level=logging.INFO)
+    sys.exit(main(get_args()))
@@ -5,6 +5,8 @@ import os
 import logging
 import subprocess
 
+from apps.registry_mirrors import registry_mirrors
+
 
 logger = logging.getLogger(__name__)
 
@@ -15,9 +17,17 @@ class ImageDownloader:
         self._env.update(env)
 
     def pull(self, url, platform):
-        cmd = self._get_cmd(url, platform)
+        self._run(self._get_cmd(url, platform))
+
+    def _run(self, cmd):
         logger.info('Fetching image: {}'.format(cmd))
-        subprocess.run(cmd.split(), check=True, stdout=None, stderr=None, env=self._env)
+        # The output is logged, so the output of images pulled concurrently is not interleaved
+        try:
+            output = subprocess.check_output(cmd.split(), stderr=subprocess.STDOUT, env=self._env)
+            logger.info(output.decode(errors='replace').rstrip())
+        except subprocess.CalledProcessError as exc:
+            logger.error(exc.output.decode(errors='replace').rstrip())
+            raise
 
     def _get_cmd(self, platform: str, url: str):
         pass
@@ -40,7 +50,11 @@ class SkopeoDownloader(ImageDownloader):
 
         super().__init__({'DOCKER_HOST': self._dst_daemon_host})
 
-    def _get_cmd(self, url: str, platform=None):
+    def pull(self, url, platform):
+        with registry_mirrors.skopeo_args() as mirrors_args:
+            self._run(self._get_cmd(url, platform, mirrors_args))
+
+    def _get_cmd(self, url: str, platform=None, mirrors_args=()):
         if -1 == url.find('@'):
             url_parts = url.split(':')
             sha = url_parts[1]
@@ -48,8 +62,9 @@ class SkopeoDownloader(ImageDownloader):
             url_parts = url.split('@')
             sha = url_parts[1].split(':')[1][:9]
 
-        return 'skopeo --override-arch {} --override-os linux' \
+        skopeo = ' '.join(['skopeo', *mirrors_args])
+        return skopeo + ' --override-arch {} --override-os linux' \
                ' copy --dest-daemon-host {} docker://{} docker-daemon:{}:{}'.format(
             platform, self._dst_daemon_host, url, url_parts[0], sha) if platform else \
-            'skopeo --override-os linux' \
+            skopeo + ' --override-os linux' \
                ' copy --dest-daemon-host {} docker://{} docker-daemon:{}:{}'.format(self._dst_daemon_host, url, url_parts[0], sha)
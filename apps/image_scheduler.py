@@ -0,0 +1,130 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import partial
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImageFetchScheduler:
+    # Fetches images concurrently on a bounded pool. An image referenced by many apps/Targets is fetched once,
+    # the number of images fetched concurrently from the same registry is capped, so a slow or throttling
+    # registry doesn't hold all the workers while images from other registries wait for them.
+    # Log records emitted by a job's thread are held and emitted together once the job is done,
+    # so the output of concurrently fetched images is not interleaved.
+    MaxPerRegistryEnv = 'APPS_FETCH_IMAGES_PER_REGISTRY'
+    DefaultMaxPerRegistry = 4
+
+    class Job:
+        def __init__(self, key, name, registry, fetch):
+            self.key = key
+            self.name = name
+            self.registry = registry
+            self.fetch = fetch
+            self.result = None
+            self.duration = None
+            # the number of times the job has been requested
+            self.refs = 1
+
+    def __init__(self, max_workers, max_per_registry=None):
+        self.max_workers = max_workers
+        self.max_per_registry = max_per_registry or int(os.environ.get(self.MaxPerRegistryEnv,
+                                                                       self.DefaultMaxPerRegistry))
+        self._jobs = OrderedDict()
+        # thread ident -> held log records, [(handler, record)]
+        self._log_records = {}
+        self._log_lock = threading.Lock()
+
+    def add(self, key, name, registry, fetch):
+        # Returns the job that runs `fetch()`, a job of the same key is run once
+        job = self._jobs.get(key)
+        if job:
+            job.refs += 1
+        else:
+            job = self._jobs[key] = self.Job(key, name, registry, fetch)
+        return job
+
+    def run(self):
+        # Runs all the added jobs; if a job fails then no new jobs are started and the error is raised
+        # once the running ones are done
+        queues = OrderedDict()
+        for job in self._jobs.values():
+            queues.setdefault(job.registry, deque()).append(job)
+        running = {registry: 0 for registry in queues}
+        futures = {}
+        error = None
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='image-fetcher') as executor, \
+                self._grouped_logs():
+            while True:
+                # Registries are served in turn, so images of each registry start as soon as it has capacity
+                while error is None:
+                    submitted = False
+                    for registry, queue in queues.items():
+                        # Jobs are not queued in the executor, so a job waiting for a worker doesn't take
+                        # a registry slot, and no job is started once a failure is detected
+                        if queue and running[registry] < self.max_per_registry and len(futures) < self.max_workers:
+                            job = queue.popleft()
+                            running[registry] += 1
+                            futures[executor.submit(self._run_job, job)] = job
+                            submitted = True
+                    if not submitted:
+                        break
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures.pop(future)
+                    running[job.registry] -= 1
+                    if future.exception() and error is None:
+                        error = future.exception()
+        if error:
+            raise error
+        logger.info('Images fetched; images: {}, references: {}, time: {:.1f}s'
+                    .format(len(self._jobs), sum(job.refs for job in self._jobs.values()),
+                            time.monotonic() - started))
+
+    def _run_job(self, job):
+        thread = threading.get_ident()
+        self._log_records[thread] = []
+        started = time.monotonic()
+        try:
+            job.result = job.fetch()
+            job.duration = time.monotonic() - started
+            logger.info('Image fetched; image: {}, time: {:.1f}s'.format(job.name, job.duration))
+        except Exception as exc:
+            logger.error('Failed to fetch image; image: {}, err: {}'.format(job.name, exc))
+            raise
+        finally:
+            records = self._log_records.pop(thread)
+            with self._log_lock:
+                for handler, record in records:
+                    handler.handle(record)
+
+    @contextmanager
+    def _grouped_logs(self):
+        # Records are held by the root logger handlers' filters, records emitted by the threads the job spawns
+        # (e.g. the registry client's blob fetchers) are not held
+        filters = [(handler, partial(self._hold_record, handler)) for handler in logging.root.handlers]
+        for handler, f in filters:
+            handler.addFilter(f)
+        try:
+            yield
+        finally:
+            for handler, f in filters:
+                handler.removeFilter(f)
+
+    def _hold_record(self, handler, record):
+        records = self._log_records.get(record.thread)
+        if records is None:
+            return True
+        records.append((handler, record))
+        return False
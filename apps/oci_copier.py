@@ -0,0 +1,196 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import base64
+import json
+import logging
+import os
+import threading
+
+from apps.blob_pool import BlobPool
+from apps.disk_usage import DiskUsage
+from apps.docker_registry_client import DockerRegistryClient
+
+
+logger = logging.getLogger(__name__)
+
+
+class OciImageCopier:
+    # An in-process equivalent of
+    # `skopeo copy --preserve-digests --dest-shared-blob-dir <blobs-dir> docker://<image> oci:<image-dir>`
+    # followed by storing the raw image manifest (`skopeo inspect --raw`) in the shared blob dir.
+    # Manifests and blobs are copied as is, so their digests are preserved.
+    ManifestMediaTypes = [
+        'application/vnd.docker.distribution.manifest.v2+json',
+        'application/vnd.docker.distribution.manifest.list.v2+json',
+        'application/vnd.oci.image.manifest.v1+json',
+        'application/vnd.oci.image.index.v1+json',
+    ]
+    OciLayoutFile = 'oci-layout'
+    OciLayoutVersion = '1.0.0'
+    OciIndexFile = 'index.json'
+    # The API endpoint and the repository namespace of the official images of the Docker Hub
+    DockerHubHost = 'docker.io'
+    DockerHubRegistryHost = 'registry-1.docker.io'
+    DockerHubOfficialRepo = 'library'
+    # The Docker Hub host of the legacy image references, it's normalized to the docker.io one
+    DockerHubLegacyHost = 'index.docker.io'
+
+    def __init__(self, token, max_workers=None, registry_client: DockerRegistryClient = None, graph_cache=None,
+                 blob_pool: BlobPool = None):
+        self._token = token
+        self._max_workers = max_workers
+        self._graph_cache = graph_cache
+        self._blob_pool = blob_pool or BlobPool()
+        self._clients = {}
+        if registry_client:
+            self._clients[registry_client.registry_host] = registry_client
+        self._lock = threading.Lock()
+
+    def copy(self, image: str, arch: str, blobs_dir: str, image_dir: str, disk_usage: DiskUsage = None):
+        # Returns digests of the image manifests that have been resolved to copy the image.
+        # The usage of the image files is added to `disk_usage` if specified.
+        client, uri, manifests, manifest_desc = self.resolve(image, arch)
+        blobs_dir = os.path.join(blobs_dir, 'sha256')
+        os.makedirs(blobs_dir, exist_ok=True)
+        files = []
+        # Store the raw image manifests, i.e. the image manifest or the index/manifest list and the platform manifest
+        for digest, manifest_data in manifests:
+            self._write_blob(blobs_dir, digest[len('sha256:'):], manifest_data)
+            files.append(os.path.join(blobs_dir, digest[len('sha256:'):]))
+        manifest = json.loads(manifests[-1][1])
+
+        def pull_blob(blob_desc):
+            blob_file = os.path.join(blobs_dir, blob_desc['digest'][len('sha256:'):])
+            if os.path.exists(blob_file):
+                logger.debug('Blob is already present, skipping it; image: {}, blob: {}'
+                             .format(image, blob_desc['digest']))
+                return blob_file
+            self._blob_pool.get(blob_desc['digest'], blob_file,
+                                lambda path: client.pull_layer(uri, blob_desc['digest'], dst=path))
+            return blob_file
+
+        files += client.map(pull_blob, [manifest['config']] + manifest['layers'])
+
+        files += self.write_layout(image_dir, manifest_desc)
+        if disk_usage:
+            for path in files:
+                disk_usage.add(path)
+        return [digest for digest, _ in manifests]
+
+    def write_layout(self, image_dir, manifest_desc):
+        # Writes the OCI layout referring to the platform manifest, its blobs are in the shared blob dir
+        os.makedirs(image_dir, exist_ok=True)
+        with open(os.path.join(image_dir, self.OciLayoutFile), 'w') as f:
+            json.dump({'imageLayoutVersion': self.OciLayoutVersion}, f)
+        with open(os.path.join(image_dir, self.OciIndexFile), 'w') as f:
+            json.dump({'schemaVersion': 2, 'manifests': [manifest_desc]}, f)
+        return [os.path.join(image_dir, self.OciLayoutFile), os.path.join(image_dir, self.OciIndexFile)]
+
+    def get_image_blobs(self, image: str, arch: str):
+        # Returns digests of the image manifests and blobs, i.e. all nodes of the image's merkle tree
+        _, _, manifests, _ = self.resolve(image, arch)
+        manifest = json.loads(manifests[-1][1])
+        return [digest for digest, _ in manifests] + [blob_desc['digest'] for blob_desc in
+                                                      [manifest['config']] + manifest['layers']]
+
+    def resolve(self, image, arch):
+        # Returns the image's registry client and URI, the image manifests (digest, raw manifest) starting from
+        # the given one down to the platform one, and the descriptor of the platform manifest
+        uri = DockerRegistryClient.parse_image_uri(image)
+        client = self._get_client(uri.host)
+        uri = self._normalize_uri(uri)
+
+        manifest_data = client.pull_manifest(uri, ', '.join(self.ManifestMediaTypes))
+        manifest = json.loads(manifest_data)
+        manifests = [(uri.digest, manifest_data)]
+        manifest_desc = {
+            'mediaType': manifest.get('mediaType', self._get_media_type(manifest)),
+            'digest': uri.digest,
+            'size': len(manifest_data)
+        }
+        if 'manifests' in manifest:
+            manifest_desc = self._get_platform_manifest_desc(manifest, arch, image)
+            platform_uri = DockerRegistryClient.parse_image_uri(
+                '{}/{}@{}'.format(uri.host, uri.name, manifest_desc['digest']))
+            manifests.append((platform_uri.digest, client.pull_manifest(platform_uri, manifest_desc['mediaType'])))
+        return client, uri, manifests, manifest_desc
+
+    @staticmethod
+    def _get_media_type(manifest):
+        if 'manifests' in manifest:
+            return 'application/vnd.oci.image.index.v1+json'
+        return 'application/vnd.oci.image.manifest.v1+json'
+
+    @staticmethod
+    def _get_platform_manifest_desc(index, arch, image):
+        candidates = [m for m in index['manifests']
+                      if m.get('platform', {}).get('architecture') == arch
+                      and m.get('platform', {}).get('os', 'linux') == 'linux']
+        if not candidates:
+            raise Exception('No image manifest is found for the given platform; image: {}, arch: {}'
+                            .format(image, arch))
+        if arch == 'arm':
+            # prefer armv7 just like the container tools do on a 32-bit arm device
+            candidates.sort(key=lambda m: m['platform'].get('variant') != 'v7')
+        desc = candidates[0]
+        return {'mediaType': desc['mediaType'], 'digest': desc['digest'], 'size': desc['size']}
+
+    def _write_blob(self, blobs_dir, blob_hash, data):
+        self._blob_pool.put('sha256:' + blob_hash, data, os.path.join(blobs_dir, blob_hash))
+
+    @classmethod
+    def get_docker_reference(cls, uri):
+        # The fully qualified repository name that the container tools (e.g. skopeo) normalize the image
+        # reference to, e.g. docker.io/library/nginx
+        host = cls.DockerHubHost if uri.host == cls.DockerHubLegacyHost else uri.host
+        name = uri.name
+        if host == cls.DockerHubHost and '/' not in name:
+            name = cls.DockerHubOfficialRepo + '/' + name
+        return '{}/{}'.format(host, name)
+
+    def _normalize_uri(self, uri):
+        if uri.host == self.DockerHubHost and '/' not in uri.name:
+            uri.name = self.DockerHubOfficialRepo + '/' + uri.name
+        return uri
+
+    def _get_client(self, host):
+        with self._lock:
+            if host not in self._clients:
+                if host == DockerRegistryClient.DefaultRegistryHost:
+                    client = DockerRegistryClient(self._token, max_workers=self._max_workers,
+                                                  graph_cache=self._graph_cache)
+                else:
+                    registry_host = self.DockerHubRegistryHost if host == self.DockerHubHost else host
+                    client = DockerRegistryClient(self._token, registry_host=registry_host,
+                                                  max_workers=self._max_workers, auth=get_registry_auth(host),
+                                                  graph_cache=self._graph_cache)
+                self._clients[host] = client
+            return self._clients[host]
+
+
+def get_registry_auth(host):
+    # Get the registry credentials stored by `skopeo login` or `docker login`,
+    # credential helpers are not supported
+    xdg_runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    auth_files = [
+        os.environ.get('REGISTRY_AUTH_FILE'),
+        os.path.join(xdg_runtime_dir, 'containers', 'auth.json') if xdg_runtime_dir
+        else os.path.join('/run/containers', str(os.getuid()), 'auth.json'),
+        os.path.join(os.path.expanduser('~'), '.docker', 'config.json'),
+    ]
+    auth_keys = [host, 'https://' + host]
+    if host == OciImageCopier.DockerHubHost:
+        auth_keys.append('https://index.docker.io/v1/')
+
+    for auth_file in auth_files:
+        if not auth_file or not os.path.exists(auth_file):
+            continue
+        with open(auth_file) as f:
+            auths = json.load(f).get('auths', {})
+        for key in auth_keys:
+            auth = auths.get(key, {}).get('auth')
+            if auth:
+                user, password = base64.b64decode(auth).decode().split(':', 1)
+                return user, password
+    return None
@@ -0,0 +1,523 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import base64
+import errno
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.disk_usage import DiskUsage
+from apps.oci_copier import OciImageCopier
+
+
+logger = logging.getLogger(__name__)
+
+
+class Crc64:
+    # CRC-64 with the ISO polynomial (x^64 + x^4 + x^3 + x + 1) as computed by Go's `hash/crc64`, tar-split stores
+    # it to check files' content. A chunk is reduced modulo the polynomial as a whole by means of big integer
+    # operations, it's an order of magnitude faster than the table driven byte by byte computation in pure Python.
+    Mask = (1 << 64) - 1
+    # bit reversal of each byte value, the CRC is "reflected"
+    ReflectedBytes = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+    def __init__(self):
+        # the remainder of the processed data (with the initial all ones value) multiplied by x^64
+        self._state = self.Mask
+
+    def update(self, data):
+        if data:
+            n = len(data) * 8
+            self._state = self._reduce((int.from_bytes(data.translate(self.ReflectedBytes), 'big') << 64) ^
+                                       (self._state << n))
+
+    def digest(self) -> bytes:
+        return (int('{:064b}'.format(self._state)[::-1], 2) ^ self.Mask).to_bytes(8, 'big')
+
+    @classmethod
+    def _reduce(cls, t):
+        n = t.bit_length()
+        while n > 64:
+            # t = h * x^k + l, x^k mod P is precomputed for k = 2^j
+            j = max((n - 1).bit_length() - 1, 6)
+            k = 1 << j
+            t = cls._clmul(t >> k, _XK[j]) ^ (t & ((1 << k) - 1))
+            n = t.bit_length()
+        return t
+
+    @staticmethod
+    def _clmul(h, c):
+        # carry-less multiplication of the big `h` by the 64-bit `c`, c's bits are processed by nibbles
+        m = [0, h, h << 1, 0, h << 2, 0, 0, 0, h << 3, 0, 0, 0, 0, 0, 0, 0]
+        m[3] = m[1] ^ m[2]
+        m[5], m[6], m[7] = m[1] ^ m[4], m[2] ^ m[4], m[3] ^ m[4]
+        for i in range(9, 16):
+            m[i] = m[8] ^ m[i - 8]
+        r = 0
+        shift = 0
+        while c:
+            if c & 15:
+                r ^= m[c & 15] << shift
+            c >>= 4
+            shift += 4
+        return r
+
+
+# x^(2^j) mod P
+_XK = [1 << (1 << j) for j in range(6)] + [0x1B]
+for _ in range(7, 64):
+    _XK.append(Crc64._reduce(Crc64._clmul(_XK[-1], _XK[-1])))
+
+
+class Overlay2Writer:
+    # Writes images to a docker data root the way `docker pull` does it with the `overlay2` storage driver,
+    # directly from registry blobs and without running containerd and dockerd:
+    #   image/overlay2/repositories.json
+    #   image/overlay2/imagedb/content/sha256/<image ID, i.e. config hash>
+    #   image/overlay2/layerdb/sha256/<chain ID>/{diff,size,cache-id,parent,tar-split.json.gz}
+    #   image/overlay2/distribution/{diffid-by-digest,v2metadata-by-diffid}/sha256/
+    #   overlay2/<cache ID>/{diff/,link,lower,work/}
+    #   overlay2/l/<link ID> -> ../<cache ID>/diff
+    # Layers are unpacked concurrently, a layer shared by images is unpacked once.
+    ImageDir = 'image/overlay2'
+    LayersDir = 'overlay2'
+    LinkDir = 'l'
+    RepositoriesFile = 'repositories.json'
+    TarSplitFile = 'tar-split.json.gz'
+    # the length of overlay2 link IDs, they are short to keep the mount options under the page size
+    LinkIdLength = 26
+    OpaqueWhiteout = '.wh..wh..opq'
+    WhiteoutPrefix = '.wh.'
+    OpaqueXattr = 'trusted.overlay.opaque'
+    DockerHubDomain = 'docker.io'
+    DockerHubOfficialRepo = 'library'
+    ChunkSize = 1024 * 1024
+    GzipMagic = b'\x1f\x8b'
+    ZstdMagic = b'\x28\xb5\x2f\xfd'
+
+    class Layer:
+        def __init__(self, cache_id, link_id, size, tar_split_file):
+            self.cache_id = cache_id
+            self.link_id = link_id
+            self.size = size
+            self.tar_split_file = tar_split_file
+
+    def __init__(self, data_root, image_copier: OciImageCopier, max_workers=None, disk_usage: DiskUsage = None):
+        self.data_root = data_root
+        self._image_copier = image_copier
+        # The usage of the written files is accounted as they are written if specified
+        self._disk_usage = disk_usage
+        self._max_workers = max_workers or os.cpu_count()
+        self._image_dir = os.path.join(data_root, self.ImageDir)
+        self._layerdb_dir = os.path.join(self._image_dir, 'layerdb')
+        self._layers_dir = os.path.join(data_root, self.LayersDir)
+        # chain ID -> the future of the layer unpacking
+        self._layers = {}
+        self._lock = threading.Lock()
+        self.unpacked = 0
+
+    def write(self, images, arch):
+        for d in ['imagedb/content/sha256', 'imagedb/metadata/sha256', 'layerdb/sha256', 'layerdb/tmp',
+                  'distribution/diffid-by-digest/sha256', 'distribution/v2metadata-by-diffid/sha256']:
+            os.makedirs(os.path.join(self._image_dir, d), exist_ok=True)
+            self._add_usage(os.path.join(self._image_dir, d))
+        os.makedirs(os.path.join(self._layers_dir, self.LinkDir), mode=0o710, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=os.path.join(self._layerdb_dir, 'tmp'), prefix='blobs-')
+        try:
+            with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='overlay2-writer') as executor:
+                resolved = []
+                for image in dict.fromkeys(images):
+                    resolved.append(self._resolve(executor, tmp_dir, image, arch))
+                refs = {}
+                for image, uri, config, layers in resolved:
+                    self._commit_image(uri, config, layers)
+                    familiar_name, ref = self._get_ref(image)
+                    refs.setdefault(familiar_name, {})[ref] = 'sha256:' + hashlib.sha256(config).hexdigest()
+                    logger.info('Image is written; image: {}, layers: {}'.format(image, len(layers)))
+            self._save_refs(refs)
+            # the dirs that have grown since they've been added
+            self._add_usage(os.path.join(self._layers_dir, self.LinkDir))
+            self._add_usage(self._layers_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.info('Images are written to the overlay2 store; images: {}, unpacked layers: {}'
+                    .format(len(resolved), self.unpacked))
+
+    def _resolve(self, executor, tmp_dir, image, arch):
+        client, uri, manifests, _ = self._image_copier.resolve(image, arch)
+        manifest = json.loads(manifests[-1][1])
+        config = client.pull_layer(uri, manifest['config']['digest'])
+        diff_ids = json.loads(config)['rootfs']['diff_ids']
+        if len(diff_ids) != len(manifest['layers']):
+            raise Exception('The number of layers and diff IDs does not match; image: {}'.format(image))
+        layers = []
+        chain_id = None
+        for layer_desc, diff_id in zip(manifest['layers'], diff_ids):
+            parent_chain_id = chain_id
+            chain_id = self._get_chain_id(parent_chain_id, diff_id)
+            with self._lock:
+                future = self._layers.get(chain_id)
+                if future is None:
+                    future = self._layers[chain_id] = executor.submit(
+                        self._unpack_layer, client, uri, layer_desc['digest'], diff_id, chain_id, tmp_dir)
+            layers.append((chain_id, parent_chain_id, layer_desc['digest'], diff_id, future))
+        return image, uri, config, layers
+
+    @staticmethod
+    def _get_chain_id(parent_chain_id, diff_id):
+        if not parent_chain_id:
+            return diff_id
+        return 'sha256:' + hashlib.sha256('{} {}'.format(parent_chain_id, diff_id).encode()).hexdigest()
+
+    def _commit_image(self, uri, config, layers):
+        for chain_id, parent_chain_id, digest, diff_id, future in layers:
+            self._commit_layer(chain_id, parent_chain_id, diff_id, future.result())
+            self._save_distribution(uri, digest, diff_id)
+        config_file = os.path.join(self._image_dir, 'imagedb/content/sha256', hashlib.sha256(config).hexdigest())
+        self._write_file(config_file, config, 0o600)
+
+    def _commit_layer(self, chain_id, parent_chain_id, diff_id, layer: Layer):
+        chain_dir = os.path.join(self._layerdb_dir, 'sha256', chain_id[len('sha256:'):])
+        if os.path.exists(chain_dir):
+            return
+        layer_dir = os.path.join(self._layers_dir, layer.cache_id)
+        if parent_chain_id:
+            # The layer's lower dirs are the parent layer and the parent's lower dirs
+            with open(os.path.join(self._layerdb_dir, 'sha256', parent_chain_id[len('sha256:'):], 'cache-id')) as f:
+                parent_dir = os.path.join(self._layers_dir, f.read())
+            with open(os.path.join(parent_dir, 'link')) as f:
+                lower = [os.path.join(self.LinkDir, f.read())]
+            if os.path.exists(os.path.join(parent_dir, 'lower')):
+                with open(os.path.join(parent_dir, 'lower')) as f:
+                    lower.append(f.read())
+            self._write_file(os.path.join(layer_dir, 'lower'), ':'.join(lower).encode(), 0o644)
+            os.makedirs(os.path.join(layer_dir, 'work'), mode=0o700, exist_ok=True)
+            self._add_usage(os.path.join(layer_dir, 'work'))
+
+        tmp_dir = tempfile.mkdtemp(dir=os.path.join(self._layerdb_dir, 'tmp'), prefix='write-set-')
+        files = {'diff': diff_id, 'size': str(layer.size), 'cache-id': layer.cache_id}
+        if parent_chain_id:
+            files['parent'] = parent_chain_id
+        for name, content in files.items():
+            self._write_file(os.path.join(tmp_dir, name), content.encode(), 0o644)
+        os.replace(layer.tar_split_file, os.path.join(tmp_dir, self.TarSplitFile))
+        os.chmod(tmp_dir, 0o755)
+        os.rename(tmp_dir, chain_dir)
+        self._add_usage(os.path.join(chain_dir, self.TarSplitFile))
+
+    def _unpack_layer(self, client, uri, digest, diff_id, chain_id, tmp_dir) -> Layer:
+        chain_dir = os.path.join(self._layerdb_dir, 'sha256', chain_id[len('sha256:'):])
+        if os.path.exists(chain_dir):
+            with open(os.path.join(chain_dir, 'cache-id')) as f:
+                return self.Layer(f.read(), None, None, None)
+
+        blob_file = os.path.join(tmp_dir, digest[len('sha256:'):])
+        client.pull_layer(uri, digest, dst=blob_file)
+
+        cache_id = os.urandom(32).hex()
+        link_id = base64.b32encode(os.urandom(20)).decode()[:self.LinkIdLength]
+        layer_dir = os.path.join(self._layers_dir, cache_id)
+        diff_dir = os.path.join(layer_dir, 'diff')
+        tar_split_file = os.path.join(tmp_dir, chain_id[len('sha256:'):] + '.' + self.TarSplitFile)
+        try:
+            os.makedirs(layer_dir, mode=0o710)
+            os.mkdir(diff_dir, mode=0o755)
+            self._write_file(os.path.join(layer_dir, 'link'), link_id.encode(), 0o644)
+            os.symlink(os.path.join('..', cache_id, 'diff'), os.path.join(self._layers_dir, self.LinkDir, link_id))
+            self._add_usage(os.path.join(self._layers_dir, self.LinkDir, link_id))
+            with open(blob_file, 'rb') as blob, gzip.open(tar_split_file, 'wb') as tar_split:
+                unpacked_diff_id = _LayerUnpacker(diff_dir, tar_split).unpack(self._decompress(blob))
+            if unpacked_diff_id != diff_id:
+                raise Exception('Incorrect layer diff ID; layer: {}, expected: {}, received: {}'
+                                .format(digest, diff_id, unpacked_diff_id))
+        except BaseException:
+            shutil.rmtree(layer_dir, ignore_errors=True)
+            if os.path.lexists(os.path.join(self._layers_dir, self.LinkDir, link_id)):
+                os.remove(os.path.join(self._layers_dir, self.LinkDir, link_id))
+            raise
+        finally:
+            os.remove(blob_file)
+        with self._lock:
+            self.unpacked += 1
+        return self.Layer(cache_id, link_id, self._get_diff_size(diff_dir), tar_split_file)
+
+    def _decompress(self, blob):
+        magic = blob.read(4)
+        blob.seek(0)
+        if magic.startswith(self.GzipMagic):
+            return gzip.GzipFile(fileobj=blob, mode='rb')
+        if magic == self.ZstdMagic:
+            raise Exception('zstd compressed layers are not supported')
+        return blob
+
+    def _get_diff_size(self, diff_dir):
+        # The size of a layer as dockerd calculates it: the size of all files, except directories,
+        # a file with many hardlinks is counted once. The disk usage of the layer files is accounted along the way.
+        size = 0
+        inodes = set()
+        dirs = [diff_dir]
+        self._add_usage(diff_dir)
+        while dirs:
+            with os.scandir(dirs.pop()) as entries:
+                for entry in entries:
+                    st = entry.stat(follow_symlinks=False)
+                    self._add_usage(entry.path, st)
+                    if stat.S_ISDIR(st.st_mode):
+                        dirs.append(entry.path)
+                        continue
+                    if st.st_size and st.st_ino not in inodes:
+                        inodes.add(st.st_ino)
+                        size += st.st_size
+        return size
+
+    def _save_distribution(self, uri, digest, diff_id):
+        distribution_dir = os.path.join(self._image_dir, 'distribution')
+        self._write_file(os.path.join(distribution_dir, 'diffid-by-digest', 'sha256', digest[len('sha256:'):]),
+                         diff_id.encode(), 0o644)
+        source_repo = self._normalize_name('{}/{}'.format(uri.host, uri.name))[0]
+        metadata_file = os.path.join(distribution_dir, 'v2metadata-by-diffid', 'sha256', diff_id[len('sha256:'):])
+        with self._lock:
+            metadata = []
+            if os.path.exists(metadata_file):
+                with open(metadata_file) as f:
+                    metadata = json.load(f)
+            if any(m['Digest'] == digest and m['SourceRepository'] == source_repo for m in metadata):
+                return
+            metadata.append({'Digest': digest, 'SourceRepository': source_repo, 'HMAC': ''})
+            self._write_file(metadata_file, json.dumps(metadata, separators=(',', ':')).encode(), 0o644)
+
+    def _get_ref(self, image):
+        # Returns the repository name and the image reference as dockerd stores them
+        name, digest = image.split('@', 1) if '@' in image else (image, None)
+        tag = None
+        if ':' in name.rsplit('/', 1)[-1]:
+            name, tag = name.rsplit(':', 1)
+        familiar_name = self._normalize_name(name)[1]
+        ref = '{}@{}'.format(familiar_name, digest) if digest else '{}:{}'.format(familiar_name, tag or 'latest')
+        return familiar_name, ref
+
+    def _normalize_name(self, name):
+        domain = name.split('/', 1)[0]
+        if '/' not in name or ('.' not in domain and ':' not in domain and domain != 'localhost'):
+            name = self.DockerHubDomain + '/' + name
+        familiar_name = name
+        if name.startswith(self.DockerHubDomain + '/'):
+            familiar_name = name[len(self.DockerHubDomain) + 1:]
+            if '/' not in familiar_name:
+                name = '{}/{}/{}'.format(self.DockerHubDomain, self.DockerHubOfficialRepo, familiar_name)
+            elif familiar_name.startswith(self.DockerHubOfficialRepo + '/'):
+                familiar_name = familiar_name[len(self.DockerHubOfficialRepo) + 1:]
+        return name, familiar_name
+
+    def _save_refs(self, refs):
+        repos_file = os.path.join(self._image_dir, self.RepositoriesFile)
+        repos = {'Repositories': {}}
+        if os.path.exists(repos_file):
+            with open(repos_file) as f:
+                repos = json.load(f)
+        for repo, repo_refs in refs.items():
+            repos['Repositories'].setdefault(repo, {}).update(repo_refs)
+        self._write_file(repos_file, json.dumps(repos, separators=(',', ':')).encode(), 0o600)
+
+    def _write_file(self, path, content: bytes, mode):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_file, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, path)
+        self._add_usage(path)
+
+    def _add_usage(self, path, st=None):
+        if self._disk_usage:
+            self._disk_usage.add(path, st)
+
+
+class _TarStream:
+    # A forward only reader of a layer's tar stream. It hashes the whole stream, i.e. calculates the layer's
+    # diff ID, and records the raw bytes of tar headers and paddings that tar-split stores as segments.
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._pos = 0
+        self._hash = hashlib.sha256()
+        self._raw = bytearray()
+        self.recording = True
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self._pos += len(data)
+        self._hash.update(data)
+        if self.recording:
+            self._raw += data
+        return data
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence != io.SEEK_SET or pos < self._pos:
+            raise io.UnsupportedOperation('The layer tar stream can be read forward only')
+        while self._pos < pos and self.read(min(pos - self._pos, Overlay2Writer.ChunkSize)):
+            pass
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def take(self) -> bytes:
+        raw = bytes(self._raw)
+        self._raw.clear()
+        return raw
+
+    @property
+    def digest(self):
+        return 'sha256:' + self._hash.hexdigest()
+
+
+class _LayerUnpacker:
+    # Unpacks a layer's tar stream to the layer's diff dir the way the overlay2 driver does it, i.e. whiteouts
+    # are converted to the overlay format, and writes the tar-split metadata that allows dockerd to reassemble
+    # the layer's tar stream from the diff dir, e.g. on `docker save` or `docker push`.
+    # https://github.com/vbatts/tar-split/blob/main/tar/storage/entry.go
+    FileEntry = 1
+    SegmentEntry = 2
+
+    def __init__(self, diff_dir, tar_split):
+        self._diff_dir = diff_dir
+        self._diff_dir_path = os.path.realpath(diff_dir)
+        self._tar_split = tar_split
+        self._position = 0
+        self._dir_times = []
+        self._owner = os.geteuid() == 0
+
+    def unpack(self, fileobj) -> str:
+        # Returns the layer's diff ID
+        stream = _TarStream(fileobj)
+        with tarfile.open(fileobj=stream, mode='r:') as tf:
+            for m in tf:
+                self._add_segment(stream.take())
+                stream.recording = False
+                crc = self._extract(tf, m)
+                stream.recording = True
+                self._add_file(m, crc)
+            # the end of archive blocks and whatever follows them
+            self._add_segment(stream.take())
+            while stream.read(Overlay2Writer.ChunkSize):
+                pass
+            self._add_segment(stream.take(), force=True)
+        for path, mtime in reversed(self._dir_times):
+            os.utime(path, (mtime, mtime))
+        return stream.digest
+
+    def _add_segment(self, payload, force=False):
+        if payload or force:
+            self._add_entry({'type': self.SegmentEntry, 'payload': base64.b64encode(payload).decode()})
+
+    def _add_file(self, m: tarfile.TarInfo, crc):
+        entry = {'type': self.FileEntry}
+        name = m.name + '/' if m.isdir() else m.name
+        try:
+            name.encode('utf-8')
+            entry['name'] = name
+        except UnicodeEncodeError:
+            entry['name_raw'] = base64.b64encode(name.encode('utf-8', 'surrogateescape')).decode()
+        if m.size:
+            entry['size'] = m.size
+        entry['payload'] = base64.b64encode(crc).decode() if crc else None
+        self._add_entry(entry)
+
+    def _add_entry(self, entry):
+        entry['position'] = self._position
+        self._position += 1
+        self._tar_split.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+                              .encode('utf-8', 'surrogateescape') + b'\n')
+
+    def _extract(self, tf, m: tarfile.TarInfo):
+        # Returns CRC of the file content if it has any
+        path = self._get_path(m.name)
+        parent, name = os.path.split(path)
+        if m.type not in (tarfile.DIRTYPE, tarfile.REGTYPE, tarfile.AREGTYPE, tarfile.CONTTYPE, tarfile.SYMTYPE,
+                          tarfile.LNKTYPE, tarfile.CHRTYPE, tarfile.BLKTYPE, tarfile.FIFOTYPE) or \
+                (m.size and not m.isreg()):
+            raise Exception('Unsupported tar entry; entry: {}, type: {}, size: {}'.format(m.name, m.type, m.size))
+
+        if name == Overlay2Writer.OpaqueWhiteout:
+            os.setxattr(parent, Overlay2Writer.OpaqueXattr, b'y')
+            return None
+        if name.startswith(Overlay2Writer.WhiteoutPrefix):
+            path = os.path.join(parent, name[len(Overlay2Writer.WhiteoutPrefix):])
+            self._remove(path)
+            os.mknod(path, stat.S_IFCHR, os.makedev(0, 0))
+            self._chown(path, m)
+            return None
+
+        if not m.isdir() or not os.path.isdir(path) or os.path.islink(path):
+            self._remove(path)
+        crc = None
+        if m.isdir():
+            os.makedirs(path, exist_ok=True)
+            self._dir_times.append((path, m.mtime))
+        elif m.isreg():
+            crc = Crc64()
+            src = tf.extractfile(m)
+            with open(path, 'wb') as f:
+                for chunk in iter(lambda: src.read(Overlay2Writer.ChunkSize), b''):
+                    crc.update(chunk)
+                    f.write(chunk)
+            crc = crc.digest() if m.size else None
+        elif m.issym():
+            os.symlink(m.linkname, path)
+        elif m.islnk():
+            os.link(self._get_path(m.linkname), path, follow_symlinks=False)
+            return None
+        elif m.ischr() or m.isblk():
+            os.mknod(path, (stat.S_IFCHR if m.ischr() else stat.S_IFBLK) | m.mode,
+                     os.makedev(m.devmajor, m.devminor))
+        elif m.isfifo():
+            os.mkfifo(path, m.mode)
+
+        self._chown(path, m)
+        if not m.issym():
+            os.chmod(path, m.mode)
+        for key, value in m.pax_headers.items():
+            if key.startswith('SCHILY.xattr.'):
+                try:
+                    os.setxattr(path, key[len('SCHILY.xattr.'):], value.encode('utf-8', 'surrogateescape'),
+                                follow_symlinks=False)
+                except OSError as exc:
+                    if exc.errno not in (errno.ENOTSUP, errno.EPERM):
+                        raise
+                    logger.warning('Failed to set file xattr, ignoring it; file: {}, xattr: {}, err: {}'
+                                   .format(m.name, key, exc))
+        if not m.isdir():
+            os.utime(path, (m.mtime, m.mtime), follow_symlinks=False)
+        return crc
+
+    def _get_path(self, name):
+        name = os.path.normpath('/' + name).lstrip('/')
+        path = os.path.join(self._diff_dir, name) if name else self._diff_dir
+        parent = os.path.dirname(path) if name else path
+        os.makedirs(parent, exist_ok=True)
+        # an entry must not be written outside the diff dir via a symlink the layer has created
+        real_parent = os.path.realpath(parent)
+        if real_parent != self._diff_dir_path and not real_parent.startswith(self._diff_dir_path + os.sep):
+            raise Exception('Layer entry is out of the layer dir; entry: {}'.format(name))
+        return path
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+    def _chown(self, path, m: tarfile.TarInfo):
+        if self._owner:
+            os.chown(path, m.uid, m.gid, follow_symlinks=False)
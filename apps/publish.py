@@ -36,7 +36,8 @@ def main(factory: str, sha: str, targets_json: str, machines: [], platforms: [],
     status('Searching for Compose Apps in {}'.format(app_root_dir))
     apps = ComposeApps(app_root_dir)
     status('Found Compose Apps: {}'.format(apps.str))
-
+    # All apps are validated before any of them is tagged and published
+    apps.load()
     status('Compose Apps has been validated: {}'.format(apps.str))
 
     status('Downloading Apps\' layers metadata...')
@@ -36,6 +36,10 @@ TUF_TARGETS_EXPIRE=${TUF_TARGETS_EXPIRE-1Y}
 FETCH_APPS=${FETCH_APPS-""}
 FETCH_APPS_DIR="${FETCH_APPS_DIR-$(mktemp -u -d -p /var/cache/apps)}"
 FETCH_APPS_SHORTLIST="${FETCH_APPS_SHORTLIST-""}"
+# Reuse the blobs of the apps fetched for the previous Target, only the changed blobs are pulled
+FETCH_APPS_INCREMENTAL="${FETCH_APPS_INCREMENTAL-""}"
+# Log the expected download and storage of the apps before fetching them
+FETCH_APPS_PLAN="${FETCH_APPS_PLAN-""}"
 
 require_params FACTORY ARCHIVE TARGET_TAG TUF_TARGETS_EXPIRE
 #-- END: Input params
@@ -105,6 +109,8 @@ if [ "${FETCH_APPS}" == "1" ]; then
       --token-file="${SECRETS}/osftok" \
       --fetch-dir="${FETCH_APPS_DIR}" \
       --apps-shortlist="${FETCH_APPS_SHORTLIST}" \
+      $([ "${FETCH_APPS_INCREMENTAL}" == "1" ] && echo "--incremental") \
+      $([ "${FETCH_APPS_PLAN}" == "1" ] && echo "--plan") \
       --dst-dir="${ARCHIVE}" \
       --tuf-targets="${TUF_REPO}/roles/unsigned/targets.json"
 elif [ "${FETCH_APPS}" == "0" ]; then
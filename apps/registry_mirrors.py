@@ -0,0 +1,132 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from helpers import status
+
+
+logger = logging.getLogger(__name__)
+
+
+class RegistryMirrors:
+    # Pull-through mirrors of upstream registries, they are tried in the specified order before the origin.
+    # The mirrors are configured via the `REGISTRY_MIRRORS` environment variable:
+    #   <registry>=<mirror>[,<mirror>...][;<registry>=<mirror>...]
+    # e.g. `hub.foundries.io=http://10.0.0.5:5000,mirror.local;docker.io=https://mirror.gcr.io`.
+    # A mirror is accessed over HTTPS unless the `http://` schema is specified.
+    # The content pulled from a mirror is verified against the pinned digest, so a mirror cannot alter it.
+    MirrorsEnv = 'REGISTRY_MIRRORS'
+    DockerHubHost = 'docker.io'
+    DockerHubAliases = ['registry-1.docker.io', 'index.docker.io']
+
+    class Endpoint:
+        def __init__(self, url):
+            self.url = url
+            self.hits = 0
+            self.misses = 0
+            self.bytes = 0
+
+        @property
+        def schema(self):
+            return self.url.split('://', 1)[0]
+
+        @property
+        def host(self):
+            return self.url.split('://', 1)[1]
+
+    def __init__(self, config=None):
+        if config is None:
+            config = os.environ.get(self.MirrorsEnv, '')
+        # registry host -> mirror URLs
+        self._mirrors = {}
+        for entry in config.replace('\n', ';').split(';'):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if '=' not in entry:
+                raise Exception('Invalid registry mirrors entry, `<registry>=<mirror>[,<mirror>...]` is expected;'
+                                ' entry: {}'.format(entry))
+            registry, mirrors = entry.split('=', 1)
+            urls = []
+            for mirror in mirrors.split(','):
+                mirror = mirror.strip().rstrip('/')
+                if mirror:
+                    urls.append(mirror if '://' in mirror else 'https://' + mirror)
+            self._mirrors[self._normalize(registry.strip())] = urls
+        # endpoint URL -> endpoint stats
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def get(self, registry_host):
+        # Returns URLs of the registry mirrors in the order they should be tried
+        return list(self._mirrors.get(self._normalize(registry_host), []))
+
+    def __bool__(self):
+        return any(self._mirrors.values())
+
+    def hit(self, url, size=0):
+        with self._lock:
+            endpoint = self._endpoints.setdefault(url, self.Endpoint(url))
+            endpoint.hits += 1
+            endpoint.bytes += size
+
+    def miss(self, url):
+        with self._lock:
+            self._endpoints.setdefault(url, self.Endpoint(url)).misses += 1
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {url: {'hits': e.hits, 'misses': e.misses, 'bytes': e.bytes} for url, e in self._endpoints.items()}
+
+    def report(self):
+        if not self:
+            return
+        with self._lock:
+            for url, e in self._endpoints.items():
+                status('Registry endpoint {}: served {} requests, {} bytes; misses: {}'
+                       .format(url, e.hits, e.bytes, e.misses))
+
+    def registries_conf(self):
+        # Returns the containers-registries.conf(5) content that configures the mirrors for skopeo
+        lines = ['unqualified-search-registries = []', '']
+        for registry, urls in self._mirrors.items():
+            if not urls:
+                continue
+            lines += ['[[registry]]', 'location = "{}"'.format(registry), '']
+            for url in urls:
+                endpoint = self.Endpoint(url)
+                lines += ['[[registry.mirror]]', 'location = "{}"'.format(endpoint.host)]
+                if endpoint.schema == 'http':
+                    lines.append('insecure = true')
+                lines.append('')
+        return '\n'.join(lines)
+
+    @contextmanager
+    def skopeo_args(self):
+        # Yields the skopeo args that configure the mirrors, the registries.conf file is removed once skopeo is done
+        if not self:
+            yield []
+            return
+        with tempfile.NamedTemporaryFile('w', prefix='registries-', suffix='.conf') as f:
+            f.write(self.registries_conf())
+            f.flush()
+            yield ['--registries-conf', f.name]
+
+    def docker_daemon_args(self):
+        # dockerd supports mirrors of Docker Hub only
+        args = []
+        for url in self.get(self.DockerHubHost):
+            args += ['--registry-mirror', url]
+        return args
+
+    def _normalize(self, registry_host):
+        return self.DockerHubHost if registry_host in self.DockerHubAliases else registry_host
+
+
+registry_mirrors = RegistryMirrors()
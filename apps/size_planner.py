@@ -0,0 +1,155 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.app_graph_cache import AppGraphCache
+from apps.docker_registry_client import DockerRegistryClient
+
+
+logger = logging.getLogger(__name__)
+
+
+class AppsSizePlan:
+    def __init__(self, fs_block_size):
+        self.fs_block_size = fs_block_size
+        self.apps = 0
+        # digest -> size of the blobs to pull from registries: app manifests, archives, layers metadata and indexes,
+        # and the layers of the apps' images. Image manifests and configs are not listed in the layers index,
+        # so they are not accounted, they are a few KiB per image.
+        self.blobs = {}
+        # The disk usage of the app dirs, i.e. of the app archives and their metadata
+        self.apps_usage = 0
+        # The disk usage of the layers extracted to the docker store as measured by the app publisher
+        self.layers_usage = 0
+        # Layers whose usage is not found in the layers metadata, their extracted usage is unknown
+        self.unknown_layers = []
+        # Apps without a layers index for the platform, the size of their images is unknown
+        self.unknown_apps = []
+
+    @property
+    def download(self):
+        return sum(self.blobs.values())
+
+    @property
+    def blobs_usage(self):
+        # The disk usage of the pulled blobs stored as is, i.e. in the OCI layout of restorable apps
+        return sum(self.round_up(size) for size in self.blobs.values())
+
+    @property
+    def complete(self):
+        return not self.unknown_layers and not self.unknown_apps
+
+    def round_up(self, size):
+        return (size + self.fs_block_size - 1) // self.fs_block_size * self.fs_block_size
+
+
+class AppsSizePlanner:
+    # Plans a fetch of Target apps before it starts: the bytes to pull and the disk usage of the fetched apps
+    # are computed from the app manifests, the per-platform layers indexes listing all layers of the apps' images,
+    # and the layers metadata (`layers-meta` v1) with the extracted layer usage measured by the app publisher.
+    # Neither app archives nor images are pulled. The manifests and the layers metadata are read from the app graph
+    # cache if it's specified, so an app whose graph is cached is planned without going to the registry.
+    DefaultFsBlockSize = 4096
+    LayersIndexMediaType = 'application/vnd.oci.image.index.v1+json'
+
+    def __init__(self, registry_client: DockerRegistryClient, fs_block_size=DefaultFsBlockSize,
+                 graph_cache: AppGraphCache = None):
+        self._registry_client = registry_client
+        self._fs_block_size = fs_block_size
+        self._graph_cache = graph_cache
+        self._lock = threading.Lock()
+
+    def plan(self, target_apps, platform) -> AppsSizePlan:
+        # target_apps: [(app name, app uri)]
+        plan = AppsSizePlan(self._fs_block_size)
+        if self._graph_cache:
+            for _, app_uri in target_apps:
+                self._graph_cache.load(app_uri)
+        # the tokens are needed only to pull the apps graph nodes missing in the cache
+        self._registry_client.prefetch_tokens(app_uri for _, app_uri in target_apps
+                                              if not self._is_cached(app_uri, platform))
+        with ThreadPoolExecutor(max_workers=self._registry_client.max_workers,
+                                thread_name_prefix='apps-size-planner') as executor:
+            list(executor.map(lambda app: self._plan_app(plan, app[0], app[1], platform), target_apps))
+        logger.info('Apps fetch is planned; apps: {}, blobs: {}, download: {}, blobs usage: {}, apps usage: {},'
+                    ' layers usage: {}, unknown layers: {}'
+                    .format(plan.apps, len(plan.blobs), plan.download, plan.blobs_usage, plan.apps_usage,
+                            plan.layers_usage, len(plan.unknown_layers)))
+        return plan
+
+    def _is_cached(self, app_uri, platform):
+        uri = DockerRegistryClient.parse_image_uri(app_uri)
+        if not self._graph_cache or uri.digest not in self._graph_cache:
+            return False
+        manifest = json.loads(self._graph_cache.get(uri.digest))
+        layers_meta_desc = self._get_layers_meta_desc(manifest)
+        return all(digest in self._graph_cache
+                   for digest in [lm['digest'] for lm in self._get_layers_indexes(manifest, platform)] +
+                   ([layers_meta_desc['digest']] if layers_meta_desc else []))
+
+    @staticmethod
+    def _get_layers_meta_desc(manifest):
+        if len(manifest['layers']) > 1 and manifest['layers'][1].get('annotations', {}).get('layers-meta') == 'v1':
+            return manifest['layers'][1]
+        return None
+
+    @staticmethod
+    def _get_layers_indexes(manifest, platform):
+        return [lm for lm in manifest.get('manifests', []) if lm['platform']['architecture'] == platform]
+
+    def _pull_blob(self, uri, digest):
+        # The layers metadata blob is cached along with the app manifests, it's addressed by digest too
+        data = self._graph_cache.get(digest) if self._graph_cache else None
+        if data is None:
+            data = self._registry_client.pull_layer(uri, digest)
+            if self._graph_cache:
+                self._graph_cache.add(digest, data)
+        return data
+
+    def _plan_app(self, plan: AppsSizePlan, app_name, app_uri, platform):
+        uri = DockerRegistryClient.parse_image_uri(app_uri)
+        manifest_data = self._registry_client.pull_manifest(uri)
+        manifest = json.loads(manifest_data)
+        archive_size = manifest['layers'][0]['size']
+        blobs = {uri.digest: len(manifest_data), manifest['layers'][0]['digest']: archive_size}
+        app_graph = [uri.digest]
+
+        layers_meta = {}
+        layers_meta_desc = self._get_layers_meta_desc(manifest)
+        if layers_meta_desc:
+            blobs[layers_meta_desc['digest']] = layers_meta_desc['size']
+            layers_meta = json.loads(self._pull_blob(uri, layers_meta_desc['digest'])) \
+                .get(platform, {}).get('layers', {})
+            app_graph.append(layers_meta_desc['digest'])
+
+        layers = {}
+        for lm in self._get_layers_indexes(manifest, platform):
+            blobs[lm['digest']] = lm['size']
+            lm_uri = DockerRegistryClient.parse_image_uri(uri.host + '/' + uri.name + '@' + lm['digest'])
+            layers_index = json.loads(self._registry_client.pull_manifest(lm_uri, self.LayersIndexMediaType))
+            app_graph.append(lm_uri.digest)
+            for layer in layers_index['manifests']:
+                layers[layer['digest']] = layer['size']
+        if self._graph_cache:
+            self._graph_cache.store(app_uri, app_graph)
+        with self._lock:
+            plan.apps += 1
+            if not layers:
+                logger.warning('No layers index is found for the app, its images size is unknown;'
+                               ' app: {}, platform: {}'.format(app_name, platform))
+                plan.unknown_apps.append(app_name)
+            # The app dir keeps a copy of the app archive (or its extracted files), the app manifest and uri
+            plan.apps_usage += plan.round_up(archive_size) + plan.round_up(len(manifest_data)) + plan.fs_block_size
+            plan.blobs.update(blobs)
+            for digest, size in layers.items():
+                if digest in plan.blobs:
+                    continue
+                plan.blobs[digest] = size
+                if digest in layers_meta:
+                    plan.layers_usage += layers_meta[digest]['usage']
+                else:
+                    plan.unknown_layers.append(digest)
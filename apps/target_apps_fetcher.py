@@ -1,14 +1,29 @@
 import os
 import json
 import logging
+import shutil
 import tarfile
 import subprocess
-from io import BytesIO as BIO
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import yaml
 
 from factory_client import FactoryClient
 from apps.docker_registry_client import DockerRegistryClient
 from apps.dockerd import DockerDaemon
 from apps.compose_apps import ComposeApps
+from apps.oci_copier import OciImageCopier
+from apps.overlay2_writer import Overlay2Writer
+from apps.app_graph_cache import AppGraphCache
+from apps.blob_pool import BlobPool
+from apps.disk_usage import DiskUsage
+from apps.fetched_apps import FetchedAppsArchive
+from apps.fsck import FetchedAppsVerifier
+from apps.image_scheduler import ImageFetchScheduler
+from apps.registry_mirrors import registry_mirrors
+from apps.size_planner import AppsSizePlan, AppsSizePlanner
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +32,26 @@ class TargetAppsFetcher:
     TargetFile = 'targets.json'
     AppsDir = 'apps'
     ImagesDir = 'images'
+    # Images are written to the docker data root in-process by default,
+    # dockerd is used if it fails or if it's requested explicitly
+    ImagesWriterEnv = 'APPS_IMAGES_WRITER'
+    NativeImagesWriter = 'native'
+    DockerdImagesWriter = 'dockerd'
 
-    def __init__(self, token, work_dir, factory=None, client='docker'):
+    def __init__(self, token, work_dir, factory=None, client='docker', max_workers=None, images_writer=None):
         if factory:
             self._factory_client = FactoryClient(factory, token)
-        self._registry_client = DockerRegistryClient(token, client=client)
+        self._graph_cache = AppGraphCache()
+        self._registry_client = DockerRegistryClient(token, client=client, max_workers=max_workers,
+                                                     graph_cache=self._graph_cache)
+        self._oci_copier = OciImageCopier(token, max_workers, registry_client=self._registry_client,
+                                          graph_cache=self._graph_cache)
+        self._images_writer = images_writer or os.environ.get(self.ImagesWriterEnv, self.NativeImagesWriter)
         self._work_dir = work_dir
         self.target_apps = {}
         self.create_target_dir = True
+        # Target name -> the disk usage of the Target's fetched apps, accounted as the apps are fetched
+        self._disk_usage = {}
 
     def target_dir(self, target_name):
         if self.create_target_dir:
@@ -41,49 +68,127 @@ class TargetAppsFetcher:
     def images_dir(self, target_name):
         return os.path.join(self.target_dir(target_name), self.ImagesDir)
 
+    def size_file(self, target_name):
+        # A sidecar of the Target dir, so it's neither preloaded nor archived along with the fetched apps.
+        # There is no sidecar if the apps are fetched directly to the work dir, e.g. to an OCI store.
+        if not self.create_target_dir:
+            return None
+        return self.target_dir(target_name).rstrip(os.sep) + DiskUsage.SidecarFileExt
+
     def fetch_target(self, target: FactoryClient.Target, shortlist=None, force=False):
         self.target_apps.clear()
         self.fetch_target_apps(target, apps_shortlist=target.shortlist or shortlist, force=force)
         self.fetch_apps_images(force=force)
+        if self.size_file(target.name):
+            self._disk_usage[target.name].save(self.size_file(target.name))
+        self.log_stats()
+
+    def log_stats(self):
+        self._registry_client.log_stats()
+        logger.info('App graph cache; hits: {}, misses: {}'.format(self._graph_cache.hits, self._graph_cache.misses))
 
     def fetch_target_apps(self, target: FactoryClient.Target, apps_shortlist=None, force=False):
+        if self.size_file(target.name) and os.path.exists(self.size_file(target.name)):
+            os.remove(self.size_file(target.name))
+        self._disk_usage[target.name] = DiskUsage(self.target_dir(target.name))
         self.target_apps[target] = self._fetch_apps(target, apps_shortlist=apps_shortlist, force=force)
 
     def fetch_apps_images(self, graphdriver='overlay2', force=False):
         self._registry_client.login()
         for target, apps in self.target_apps.items():
             if not os.path.exists(self.images_dir(target.name)) or force:
-                self._download_apps_images(apps, self.images_dir(target.name), target.platform, graphdriver)
+                self._download_apps_images(apps, self.images_dir(target.name), target.platform,
+                                           self._disk_usage[target.name], graphdriver)
             else:
                 logger.info('Target Apps\' images have been already fetched; Target: {}'.format(target.name))
+                self._disk_usage[target.name].add_tree(self.images_dir(target.name))
 
     def get_target_apps_size(self, target: FactoryClient.Target) -> int:
-        # in kilobytes (`du -sb` returns so called "apparent size", hence we use `du -sk` - get usage in kilobytes)
+        # in bytes, the disk usage of the fetched apps (just like `du -sk` reports it) accounted while they were
+        # being fetched by this fetcher or by a previous one
+        if target.name in self._disk_usage:
+            return self._disk_usage[target.name].usage
+        apps_size_b = DiskUsage.load(self.size_file(target.name)) if self.size_file(target.name) else None
+        if apps_size_b is not None:
+            return apps_size_b
+        # `du -sb` returns so called "apparent size", hence we use `du -sk` - get usage in kilobytes
         apps_size_str = subprocess.check_output(['du', '-sk', self.target_dir(target.name)]).split()[0].decode(
             'utf-8')
         apps_size_b = int(apps_size_str) * 1024
         return apps_size_b
 
-    @staticmethod
-    def _download_apps_images(apps: ComposeApps, app_images_dir, platform, graphdriver='overlay2'):
+    def plan_target(self, target: FactoryClient.Target, shortlist=None) -> AppsSizePlan:
+        # Plans the Target apps fetch from the app manifests and the layers metadata, without fetching them
+        planner = AppsSizePlanner(self._registry_client, graph_cache=self._graph_cache)
+        return planner.plan(self._target_apps(target, target.shortlist or shortlist), target.platform)
+
+    def get_planned_apps_size(self, plan: AppsSizePlan) -> int:
+        # in bytes, the apps are extracted and their images are stored in the docker store
+        return plan.apps_usage + plan.layers_usage
+
+    def _download_apps_images(self, apps: ComposeApps, app_images_dir, platform, disk_usage: DiskUsage,
+                              graphdriver='overlay2'):
         os.makedirs(app_images_dir, exist_ok=True)
+        if self._images_writer == self.NativeImagesWriter and graphdriver == 'overlay2':
+            try:
+                writer = Overlay2Writer(app_images_dir, self._oci_copier, self._registry_client.max_workers,
+                                        disk_usage=disk_usage)
+                writer.write([image for app in apps for image in app.images()], platform)
+                return
+            except Exception as exc:
+                logger.warning('Failed to write images in-process, falling back to dockerd; err: {}'.format(exc))
+                shutil.rmtree(app_images_dir)
+                disk_usage.discard(app_images_dir)
+                os.makedirs(app_images_dir)
         with DockerDaemon(app_images_dir, graphdriver) as dockerd:
-            for app in apps:
-                app.download_images(platform, dockerd.host)
+            self._pull_apps_images(apps, platform, dockerd)
+        disk_usage.add_tree(app_images_dir)
 
-    def _fetch_apps(self, target, apps_shortlist=None, force=False):
+    @staticmethod
+    def _pull_apps_images(apps: ComposeApps, platform, dockerd: DockerDaemon):
+        # An image referenced by many apps or services is pulled once, images are pulled concurrently,
+        # as many as the layers the daemon downloads concurrently
+        scheduler = ImageFetchScheduler(DockerDaemon.MaxConcurrentDownloads)
+        for app in apps:
+            downloader = app.get_image_downloader(dockerd.host)
+            for image in app.images():
+                host = image.split('/', 1)[0]
+                registry = host if '/' in image and ('.' in host or ':' in host) else 'docker.io'
+                scheduler.add((platform, image), image, registry, partial(downloader.pull, image, platform))
+        scheduler.run()
+
+    def _target_apps(self, target, apps_shortlist=None):
+        target_apps = []
         for app_name, app_uri in target.apps():
             if apps_shortlist and app_name not in apps_shortlist:
                 logger.info('{} is not in the shortlist, skipping it'.format(app_name))
                 continue
+            target_apps.append((app_name, app_uri))
+        return target_apps
+
+    def _map_apps(self, func, target_apps):
+        # Apps are fetched in their own pool, the registry client's pool is used for fetching app blobs
+        with ThreadPoolExecutor(max_workers=self._registry_client.max_workers,
+                                thread_name_prefix='apps-fetcher') as executor:
+            return list(executor.map(lambda app: func(*app), target_apps))
+
+    def _fetch_apps(self, target, apps_shortlist=None, force=False):
+        target_apps = self._target_apps(target, apps_shortlist)
+        self._registry_client.prefetch_tokens(app_uri for _, app_uri in target_apps)
 
+        def fetch_app(app_name, app_uri):
             app_dir = os.path.join(self.apps_dir(target.name), app_name)
             if not os.path.exists(app_dir) or force:
                 os.makedirs(app_dir, exist_ok=True)
                 logger.info('Downloading App; Target: {}, App: {}, Uri: {} '.format(target.name, app_name, app_uri))
+                self._graph_cache.load(app_uri)
                 self._registry_client.download_compose_app(app_uri, app_dir)
+                self._graph_cache.store(app_uri, [DockerRegistryClient.parse_image_uri(app_uri).digest])
             else:
                 logger.info('App has been already fetched; Target: {}, App: {}'.format(target.name, app_name))
+            self._disk_usage[target.name].add_tree(app_dir)
+
+        self._map_apps(fetch_app, target_apps)
         return ComposeApps(self.apps_dir(target.name))
 
 
@@ -92,113 +197,421 @@ class SkopeAppFetcher(TargetAppsFetcher):
     ManifestFile = 'manifest.json'
     ArchiveFileExt = '.tgz'
     BlobsDir = 'blobs'
-
-    def __init__(self, token, work_dir, factory=None, create_target_dir=True):
-        super().__init__(token, work_dir, factory, client='skopeo')
+    # Blobs of all Targets fetched to the same work dir are stored once in the pool,
+    # each Target's blob dir contains links to the pool's blobs
+    BlobPoolDir = '.blobs'
+    # Images are copied in-process by default, `skopeo` is used if it fails or if it's requested explicitly
+    ImageCopierEnv = 'APPS_IMAGE_COPIER'
+    NativeImageCopier = 'native'
+    SkopeoImageCopier = 'skopeo'
+    # All images of a Target are copied by a single `skopeo sync` process, i.e. a single process start-up and
+    # a single registry auth per Target, the images that fail to sync are copied by `skopeo copy`
+    SkopeoSyncImageCopier = 'skopeo-sync'
+    SyncManifestFile = 'manifest.json'
+
+    def __init__(self, token, work_dir, factory=None, create_target_dir=True, max_workers=None,
+                 image_copier=None, blob_cache_dir=None, blob_cache_size=None):
+        super().__init__(token, work_dir, factory, client='skopeo', max_workers=max_workers)
         self.create_target_dir = create_target_dir
+        self._image_copier = image_copier or os.environ.get(self.ImageCopierEnv, self.NativeImageCopier)
+        # A persistent blob cache is used as the blob pool if specified. Otherwise, the pool is in the work dir,
+        # unless the Target dir is not created, then a single Target is fetched, so there is nothing to share blobs with
+        if blob_cache_dir:
+            self._blob_pool = BlobPool(blob_cache_dir, blob_cache_size)
+        else:
+            self._blob_pool = BlobPool(os.path.join(work_dir, self.BlobPoolDir) if create_target_dir else None)
+        self._oci_copier = OciImageCopier(token, max_workers, registry_client=self._registry_client,
+                                          graph_cache=self._graph_cache, blob_pool=self._blob_pool)
+        # app dir -> (app uri, digests of the app graph nodes)
+        self._app_graphs = {}
+        # blobs dir -> digests of the blobs verified by `verify_fetched()`
+        self._verified_blobs = {}
 
     def blobs_dir(self, target_name):
         return os.path.join(self.target_dir(target_name), self.BlobsDir)
 
+    def get_planned_apps_size(self, plan: AppsSizePlan) -> int:
+        # in bytes, the apps and their images are stored as blobs
+        return plan.apps_usage + plan.blobs_usage
+
+    def fetch_target(self, target: FactoryClient.Target, shortlist=None, force=False):
+        super().fetch_target(target, shortlist, force)
+        self._blob_pool.evict()
+
+    def log_stats(self):
+        super().log_stats()
+        self._blob_pool.log_stats()
+
+    def seed(self, archive: FetchedAppsArchive):
+        # Seeds the blob pool and the app graph cache with the blobs of a previously fetched apps archive
+        if not self._blob_pool.dir:
+            logger.warning('No blob pool to seed, the fetched apps archive is not used; archive: {}'
+                           .format(archive.src))
+            return
+        archive.seed(self._blob_pool, self._graph_cache)
+
+    def verify_fetched(self, target: FactoryClient.Target) -> FetchedAppsVerifier.Result:
+        # Verifies the apps present in the Target dir, e.g. extracted from the Target's fetched apps archive,
+        # so the following fetch reuses the valid blobs and fetches only the missing and corrupted ones.
+        # Corrupted blobs are removed, the valid ones are moved to the blob pool, and the manifests are added
+        # to the app graph cache, so they are not pulled from the registry either.
+        verifier = FetchedAppsVerifier(self.target_dir(target.name), target.platform,
+                                       self._registry_client.max_workers)
+        result = verifier.verify()
+        verified_blobs = self._verified_blobs.setdefault(os.path.join(self.blobs_dir(target.name), 'sha256'), set())
+        corrupted_blobs = set()
+        for digest, paths in result.corrupted_paths.items():
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            # A corrupted copy in the app dir doesn't affect the blob if it's verified
+            if digest not in result.verified or verifier.blob_path(digest) in paths:
+                # The Target's blob is a link to the pool's one, so the pool's blob is corrupted too
+                self._blob_pool.discard(digest)
+                verified_blobs.discard(digest)
+                corrupted_blobs.add(digest)
+        for digest, data in result.manifests.items():
+            self._graph_cache.add(digest, data)
+        for digest in result.verified - corrupted_blobs:
+            self._blob_pool.adopt(digest, verifier.blob_path(digest))
+            verified_blobs.add(digest)
+        return result
+
     def _fetch_apps(self, target, apps_shortlist=None, force=False):
-        fetched_apps = []
         blobs_dir = os.path.join(self.blobs_dir(target.name), "sha256")
         os.makedirs(blobs_dir, exist_ok=True)
-        for app_name, app_uri in target.apps():
-            if apps_shortlist and app_name not in apps_shortlist:
-                logger.info('{} is not in the shortlist, skipping it'.format(app_name))
-                continue
-
-            uri = DockerRegistryClient.parse_image_uri(app_uri)
-            app_dir = os.path.join(self.apps_dir(target.name), app_name, uri.hash)
-            if os.path.exists(app_dir) and not force:
-                logger.info('App has been already fetched; Target: {}, App: {}'.format(target.name, app_name))
-                continue
-
-            logger.info('Fetching App; Target: {}, App: {}, URI: {}, dst dir {} '
-                        .format(target.name, app_name, app_uri, app_dir))
-            os.makedirs(app_dir, exist_ok=True)
-            with open(os.path.join(app_dir, self.UriFile), 'w') as f:
-                f.write(app_uri)
-
-            manifest_data = self._registry_client.pull_manifest(uri)
-            with open(os.path.join(app_dir, self.ManifestFile), 'wb') as f:
-                f.write(manifest_data)
-
-            # Store the app manifest in the blobs directory to simplify its fetching from the store
-            with open(os.path.join(blobs_dir, uri.hash), 'wb') as f:
-                f.write(manifest_data)
-
-            manifest = json.loads(manifest_data)
-            app_blob_digest = manifest['layers'][0]['digest']
-            app_blob_hash = app_blob_digest[len('sha256:'):]
-            app_blob = self._registry_client.pull_layer(uri, app_blob_digest)
-            app_blob_file = os.path.join(app_dir, app_blob_hash + self.ArchiveFileExt)
-            with open(app_blob_file, 'wb') as f:
-                f.write(app_blob)
-            # Store the app archive/blob in the blobs directory to simplify fetching
-            with open(os.path.join(blobs_dir, app_blob_hash), 'wb') as f:
-                f.write(app_blob)
-
-            with tarfile.open(fileobj=BIO(app_blob)) as t:
-                t.extract('docker-compose.yml', app_dir)
-
-            if 'annotations' in manifest['layers'][0] and \
-                    'org.foundries.app.bundle.index.digest' in manifest['layers'][0]['annotations']:
-                app_index_digest = manifest['layers'][0]['annotations']['org.foundries.app.bundle.index.digest']
-                app_index_hash = app_index_digest[len('sha256:'):]
-                app_index = self._registry_client.pull_layer(uri, app_index_digest)
-                with open(os.path.join(blobs_dir, app_index_hash), 'wb') as f:
-                    f.write(app_index)
-
-            # Download and store the layers' manifest that contains a list of all layers that app's images are based on.
-            # It's needed for aklite to calculate an update size in an offline update case.
-            for lm in manifest.get('manifests', []):
-                if target.platform == lm['platform']['architecture']:
-                    lm_uri = self._registry_client.parse_image_uri(uri.host + '/' + uri.name + "@" + lm["digest"])
-                    layers_index = self._registry_client.pull_manifest(lm_uri, 'application/vnd.oci.image.index.v1+json')
-                    with open(os.path.join(blobs_dir, lm_uri.hash), 'wb') as f:
-                        f.write(layers_index)
-
-            # If present, then download and store the app layers metadata that contains precise
-            # sizes of extracted layers.
-            # The metadata are used to calculate exact update size during offline update
-            if len(manifest.get('layers', [])) > 1 and \
-                    manifest['layers'][1].get('annotations', {}).get('layers-meta') == 'v1':
-                layer_desc = manifest['layers'][1]
-                blob = self._registry_client.pull_layer(uri, layer_desc['digest'])
-                blob_file = os.path.join(blobs_dir, layer_desc['digest'][len('sha256:'):])
-                with open(blob_file, 'wb') as f:
-                    f.write(blob)
-
-            fetched_apps.append(ComposeApps.App(app_name, app_dir))
-        return fetched_apps
+        target_apps = self._target_apps(target, apps_shortlist)
+        self._registry_client.prefetch_tokens(app_uri for _, app_uri in target_apps)
+        fetched_apps = self._map_apps(lambda app_name, app_uri: self._fetch_app(target, app_name, app_uri,
+                                                                                 blobs_dir, force),
+                                      target_apps)
+        if not all(fetched_apps):
+            # the blobs of the already fetched apps
+            self._disk_usage[target.name].add_tree(blobs_dir)
+        return [app for app in fetched_apps if app]
+
+    def _fetch_app(self, target, app_name, app_uri, blobs_dir, force=False):
+        uri = DockerRegistryClient.parse_image_uri(app_uri)
+        app_dir = os.path.join(self.apps_dir(target.name), app_name, uri.hash)
+        if os.path.exists(app_dir) and not force:
+            logger.info('App has been already fetched; Target: {}, App: {}'.format(target.name, app_name))
+            self._disk_usage[target.name].add_tree(app_dir)
+            return None
+
+        logger.info('Fetching App; Target: {}, App: {}, URI: {}, dst dir {} '
+                    .format(target.name, app_name, app_uri, app_dir))
+        os.makedirs(app_dir, exist_ok=True)
+        self._graph_cache.load(app_uri)
+        app_graph = [uri.digest]
+        self._app_graphs[app_dir] = (app_uri, app_graph)
+        with open(os.path.join(app_dir, self.UriFile), 'w') as f:
+            f.write(app_uri)
+
+        manifest_data = self._registry_client.pull_manifest(uri)
+        # Store the app manifest in the blobs directory to simplify its fetching from the store,
+        # the app dir's manifest is a link to the stored blob, so the manifest is written once
+        self._blob_pool.put(uri.digest, manifest_data, os.path.join(blobs_dir, uri.hash))
+        self._blob_pool.place(os.path.join(blobs_dir, uri.hash), os.path.join(app_dir, self.ManifestFile))
+
+        manifest = json.loads(manifest_data)
+        # The app archive, the app bundle index, the layers' manifest and the layers metadata
+        # do not depend on each other, so they are fetched concurrently.
+        blob_fetchers = [lambda: self._fetch_app_archive(uri, manifest, app_dir, blobs_dir)]
+        blobs = [uri.digest, manifest['layers'][0]['digest']]
+
+        if 'annotations' in manifest['layers'][0] and \
+                'org.foundries.app.bundle.index.digest' in manifest['layers'][0]['annotations']:
+            app_index_digest = manifest['layers'][0]['annotations']['org.foundries.app.bundle.index.digest']
+            blob_fetchers.append(lambda: self._pull_blob(uri, app_index_digest, blobs_dir))
+            blobs.append(app_index_digest)
+
+        # Download and store the layers' manifest that contains a list of all layers that app's images are based on.
+        # It's needed for aklite to calculate an update size in an offline update case.
+        def fetch_layers_index(lm_uri):
+            layers_index = self._registry_client.pull_manifest(lm_uri, 'application/vnd.oci.image.index.v1+json')
+            self._blob_pool.put(lm_uri.digest, layers_index, os.path.join(blobs_dir, lm_uri.hash))
+
+        for lm in manifest.get('manifests', []):
+            if target.platform == lm['platform']['architecture']:
+                lm_uri = self._registry_client.parse_image_uri(uri.host + '/' + uri.name + "@" + lm["digest"])
+                blob_fetchers.append(lambda lm_uri=lm_uri: fetch_layers_index(lm_uri))
+                app_graph.append(lm_uri.digest)
+                blobs.append(lm_uri.digest)
+
+        # If present, then download and store the app layers metadata that contains precise
+        # sizes of extracted layers.
+        # The metadata are used to calculate exact update size during offline update
+        if len(manifest.get('layers', [])) > 1 and \
+                manifest['layers'][1].get('annotations', {}).get('layers-meta') == 'v1':
+            layer_desc = manifest['layers'][1]
+            blob_fetchers.append(lambda: self._pull_graph_blob(uri, layer_desc['digest'], blobs_dir))
+            blobs.append(layer_desc['digest'])
+            app_graph.append(layer_desc['digest'])
+
+        self._registry_client.map(lambda fetch: fetch(), blob_fetchers)
+        app_files = [self.UriFile, self.ManifestFile, blobs[1][len('sha256:'):] + self.ArchiveFileExt,
+                     ComposeApps.App.ComposeFile]
+        for path in [os.path.join(app_dir, f) for f in app_files] + \
+                [os.path.join(blobs_dir, digest[len('sha256:'):]) for digest in blobs]:
+            self._disk_usage[target.name].add(path)
+        return ComposeApps.App(app_name, app_dir)
+
+    def _fetch_app_archive(self, uri, manifest, app_dir, blobs_dir):
+        app_blob_digest = manifest['layers'][0]['digest']
+        app_blob_hash = app_blob_digest[len('sha256:'):]
+        # Store the app archive/blob in the blobs directory to simplify fetching
+        app_blob_store_file = self._pull_blob(uri, app_blob_digest, blobs_dir)
+        self._blob_pool.place(app_blob_store_file, os.path.join(app_dir, app_blob_hash + self.ArchiveFileExt))
+
+        # The archive is read as a stream up to the compose file, rather than indexing all its members
+        with tarfile.open(app_blob_store_file, 'r|*') as t:
+            for member in t:
+                if member.name == ComposeApps.App.ComposeFile:
+                    t.extract(member, app_dir)
+                    break
+            else:
+                raise Exception('No {} found in the app archive; app: {}'.format(ComposeApps.App.ComposeFile, uri))
+
+    def _pull_blob(self, uri, digest, blobs_dir):
+        blob_file = os.path.join(blobs_dir, digest[len('sha256:'):])
+        if digest in self._verified_blobs.get(blobs_dir, ()):
+            return blob_file
+        self._blob_pool.get(digest, blob_file, lambda path: self._registry_client.pull_layer(uri, digest, dst=path))
+        return blob_file
+
+    def _pull_graph_blob(self, uri, digest, blobs_dir):
+        # The layers metadata blob is a node of the app graph, so it's not pulled again if the fetch has been planned
+        data = self._graph_cache.get(digest)
+        if data is None:
+            blob_file = self._pull_blob(uri, digest, blobs_dir)
+            with open(blob_file, 'rb') as f:
+                self._graph_cache.add(digest, f.read())
+            return blob_file
+        blob_file = os.path.join(blobs_dir, digest[len('sha256:'):])
+        if digest not in self._verified_blobs.get(blobs_dir, ()):
+            self._blob_pool.put(digest, data, blob_file)
+        return blob_file
 
     def fetch_apps_images(self, graphdriver='overlay2', force=False):
         self._registry_client.login()
+        # Images of all Targets' apps are fetched concurrently, an image referenced by many apps of a Target
+        # is fetched once and its OCI layout is copied to the other apps' image dirs
+        if self._image_copier == self.SkopeoSyncImageCopier:
+            for target, apps in self.target_apps.items():
+                try:
+                    self._sync_target_images(target, apps)
+                except Exception as exc:
+                    logger.warning('Failed to sync Target images, copying them one by one; Target: {}, err: {}'
+                                   .format(target.name, exc))
+        scheduler = ImageFetchScheduler(self._registry_client.max_workers)
+        apps_images = []
         for target, apps in self.target_apps.items():
             logger.info('Pulling images of {} apps'.format(target.name))
             for app in apps:
-                logger.info('Pulling {} images'.format(app.name))
                 images_dir = os.path.join(app.dir, self.ImagesDir)
                 os.makedirs(images_dir, exist_ok=True)
+                app_images = []
                 for image in app.images():
-                    self.fetch_image(target.name, target.platform, image, images_dir)
+                    uri = self._registry_client.parse_image_uri(image)
+                    image_dir = os.path.join(images_dir, uri.host, uri.name, uri.hash)
+                    job = scheduler.add((target.name, target.platform, image), image, uri.host,
+                                        partial(self._fetch_image_job, target.name, target.platform, image,
+                                                images_dir, image_dir))
+                    app_images.append((job, image_dir))
+                apps_images.append((target, app, app_images))
+        scheduler.run()
+
+        for target, app, app_images in apps_images:
+            image_manifests = []
+            for job, image_dir in app_images:
+                fetched_image_dir, manifests = job.result
+                if fetched_image_dir != image_dir:
+                    shutil.copytree(fetched_image_dir, image_dir, dirs_exist_ok=True)
+                    self._disk_usage[target.name].add_tree(image_dir)
+                image_manifests += manifests
+            self._store_app_graph(app, image_manifests)
+        for target in self.target_apps:
+            # the blobs dir has grown since it's been added
+            self._disk_usage[target.name].add(os.path.join(self.blobs_dir(target.name), 'sha256'))
+
+    def _sync_target_images(self, target: FactoryClient.Target, apps: ComposeApps):
+        # Copies the images of the Target's apps to the shared blob dir and the apps' OCI layouts.
+        # The image manifests are resolved in-process, the images whose blobs are missing in the blob pool are
+        # synced to `dir:` layouts by one `skopeo sync` process, and their blobs are moved to the shared blob dir.
+        # The copied images are marked as verified, so `fetch_image()` doesn't copy them again.
+        blobs_dir = os.path.join(self.blobs_dir(target.name), 'sha256')
+        os.makedirs(blobs_dir, exist_ok=True)
+        image_dirs = {}
+        for app in apps:
+            for image in app.images():
+                uri = self._registry_client.parse_image_uri(image)
+                image_dirs.setdefault(image, []).append(os.path.join(app.dir, self.ImagesDir, uri.host, uri.name,
+                                                                     uri.hash))
+
+        def resolve(image):
+            _, uri, manifests, manifest_desc = self._oci_copier.resolve(image, target.platform)
+            # Store the raw image manifests, `skopeo sync` stores only the platform one
+            for digest, manifest_data in manifests:
+                self._blob_pool.put(digest, manifest_data, os.path.join(blobs_dir, digest[len('sha256:'):]))
+                self._graph_cache.add(digest, manifest_data)
+            manifest = json.loads(manifests[-1][1])
+            blobs = [manifest['config']['digest']] + [layer['digest'] for layer in manifest['layers']]
+            missing = [digest for digest in blobs
+                       if not os.path.exists(os.path.join(blobs_dir, digest[len('sha256:'):])) and
+                       not self._blob_pool.seed(digest, os.path.join(blobs_dir, digest[len('sha256:'):]))]
+            return uri, manifest_desc, [digest for digest, _ in manifests] + blobs, missing
+
+        resolved = dict(zip(image_dirs, self._registry_client.map(resolve, image_dirs)))
+        to_sync = {image: r for image, r in resolved.items() if r[3]}
+        if to_sync:
+            with tempfile.TemporaryDirectory(dir=self._work_dir, prefix='.sync-') as sync_dir:
+                self._skopeo_sync_images(to_sync, blobs_dir, sync_dir)
+
+        for image, (uri, manifest_desc, nodes, _) in resolved.items():
+            for image_dir in image_dirs[image]:
+                self._oci_copier.write_layout(image_dir, manifest_desc)
+            self._verified_blobs.setdefault(blobs_dir, set()).update(nodes)
+        logger.info('Target images are synced; Target: {}, images: {}, synced: {}'
+                    .format(target.name, len(resolved), len(to_sync)))
+
+    def _skopeo_sync_images(self, images: dict, blobs_dir: str, sync_dir: str):
+        # The platform manifests are synced by digest, so the platform is not resolved by skopeo once again
+        repos = {}
+        for uri, manifest_desc, _, _ in images.values():
+            repos.setdefault(uri.host, {'images': {}})['images'].setdefault(uri.name, []) \
+                .append(manifest_desc['digest'])
+        sync_file = os.path.join(sync_dir, 'sync.yaml')
+        with open(sync_file, 'w') as f:
+            yaml.safe_dump(repos, f)
+        dst_dir = os.path.join(sync_dir, 'images')
+        try:
+            with registry_mirrors.skopeo_args() as mirrors_args:
+                output = subprocess.check_output(['skopeo', *mirrors_args, '--insecure-policy', 'sync',
+                                                  '--src', 'yaml', '--dest', 'dir', '--scoped', '--preserve-digests',
+                                                  '--retry-times', '3', sync_file, dst_dir], stderr=subprocess.STDOUT)
+            logger.info(output.decode(errors='replace').rstrip())
+        except subprocess.CalledProcessError as exc:
+            logger.error(exc.output.decode(errors='replace').rstrip())
+            raise
+
+        for image, (uri, manifest_desc, _, missing) in images.items():
+            # `--scoped` names the synced image dir by the image's normalized reference,
+            # e.g. docker.io/library/<name>@<digest>
+            image_dir = os.path.join(dst_dir, '{}@{}'.format(OciImageCopier.get_docker_reference(uri),
+                                                             manifest_desc['digest']))
+            if not os.path.exists(os.path.join(image_dir, self.SyncManifestFile)):
+                raise Exception('The image is not synced; image: {}, dir: {}'.format(image, image_dir))
+            # skopeo has verified the blobs digests while copying them, so they are moved as is
+            for digest in missing:
+                blob_file = os.path.join(blobs_dir, digest[len('sha256:'):])
+                if not os.path.exists(blob_file):
+                    os.replace(os.path.join(image_dir, digest[len('sha256:'):]), blob_file)
+                self._blob_pool.adopt(digest, blob_file)
+
+    def _fetch_image_job(self, target_name: str, arch: str, image: str, images_dir: str, image_dir: str):
+        return image_dir, self.fetch_image(target_name, arch, image, images_dir)
 
     def fetch_image(self, target_name: str, arch: str, image: str, dst_root_dir: str):
+        # Returns digests of the image manifests that have been resolved to fetch the image
         logger.info('Pulling image: {}'.format(image))
         uri = self._registry_client.parse_image_uri(image)
         image_dir = os.path.join(dst_root_dir, uri.host, uri.name, uri.hash)
+        manifests = self._get_verified_image(target_name, uri, image_dir)
+        if manifests:
+            logger.info('Image has been already fetched and verified; image: {}'.format(image))
+            return manifests
+        if self._image_copier == self.NativeImageCopier:
+            try:
+                return self._oci_copier.copy(image, arch, self.blobs_dir(target_name), image_dir,
+                                             disk_usage=self._disk_usage.get(target_name))
+            except Exception as exc:
+                logger.warning('Failed to copy image in-process, falling back to skopeo; image: {}, err: {}'
+                               .format(image, exc))
+        self._skopeo_copy_image(target_name, arch, image, image_dir)
+        if target_name in self._disk_usage:
+            # skopeo doesn't tell which blobs it's written to the shared blob dir
+            self._disk_usage[target_name].add_tree(image_dir)
+            self._disk_usage[target_name].add_tree(self.blobs_dir(target_name))
+        return []
+
+    def _get_verified_image(self, target_name, uri, image_dir):
+        # Returns digests of the image manifests if the image's OCI layout and all its blobs have been verified
+        blobs_dir = os.path.join(self.blobs_dir(target_name), 'sha256')
+        verified = self._verified_blobs.get(blobs_dir)
+        index_file = os.path.join(image_dir, OciImageCopier.OciIndexFile)
+        if not verified or not os.path.exists(index_file) or \
+                not os.path.exists(os.path.join(image_dir, OciImageCopier.OciLayoutFile)):
+            return None
+        try:
+            with open(index_file) as f:
+                manifest_digest = json.load(f)['manifests'][0]['digest']
+            if manifest_digest not in verified:
+                return None
+            manifest = json.loads(self._graph_cache.get(manifest_digest))
+            blobs = [manifest['config']['digest']] + [layer['digest'] for layer in manifest['layers']]
+        except (ValueError, KeyError, IndexError, TypeError) as exc:
+            logger.warning('Invalid OCI layout of the fetched image, fetching it; dir: {}, err: {}'
+                           .format(image_dir, exc))
+            return None
+        manifests = list(dict.fromkeys([uri.digest, manifest_digest]))
+        if not verified.issuperset(manifests + blobs):
+            return None
+        disk_usage = self._disk_usage.get(target_name)
+        if disk_usage:
+            for path in [os.path.join(image_dir, OciImageCopier.OciIndexFile),
+                         os.path.join(image_dir, OciImageCopier.OciLayoutFile)] + \
+                    [os.path.join(blobs_dir, digest[len('sha256:'):]) for digest in manifests + blobs]:
+                disk_usage.add(path)
+        return manifests
+
+    def _store_app_graph(self, app: ComposeApps.App, image_manifests):
+        if app.dir not in self._app_graphs:
+            return
+        app_uri, app_graph = self._app_graphs[app.dir]
+        self._graph_cache.store(app_uri, app_graph + image_manifests)
+
+    def _seed_image_blobs(self, arch: str, image: str, blobs_dir: str):
+        # Place the image blobs present in the blob pool to the shared blob dir, so skopeo doesn't pull them
+        try:
+            seeded = [self._blob_pool.seed(digest, os.path.join(blobs_dir, digest[len('sha256:'):]))
+                      for digest in self._oci_copier.get_image_blobs(image, arch)]
+            logger.info('Image blobs are seeded from the blob pool; image: {}, seeded: {}/{}'
+                        .format(image, sum(seeded), len(seeded)))
+        except Exception as exc:
+            logger.warning('Failed to seed image blobs from the blob pool; image: {}, err: {}'.format(image, exc))
+
+    def _skopeo_copy_image(self, target_name: str, arch: str, image: str, image_dir: str):
+        uri = self._registry_client.parse_image_uri(image)
         os.makedirs(image_dir, exist_ok=True)
-        subprocess.check_call(['skopeo', '--insecure-policy', '--override-arch', arch, 'copy',
-                               '--preserve-digests', '--retry-times', '3', '--format', 'v2s2',
-                               '--dest-shared-blob-dir', self.blobs_dir(target_name),
-                               'docker://' + image, 'oci:' + image_dir])
+        blobs_dir = os.path.join(self.blobs_dir(target_name), "sha256")
+        os.makedirs(blobs_dir, exist_ok=True)
+        if self._blob_pool.dir:
+            self._seed_image_blobs(arch, image, blobs_dir)
+        # The output is logged, so it's grouped with the other output of the image fetching
+        try:
+            with registry_mirrors.skopeo_args() as mirrors_args:
+                output = subprocess.check_output(['skopeo', *mirrors_args, '--insecure-policy',
+                                                  '--override-arch', arch, 'copy',
+                                                  '--preserve-digests', '--retry-times', '3', '--format', 'v2s2',
+                                                  '--dest-shared-blob-dir', self.blobs_dir(target_name),
+                                                  'docker://' + image, 'oci:' + image_dir], stderr=subprocess.STDOUT)
+            logger.info(output.decode(errors='replace').rstrip())
+        except subprocess.CalledProcessError as exc:
+            logger.error(exc.output.decode(errors='replace').rstrip())
+            raise
 
         # Store the image manifest in the blob directory, as result it contains all blobs/nodes of
         # the app's merkle tree. It allows to check app integrity on devices with preloaded apps and
         # in the case of offline update.
         # Note: the skopeo is supposed to store it, no idea why they don't do it
-        blob = subprocess.check_output(['skopeo', 'inspect', '--raw', f'docker://{image}'])
-        with open(os.path.join(self.blobs_dir(target_name), "sha256", uri.hash), 'wb') as f:
-            f.write(blob)
+        with registry_mirrors.skopeo_args() as mirrors_args:
+            blob = subprocess.check_output(['skopeo', *mirrors_args, 'inspect', '--raw', f'docker://{image}'])
+        self._blob_pool.put(uri.digest, blob, os.path.join(blobs_dir, uri.hash))
+
+        # Move the blobs stored by skopeo to the blob pool, so they are shared with other Targets
+        with open(os.path.join(image_dir, OciImageCopier.OciIndexFile)) as f:
+            manifest_digest = json.load(f)['manifests'][0]['digest']
+        with open(os.path.join(blobs_dir, manifest_digest[len('sha256:'):])) as f:
+            manifest = json.load(f)
+        for digest in [manifest_digest, manifest['config']['digest']] + [la['digest'] for la in manifest['layers']]:
+            self._blob_pool.adopt(digest, os.path.join(blobs_dir, digest[len('sha256:'):]))
@@ -11,6 +11,7 @@ import io
 import logging
 import shutil
 import tarfile
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from math import ceil
@@ -21,9 +22,11 @@ from helpers import (
     cmd,
     http_get,
     Progress,
+    rate_controller,
     status,
 )
 
+from apps.registry_mirrors import registry_mirrors
 from apps.target_apps_fetcher import TargetAppsFetcher, SkopeAppFetcher
 from factory_client import FactoryClient
 
@@ -93,15 +96,20 @@ class ImageVolume:
         self._part_numb, self._gpt = self._get_last_part(self._path)
         logger.info(f'Detected last partition is {self._part_numb}, going to preload apps into it')
         self._resized_image = False
+        self._rootfs_bytes_increase = 0
         if increase_bytes:
-            self._resize_wic_file(increase_bytes, extra_space)
-            self._rootfs_bytes_increase = increase_bytes
-            self._resized_image = True
+            self.grow(increase_bytes, extra_space)
         self.compose_apps_root = os.path.join(self._mnt_dir, self.ComposeAppsRootDir)
         self.docker_data_root = os.path.join(self._mnt_dir, self.DockerDataRootDir)
         self.restorable_apps_root = os.path.join(self._mnt_dir, self.RestorableAppsRoot)
         self.installed_target_filepath = os.path.join(self._mnt_dir, self.InstalledTargetFile)
 
+    def grow(self, increase_bytes: int, extra_space=0.2):
+        # Can be called once again before the volume is mounted, e.g. if the apps turn out to be bigger than planned
+        self._resize_wic_file(increase_bytes, extra_space)
+        self._rootfs_bytes_increase += increase_bytes
+        self._resized_image = True
+
     def __enter__(self):
         self._loop_device = losetup(self._path)
         self._part_device = \
@@ -194,17 +202,42 @@ def _mk_parent_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
 
+def plan_compose_apps_size(apps_fetcher: TargetAppsFetcher, target: FactoryClient.Target,
+                           apps_shortlist: list):
+    # Returns the bytes the Target apps require if they can be figured out before the apps are fetched
+    try:
+        plan = apps_fetcher.plan_target(target, shortlist=apps_shortlist)
+        if plan.complete:
+            logger.info('Compose Apps fetch is planned; download: {} bytes'.format(plan.download))
+            return apps_fetcher.get_planned_apps_size(plan)
+        logger.info('Compose Apps size cannot be planned, the apps layers metadata are incomplete;'
+                    ' unknown layers: {}, unknown apps: {}'.format(len(plan.unknown_layers), plan.unknown_apps))
+    except Exception as exc:
+        logger.warning('Failed to plan Compose Apps size: {}'.format(exc))
+    return None
+
+
 def copy_compose_apps_to_wic(target: FactoryClient.Target, fetch_dir: str, image_path: str,
                              token: str, apps_shortlist: list, progress: Progress):
     p = Progress(3, progress)
     apps_fetcher = TargetAppsFetcher(token, fetch_dir)
-    apps_fetcher.fetch_target(target, shortlist=apps_shortlist, force=True)
-    p.tick()
-    apps_size_b = apps_fetcher.get_target_apps_size(target)
-
-    logger.info('Compose Apps require extra {} bytes of storage'.format(apps_size_b))
-    with ImageVolume(image_path, apps_size_b) as image_volume:
+    planned_size_b = plan_compose_apps_size(apps_fetcher, target, apps_shortlist)
+    # If the apps size is planned, then the system image is resized while the apps are being fetched
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='apps-fetch') as executor:
+        fetch = executor.submit(apps_fetcher.fetch_target, target, shortlist=apps_shortlist, force=True)
+        image_volume = ImageVolume(image_path, planned_size_b) if planned_size_b else None
         p.tick()
+        fetch.result()
+    # The plan accounts neither the extracted app files nor the docker store metadata,
+    # so the image is extended further if the fetched apps need more storage than planned
+    apps_size_b = apps_fetcher.get_target_apps_size(target)
+    logger.info('Compose Apps require extra {} bytes of storage, planned: {}'.format(apps_size_b, planned_size_b))
+    if image_volume is None:
+        image_volume = ImageVolume(image_path, apps_size_b)
+    elif apps_size_b > planned_size_b:
+        image_volume.grow(apps_size_b - planned_size_b)
+    p.tick()
+    with image_volume:
         if os.path.exists(image_volume.docker_data_root):
             # wic image was populated by container images data during LmP build (/var/lib/docker)
             # let's remove it and populate with the given images data
@@ -262,14 +295,26 @@ def copy_restorable_apps_to_wic(target: FactoryClient.Target, image_path: str, a
             logger.info('Removing existing preloaded app images from the system image')
             shutil.rmtree(image_volume.restorable_apps_root)
 
-        cmd('cp', '-r', apps.dir, image_volume.restorable_apps_root)
+        # preserve the hardlinks between the app dirs' and the blob dir's files, the apps size is accounted with them
+        cmd('cp', '-a', apps.dir, image_volume.restorable_apps_root)
         image_volume.update_target(target)
     p.tick(complete=True)
 
 
 def fetch_restorable_apps(target: FactoryClient.Target, dst_dir: str, shortlist: [str], token: str) -> AppsDesc:
     apps_fetcher = SkopeAppFetcher(token, dst_dir)
+    # The apps extracted from the Target's fetched apps archive, if any, are verified and reused,
+    # only the missing and corrupted blobs are fetched
+    apps_fetcher.verify_fetched(target)
     apps_fetcher.fetch_target(target, shortlist=shortlist, force=True)
+    # The apps to preload are checked for completeness and integrity, the broken blobs are fetched once again
+    if not apps_fetcher.verify_fetched(target).ok:
+        logger.warning('The fetched apps are incomplete or corrupted, fetching the broken blobs again')
+        apps_fetcher.fetch_target(target, shortlist=shortlist, force=True)
+        result = apps_fetcher.verify_fetched(target)
+        if not result.ok:
+            raise Exception('The fetched apps are incomplete or corrupted; missing: {}, corrupted: {}'
+                            .format(list(result.missing), list(result.corrupted)))
     return AppsDesc(apps_fetcher.target_dir(target.name), apps_fetcher.get_target_apps_size(target))
 
 
@@ -311,7 +356,7 @@ def get_and_extract_fetched_apps(uri: str, token: str, out_dir: str):
     progress_step = total_length * (progress_percent / 100)
 
     last_reported_pos = 0
-    with io.BufferedReader(resp.raw, buffer_size=1024 * 1024) as buf_reader:
+    with resp, io.BufferedReader(resp.raw, buffer_size=1024 * 1024) as buf_reader:
         with tarfile.open(fileobj=buf_reader, mode="r|") as ts:
             for m in ts:
                 ts.extract(m, out_dir)
@@ -463,5 +508,7 @@ if __name__ == '__main__':
         logger.info(f'Removing `{fetch_dir}` directory Apps were fetched to...')
         shutil.rmtree(fetch_dir, ignore_errors=True)
 
+    rate_controller.report()
+    registry_mirrors.report()
     p.tick(complete=True)
     exit(exit_code)
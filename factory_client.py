@@ -1,9 +1,8 @@
 import os
 import logging
-import requests
 import subprocess
 
-from helpers import Progress, fio_dnsbase, http_get
+from helpers import Progress, fio_dnsbase, http_get, rate_controller
 from typing import NamedTuple
 
 
@@ -165,7 +164,7 @@ class FactoryClient:
             logger.info('Downloading Target system image...; Target: {}, image: {}'
                         .format(target.name, image_filename))
 
-            image_resp = requests.get(image_url, headers=self._auth_headers)
+            image_resp = rate_controller.get(image_url, headers=self._auth_headers)
             image_resp.raise_for_status()
             with open(image_file_path, 'wb') as image_file:
                 for data_chunk in image_resp.iter_content(chunk_size=65536):
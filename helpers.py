@@ -5,7 +5,10 @@ import json
 import os
 import subprocess
 import sys
+import threading
+import time
 import traceback
+from email.utils import parsedate_to_datetime
 from typing import Optional
 from urllib.parse import urlparse
 
@@ -73,8 +76,26 @@ def test_case_ctx(name):
         sys.exit(1)
 
 
-def cmd(*args, cwd=None, capture=False):
+_cmd_output_lock = threading.Lock()
+
+
+def cmd(*args, cwd=None, capture=False, buffered=False):
     '''Run a command and die if it fails. Output goes to stdoud/stderr'''
+    if buffered:
+        # the output is written once the command completes, so the output of commands run concurrently
+        # is not interleaved
+        p = subprocess.run(args, cwd=cwd, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+        with _cmd_output_lock:
+            status(' '.join(args), prefix='=$ ')
+            for line in p.stdout.splitlines(keepends=True):
+                sys.stdout.buffer.write(b'| ')
+                sys.stdout.buffer.write(line)
+            sys.stdout.buffer.write(b'|--\n')
+            sys.stdout.buffer.flush()
+        if p.returncode != 0:
+            raise subprocess.CalledProcessError(p.returncode, args)
+        return p.stdout if capture else b''
+
     # run a command and terminate on failure
     status(' '.join(args), prefix='=$ ')
     p = subprocess.Popen(args, cwd=cwd,
@@ -161,11 +182,139 @@ def jobserv_iterate_items(url, item_name):
         url = data.get('next')
 
 
-def http_get(url, params=None, **kwargs):
-    response = requests.get(url, params=params, **kwargs)
+class HostRateController:
+    '''Limits the number of in-flight HTTP requests per host and adapts the limit
+       to the server's throttling (AIMD). The limit is halved on HTTP 429/503,
+       and requests to the host are paused for the time specified in `Retry-After`.
+       Each successful request increases the limit by 1/limit, i.e. by one per
+       "round" of requests, up to the maximum limit. A failed request, e.g. a connection
+       reset or a timeout, halves the limit too, but doesn't pause the host.'''
+    ThrottleCodes = (429, 503)
+    MaxThrottleRetries = int(os.environ.get('HTTP_THROTTLE_RETRIES', 8))
+    MaxRetryDelay = 60
+
+    class Host:
+        def __init__(self, limit):
+            self.limit = limit
+            self.in_flight = 0
+            self.max_in_flight = 0
+            self.requests = 0
+            self.throttled = 0
+            self.paused_until = 0
+
+    def __init__(self, initial_limit=8, max_limit=None, min_limit=1):
+        self._initial_limit = initial_limit
+        self.max_limit = max_limit or int(os.environ.get('HTTP_HOST_MAX_CONCURRENCY', 32))
+        self._min_limit = min_limit
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def get(self, url, params=None, session=None, throttle_retries=None, **kwargs):
+        # A streamed response holds the host's slot until it's closed, i.e. until its body has been consumed.
+        # `throttle_retries` - how many times a throttled request is retried, e.g. 0 if the caller retries it
+        host = urlparse(url).netloc
+        max_retries = self.MaxThrottleRetries if throttle_retries is None else throttle_retries
+        retries = 0
+        while True:
+            self._acquire(host)
+            response = None
+            throttled = False
+            retry_after = None
+            try:
+                response = (session or requests).get(url, params=params, **kwargs)
+                throttled = response.status_code in self.ThrottleCodes
+                if throttled:
+                    retry_after = self._get_retry_after(response, retries)
+            finally:
+                if response is None:
+                    self._release(host, False, None, failed=True)
+                elif kwargs.get('stream') and not throttled:
+                    self._release_on_close(host, response)
+                else:
+                    self._release(host, throttled, retry_after)
+            if not throttled or retries >= max_retries:
+                return response
+            retries += 1
+            response.close()
+
+    def report(self):
+        with self._cond:
+            for host, h in self._hosts.items():
+                status('HTTP requests to {}: {}, throttled: {}, max concurrency: {}, final concurrency limit: {}'
+                       .format(host, h.requests, h.throttled, h.max_in_flight, int(h.limit)))
+
+    def _acquire(self, host):
+        with self._cond:
+            h = self._hosts.setdefault(host, self.Host(self._initial_limit))
+            while True:
+                now = time.monotonic()
+                if h.paused_until > now:
+                    self._cond.wait(h.paused_until - now)
+                elif h.in_flight >= int(h.limit):
+                    self._cond.wait()
+                else:
+                    break
+            h.in_flight += 1
+            h.requests += 1
+            h.max_in_flight = max(h.max_in_flight, h.in_flight)
+
+    def _release(self, host, throttled, retry_after, failed=False):
+        with self._cond:
+            h = self._hosts[host]
+            h.in_flight -= 1
+            if throttled:
+                h.throttled += 1
+                h.limit = max(self._min_limit, h.limit / 2)
+                h.paused_until = max(h.paused_until, time.monotonic() + retry_after)
+            elif failed:
+                h.limit = max(self._min_limit, h.limit / 2)
+            else:
+                h.limit = min(self.max_limit, h.limit + 1 / h.limit)
+            self._cond.notify_all()
+
+    def _release_on_close(self, host, response):
+        close = response.close
+        released = threading.Event()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                with self._cond:
+                    release = not released.is_set()
+                    released.set()
+                if release:
+                    self._release(host, False, None)
+        response.close = close_and_release
+
+    def _get_retry_after(self, response, retries):
+        retry_after = response.headers.get('retry-after')
+        delay = None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) -
+                             datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    pass
+        if delay is None:
+            delay = 2 ** retries
+        return min(max(delay, 0), self.MaxRetryDelay)
+
+
+rate_controller = HostRateController()
+
+
+def http_get(url, params=None, session=None, **kwargs):
+    response = rate_controller.get(url, params=params, session=session, **kwargs)
     if not response.ok:
-        raise requests.exceptions.HTTPError('Failed to get {}: HTTP_{}\n{}'.
-                                            format(url, response.status_code, response.text))
+        # a streamed response releases its host's slot once it's closed
+        with response:
+            raise requests.exceptions.HTTPError('Failed to get {}: HTTP_{}\n{}'.
+                                                format(url, response.status_code, response.text),
+                                                response=response)
     return response
 
 
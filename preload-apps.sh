@@ -22,6 +22,8 @@ PATH="${PATH}:/usr/bin" "${HERE}/preload_apps.py" \
     --oci-store-path "${OCI_STORE_PATH}" \
     --token-file "${TOKEN_FILE}" \
     --registry-creds-file "${REGISTRY_SECRETS_FILE}" \
-    --log-file "${LOG_FILE}"
+    --log-file "${LOG_FILE}" \
+    ${BLOB_CACHE_DIR:+--blob-cache-dir "${BLOB_CACHE_DIR}"} \
+    ${BLOB_CACHE_SIZE:+--blob-cache-size "${BLOB_CACHE_SIZE}"}
 
 trap 'rm -f "${REGISTRY_AUTH_FILE}"' INT TERM HUP EXIT
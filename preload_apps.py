@@ -11,16 +11,23 @@ import os
 import traceback
 
 from factory_client import FactoryClient
+from apps.blob_pool import parse_size
 from apps.docker_registry_client import ThirdPartyRegistry
 from apps.target_apps_fetcher import SkopeAppFetcher
+from apps.registry_mirrors import registry_mirrors
+from helpers import rate_controller
 
 logger = logging.getLogger(__name__)
 
 
-def pull_target_apps(target: FactoryClient.Target, oci_store_path: str, token: str, registry_creds: dict = None):
+def pull_target_apps(target: FactoryClient.Target, oci_store_path: str, token: str, registry_creds: dict = None,
+                     blob_cache_dir: str = None, blob_cache_size: int = None):
     ThirdPartyRegistry(registry_creds, client='skopeo').login()
-    apps_fetcher = SkopeAppFetcher(token, oci_store_path, create_target_dir=False)
+    apps_fetcher = SkopeAppFetcher(token, oci_store_path, create_target_dir=False,
+                                   blob_cache_dir=blob_cache_dir, blob_cache_size=blob_cache_size)
     apps_fetcher.fetch_target(target, force=True)
+    rate_controller.report()
+    registry_mirrors.report()
 
 
 def get_args():
@@ -43,6 +50,13 @@ def get_args():
 
     parser.add_argument('-l', '--log-file', help="A file to dump logs to", required=False)
 
+    parser.add_argument('-c', '--blob-cache-dir', help="A directory of a persistent blob cache shared by builds,"
+                                                       " e.g. on the bitbake persistent volume", required=False)
+    parser.add_argument('-z', '--blob-cache-size', type=parse_size,
+                        help="The max size of the blob cache, e.g. 20G, the least recently used blobs"
+                             " are evicted to keep the cache under it. Unlimited if not specified",
+                        required=False)
+
     params = parser.parse_args()
     return params
 
@@ -94,7 +108,8 @@ if __name__ == '__main__':
         with open(params.token_file) as f:
             token = f.read().strip()
 
-        pull_target_apps(target, params.oci_store_path, token, registry_creds)
+        pull_target_apps(target, params.oci_store_path, token, registry_creds,
+                         params.blob_cache_dir, params.blob_cache_size)
         logger.info(f'Apps Preloading succeeded; Target {target.name}, shortlist {target.shortlist}')
     except Exception as exc:
         logger.error('Apps preloading failed: {}\n{}'.format(exc, traceback.format_exc()))
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# Measures throughput of the apps fetchers against a local registry stand-in serving a synthetic Target
+# of N apps with M images each, every image consisting of K layers.
+# Run from the repo root: H_RUN_URL=https://api.foundries.io PYTHONPATH=./ python3 tests/bench_apps_fetch.py -h
+#
+# Modes:
+#   oci     - `SkopeAppFetcher.fetch_target()`, fetches apps and their images to OCI layouts (`apps/fetch.py`)
+#   compose - `TargetAppsFetcher.fetch_target_apps()`, fetches and extracts apps (docker daemon based assemble)
+#   layers  - `DockerRegistryClient.download_layers()` of each image manifest of the Target
+#
+# External tools are not part of the measured fetch path, so `docker compose config` and `skopeo login`
+# are not invoked.
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+os.environ.setdefault('H_RUN_URL', 'https://api.foundries.io')
+
+from apps.disk_usage import DiskUsage  # noqa: E402
+from apps.docker_registry_client import DockerRegistryClient  # noqa: E402
+from apps.target_apps_fetcher import TargetAppsFetcher, SkopeAppFetcher  # noqa: E402
+from factory_client import FactoryClient  # noqa: E402
+from fixtures import SyntheticTarget, local_factory_registry, tree_digest  # noqa: E402
+from local_registry import LocalRegistry  # noqa: E402
+
+
+logger = logging.getLogger(__name__)
+
+
+def check_blobs(root_dir):
+    # Each blob stored in a blob dir must match its digest
+    for dir_path, _, file_names in os.walk(root_dir):
+        if os.path.basename(dir_path) != 'sha256':
+            continue
+        for name in file_names:
+            with open(os.path.join(dir_path, name), 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() != name:
+                    raise Exception('Blob does not match its digest: {}'.format(os.path.join(dir_path, name)))
+
+
+def fetch(mode, target: FactoryClient.Target, image_uris, work_dir, max_workers=None):
+    token = 'bench-token'
+    if mode == 'oci':
+        fetcher = SkopeAppFetcher(token, work_dir, max_workers=max_workers,
+                                  image_copier=SkopeAppFetcher.NativeImageCopier)
+        fetcher.fetch_target(target, force=True)
+    elif mode == 'compose':
+        fetcher = TargetAppsFetcher(token, work_dir, max_workers=max_workers)
+        fetcher.fetch_target_apps(target, force=True)
+    elif mode == 'layers':
+        client = DockerRegistryClient(token, max_workers=max_workers)
+        for image in image_uris:
+            index = client.download_manifest(image)
+            platform = [m for m in index['manifests'] if m['platform']['architecture'] == target.platform][0]
+            image_uri = '{}@{}'.format(image.split('@')[0], platform['digest'])
+            layers_dir = os.path.join(work_dir, platform['digest'][len('sha256:'):])
+            os.makedirs(layers_dir)
+            client.download_layers(image_uri, dst_dir=layers_dir)
+    else:
+        raise Exception('Unsupported fetch mode: {}'.format(mode))
+
+
+def measure(mode, target: FactoryClient.Target, image_uris, work_dir, max_workers=None):
+    # Returns wall time and peak RSS of the fetch, and the fetched tree digest
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.monotonic()
+    fetch(mode, target, image_uris, work_dir, max_workers)
+    wall_time = time.monotonic() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    check_blobs(work_dir)
+    # neither the fetcher's blob pool nor the fetched apps size is a part of the fetch result
+    digest, files, size = tree_digest(work_dir, exclude=[SkopeAppFetcher.BlobPoolDir,
+                                                         target.name + DiskUsage.SidecarFileExt])
+    return {'wall_time': wall_time, 'peak_rss_kib': peak_rss, 'start_rss_kib': start_rss,
+            'tree_digest': digest, 'files': files, 'tree_bytes': size}
+
+
+def _measure_in_child(queue, *args):
+    try:
+        queue.put(measure(*args))
+    except Exception as exc:
+        queue.put(exc)
+
+
+def run(registry: LocalRegistry, synthetic_target: SyntheticTarget, modes, repeat=1, max_workers=None,
+        isolate=True):
+    # `isolate` - run each fetch in a forked process, so its peak RSS is measured separately
+    results = []
+    with local_factory_registry(registry):
+        for mode in modes:
+            for run_numb in range(repeat):
+                with TemporaryDirectory() as work_dir:
+                    registry.reset_stats()
+                    args = (mode, synthetic_target.target, synthetic_target.images, work_dir, max_workers)
+                    if isolate:
+                        ctx = multiprocessing.get_context('fork')
+                        queue = ctx.Queue()
+                        child = ctx.Process(target=_measure_in_child, args=(queue,) + args)
+                        child.start()
+                        result = queue.get()
+                        child.join()
+                        if isinstance(result, Exception):
+                            raise result
+                    else:
+                        result = measure(*args)
+                    result.update(registry.stats)
+                    result.update({'mode': mode, 'run': run_numb})
+                    results.append(result)
+    return results
+
+
+def summarize(results):
+    summary = {}
+    for mode in sorted(set(r['mode'] for r in results)):
+        runs = [r for r in results if r['mode'] == mode]
+        digests = set(r['tree_digest'] for r in runs)
+        if len(digests) != 1:
+            raise Exception('Fetch results differ between runs; mode: {}, tree digests: {}'.format(mode, digests))
+        summary[mode] = {
+            'wall_time': min(r['wall_time'] for r in runs),
+            'requests': max(r['requests'] for r in runs),
+            'requests_by_kind': runs[-1]['requests_by_kind'],
+            'bytes_sent': max(r['bytes_sent'] for r in runs),
+            'throttled': max(r['throttled'] for r in runs),
+            'peak_rss_kib': max(r['peak_rss_kib'] for r in runs),
+            'tree_digest': digests.pop(),
+            'files': runs[0]['files'],
+            'tree_bytes': runs[0]['tree_bytes'],
+        }
+    return summary
+
+
+def compare(summary, baseline, max_slowdown, exact_counts=True):
+    # Returns regressions against the baseline summary of the same scenario.
+    # The number of requests and bytes moved vary if requests are throttled, so they are compared
+    # only if `exact_counts` is set.
+    regressions = []
+    for mode, result in summary.items():
+        base = baseline.get(mode)
+        if not base:
+            continue
+        if result['tree_digest'] != base['tree_digest']:
+            regressions.append('{}: fetched tree differs from the baseline one'.format(mode))
+        if result['wall_time'] > base['wall_time'] * max_slowdown:
+            regressions.append('{}: wall time {:.2f}s exceeds the baseline {:.2f}s by more than {}x'
+                               .format(mode, result['wall_time'], base['wall_time'], max_slowdown))
+        if not exact_counts:
+            continue
+        if result['requests'] > base['requests']:
+            regressions.append('{}: {} requests are made, the baseline is {}'
+                               .format(mode, result['requests'], base['requests']))
+        if result['bytes_sent'] > base['bytes_sent']:
+            regressions.append('{}: {} bytes are moved, the baseline is {}'
+                               .format(mode, result['bytes_sent'], base['bytes_sent']))
+    return regressions
+
+
+def get_args():
+    parser = argparse.ArgumentParser('Benchmark fetching of a synthetic Target\'s apps from a local registry')
+    parser.add_argument('-n', '--apps', type=int, default=4, help='Number of Target apps')
+    parser.add_argument('-m', '--images', type=int, default=3, help='Number of images per app')
+    parser.add_argument('-k', '--layers', type=int, default=4, help='Number of layers per image')
+    parser.add_argument('-s', '--layer-size', type=int, default=256 * 1024, help='Layer size in bytes')
+    parser.add_argument('--shared-layers', type=int, default=1,
+                        help='Number of base layers shared by all images')
+    parser.add_argument('--arch', default='arm64', choices=SyntheticTarget.OEArch.keys())
+    parser.add_argument('--modes', default='oci,compose,layers', help='Comma separated list of fetch modes')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of runs per mode')
+    parser.add_argument('-w', '--fetch-workers', type=int, default=None)
+    parser.add_argument('-p', '--port', type=int, default=5117,
+                        help='Registry port, it is a part of image URIs, so results are comparable for the same port')
+    parser.add_argument('--latency', type=float, default=0, help='Registry latency per request in seconds')
+    parser.add_argument('--bandwidth', type=int, default=None, help='Registry bandwidth in bytes per second')
+    parser.add_argument('--throttle-every', type=int, default=0,
+                        help='Respond to each N-th request with HTTP 429')
+    parser.add_argument('-o', '--json-out', help='File to store the benchmark results to')
+    parser.add_argument('-b', '--baseline', help='Results of a previous run to check for regressions against')
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help='The max allowed ratio of wall time to the baseline one')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser.parse_args()
+
+
+def main(args):
+    logging.basicConfig(format='%(asctime)s %(levelname)s: %(module)s: %(message)s',
+                        level=logging.INFO if args.verbose else logging.WARNING)
+    scenario = {k: getattr(args, k) for k in ['apps', 'images', 'layers', 'layer_size', 'shared_layers', 'arch',
+                                              'fetch_workers', 'port', 'latency', 'bandwidth', 'throttle_every']}
+    with LocalRegistry(latency=args.latency, bandwidth=args.bandwidth, throttle_every=args.throttle_every,
+                       port=args.port) as reg:
+        synthetic_target = SyntheticTarget(reg, args.apps, args.images, args.layers, args.layer_size,
+                                           args.shared_layers, args.arch)
+        summary = summarize(run(reg, synthetic_target, args.modes.split(','), args.repeat, args.fetch_workers))
+
+    print('{:<8} {:>9} {:>9} {:>12} {:>9} {:>12} {:>7}  {}'.format(
+        'mode', 'time, s', 'requests', 'bytes', 'throttled', 'peak rss, K', 'files', 'tree digest'))
+    for mode, r in summary.items():
+        print('{:<8} {:>9.3f} {:>9} {:>12} {:>9} {:>12} {:>7}  {}'.format(
+            mode, r['wall_time'], r['requests'], r['bytes_sent'], r['throttled'], r['peak_rss_kib'], r['files'],
+            r['tree_digest'][:16]))
+
+    report = {'scenario': scenario, 'results': summary}
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['scenario'] != scenario:
+            print('The baseline scenario differs from the current one: {}'.format(baseline['scenario']))
+            return 1
+        regressions = compare(summary, baseline['results'], args.max_slowdown, not args.throttle_every)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(get_args()))
@@ -0,0 +1,170 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+#
+# The fixtures of the apps fetch tests and benchmark: a synthetic Target served by a local registry that stands
+# in for the factory registry.
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import tarfile
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+from apps.compose_apps import ComposeApps
+from apps.docker_registry_client import DockerRegistryClient
+from factory_client import FactoryClient
+from local_registry import LocalRegistry
+
+
+class SyntheticTarget:
+    Factory = 'factory'
+    OEArch = {'arm64': 'aarch64', 'amd64': 'x86_64', 'arm': 'arm'}
+    ImageManifestType = 'application/vnd.docker.distribution.manifest.v2+json'
+    ImageIndexType = 'application/vnd.docker.distribution.manifest.list.v2+json'
+    LayerType = 'application/vnd.docker.image.rootfs.diff.tar.gzip'
+    FsBlockSize = 4096
+
+    def __init__(self, registry: LocalRegistry, apps=4, images=3, layers=4, layer_size=256 * 1024,
+                 shared_layers=1, arch='arm64', seed=0, layers_meta=True):
+        self._registry = registry
+        self._layers_meta = layers_meta
+        self._rand = random.Random(seed)
+        self.arch = arch
+        self.images = []
+        # image uri -> layer blobs
+        self.image_layers = {}
+        # the base layers shared by all images of the Target
+        self._shared_layers = [self._rand.randbytes(layer_size) for _ in range(min(shared_layers, layers))]
+        apps_json = {}
+        for app in range(apps):
+            app_name = 'app-{}'.format(app)
+            app_images = [self._push_image('{}-img-{}'.format(app_name, i), layers, layer_size)
+                          for i in range(images)]
+            self.images += app_images
+            apps_json[app_name] = {'uri': self._push_app(app_name, app_images)}
+
+        self.name = '{}-lmp-1'.format(self.Factory)
+        self.json = {'custom': {'arch': self.OEArch[arch], 'tags': ['main'], 'docker_compose_apps': apps_json}}
+
+    @classmethod
+    def layer_usage(cls, size):
+        return (size + cls.FsBlockSize - 1) // cls.FsBlockSize * cls.FsBlockSize + 2 * cls.FsBlockSize
+
+    @property
+    def target(self):
+        return FactoryClient.Target(self.name, json.loads(json.dumps(self.json)))
+
+    def _push_image(self, name, layers, layer_size):
+        repo = '{}/{}'.format(self.Factory, name)
+        layer_blobs = self._shared_layers + [self._rand.randbytes(layer_size)
+                                             for _ in range(layers - len(self._shared_layers))]
+        manifests = []
+        for arch in sorted({self.arch, 'amd64'}):
+            config = json.dumps({'architecture': arch, 'os': 'linux', 'image': name}).encode()
+            manifest = {
+                'schemaVersion': 2,
+                'mediaType': self.ImageManifestType,
+                'config': {'mediaType': 'application/vnd.docker.container.image.v1+json',
+                           'digest': self._registry.push_blob(repo, config), 'size': len(config)},
+                'layers': [{'mediaType': self.LayerType, 'digest': self._registry.push_blob(repo, layer),
+                            'size': len(layer)} for layer in layer_blobs]
+            }
+            manifest_data = json.dumps(manifest).encode()
+            manifests.append({'mediaType': self.ImageManifestType,
+                              'digest': self._registry.push_manifest(repo, manifest_data),
+                              'size': len(manifest_data), 'platform': {'architecture': arch, 'os': 'linux'}})
+        index_digest = self._registry.push_manifest(
+            repo, {'schemaVersion': 2, 'mediaType': self.ImageIndexType, 'manifests': manifests})
+        image = '{}/{}@{}'.format(self._registry.host, repo, index_digest)
+        self.image_layers[image] = layer_blobs
+        return image
+
+    def _push_app(self, name, images):
+        repo = '{}/{}'.format(self.Factory, name)
+        compose = {'services': {'srv-{}'.format(i): {'image': image} for i, image in enumerate(images)}}
+        archive = io.BytesIO()
+        # no timestamps, so the app digest is the same for the same scenario
+        with gzip.GzipFile(fileobj=archive, mode='wb', mtime=0) as gz, tarfile.open(fileobj=gz, mode='w') as t:
+            for file_name, data in [('docker-compose.yml', json.dumps(compose, indent=2).encode()),
+                                    ('config/settings.env', self._rand.randbytes(1024).hex().encode())]:
+                ti = tarfile.TarInfo(file_name)
+                ti.size = len(data)
+                t.addfile(ti, io.BytesIO(data))
+        archive = archive.getvalue()
+        app_layers = {'sha256:' + hashlib.sha256(layer).hexdigest(): len(layer)
+                      for image in images for layer in self.image_layers[image]}
+        # the layers are not real tarballs, so their "extracted" usage is made up
+        layers_meta = json.dumps({self.arch: {
+            'fs_block_size': self.FsBlockSize,
+            'layers': {digest: {'size': size, 'usage': self.layer_usage(size)}
+                       for digest, size in app_layers.items()} if self._layers_meta else {}}}).encode()
+        layers_index = json.dumps({
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.oci.image.index.v1+json',
+            'manifests': [{'mediaType': self.LayerType, 'digest': digest, 'size': size}
+                          for digest, size in app_layers.items()]
+        }).encode()
+        config = b'{}'
+        manifest = {
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.oci.image.manifest.v1+json',
+            'config': {'mediaType': 'application/vnd.oci.image.config.v1+json',
+                       'digest': self._registry.push_blob(repo, config), 'size': len(config)},
+            'layers': [
+                {'mediaType': 'application/octet-stream', 'digest': self._registry.push_blob(repo, archive),
+                 'size': len(archive)},
+                {'mediaType': 'application/octet-stream', 'digest': self._registry.push_blob(repo, layers_meta),
+                 'size': len(layers_meta), 'annotations': {'layers-meta': 'v1'}},
+            ],
+            'manifests': [
+                {'mediaType': 'application/vnd.oci.image.index.v1+json',
+                 'digest': self._registry.push_manifest(repo, layers_index),
+                 'size': len(layers_index), 'platform': {'architecture': self.arch, 'os': 'linux'}}
+            ]
+        }
+        return '{}/{}@{}'.format(self._registry.host, repo, self._registry.push_manifest(repo, manifest))
+
+
+def tree_digest(root_dir, exclude=()):
+    # A digest of the directory tree content (paths, file data and symlinks), metadata is ignored
+    hasher = hashlib.sha256()
+    files = 0
+    size = 0
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        if dir_path == root_dir:
+            dir_names[:] = [d for d in dir_names if d not in exclude]
+            file_names = [f for f in file_names if f not in exclude]
+        dir_names.sort()
+        for name in sorted(file_names):
+            path = os.path.join(dir_path, name)
+            hasher.update(os.path.relpath(path, root_dir).encode() + b'\0')
+            if os.path.islink(path):
+                hasher.update(b'->' + os.readlink(path).encode())
+                continue
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(DockerRegistryClient.BlobChunkSize)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    size += len(chunk)
+            files += 1
+    return hasher.hexdigest(), files, size
+
+
+@contextmanager
+def local_factory_registry(registry: LocalRegistry):
+    # The factory registry is served by the given local registry
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(DockerRegistryClient, 'DefaultRegistryHost', registry.host))
+        stack.enter_context(mock.patch.object(DockerRegistryClient, 'DefaultRegistrySchema', 'http'))
+        stack.enter_context(mock.patch.object(DockerRegistryClient, 'login'))
+        stack.enter_context(mock.patch('apps.compose_apps.cmd_exe'))
+        # the apps are not validated, so their validation is not cached either
+        stack.enter_context(mock.patch.dict(os.environ, {ComposeApps.App.ConfigCacheDirEnv: ''}))
+        yield
+
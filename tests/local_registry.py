@@ -0,0 +1,272 @@
+# Copyright (c) 2026 Foundries.io
+# SPDX-License-Identifier: BSD-3-Clause
+
+import base64
+import collections
+import hashlib
+import json
+import re
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class LocalRegistry:
+    # An in-process stand-in of an OCI distribution registry (https://distribution.github.io/distribution/spec/api/)
+    # that serves manifests, indexes and blobs over plain HTTP. Access to repositories is granted by bearer tokens
+    # obtained via the token flow (`www-authenticate` realm/service/scope). Latency, bandwidth limit and
+    # throttling (HTTP 429) can be injected to mimic a remote registry.
+    Service = 'local-registry'
+    TokenPath = '/token'
+    TokenExpiresIn = 300
+    ChunkSize = 64 * 1024
+    UriPattern = re.compile(r'^/v2/(?P<name>.+)/(?P<kind>manifests|blobs)/(?P<ref>[^/]+)$')
+
+    def __init__(self, latency=0, bandwidth=None, throttle_every=0, retry_after=0, credentials=None, port=0):
+        # latency - a delay in seconds added to each request
+        # bandwidth - the max number of bytes per second sent to all clients
+        # throttle_every - every N-th request is responded with HTTP 429
+        # credentials - (user, password) required to get a token, any are accepted if not specified
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.credentials = credentials
+        self.port = port
+        # repo name -> {digest -> (media type, data)}
+        self._manifests = collections.defaultdict(dict)
+        # repo name -> {digest -> data}
+        self._blobs = collections.defaultdict(dict)
+        # token -> repos
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._next_send_time = 0
+        self._server = None
+        self._thread = None
+        self.reset_stats()
+
+    @property
+    def host(self):
+        return '{}:{}'.format(*self._server.server_address[:2])
+
+    @property
+    def url(self):
+        return 'http://' + self.host
+
+    def start(self):
+        registry = self
+
+        class Handler(RegistryRequestHandler):
+            pass
+        Handler.registry = registry
+        self._server = RegistryServer(('127.0.0.1', self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='local-registry', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def push_blob(self, repo, data: bytes):
+        digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._blobs[repo][digest] = data
+        return digest
+
+    def push_manifest(self, repo, manifest, media_type=None):
+        data = manifest if isinstance(manifest, bytes) else json.dumps(manifest).encode()
+        if not media_type:
+            media_type = json.loads(data).get('mediaType', 'application/vnd.oci.image.manifest.v1+json')
+        digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._manifests[repo][digest] = (media_type, data)
+        return digest
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = collections.Counter()
+            self.bytes_sent = 0
+            self.throttled = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {'requests': sum(self.requests.values()), 'requests_by_kind': dict(self.requests),
+                    'bytes_sent': self.bytes_sent, 'throttled': self.throttled}
+
+    def _count_request(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+            total = sum(self.requests.values())
+            throttle = self.throttle_every and total % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+            return throttle
+
+    def _issue_token(self, scopes):
+        repos = set()
+        for scope in scopes:
+            # repository:<name>:<actions>
+            resource_type, name_actions = scope.split(':', 1)
+            name, actions = name_actions.rsplit(':', 1)
+            if resource_type == 'repository' and 'pull' in actions.split(','):
+                repos.add(name)
+        token = secrets.token_hex(16)
+        with self._lock:
+            self._tokens[token] = repos
+        return token
+
+    def _is_authorized(self, token, repo):
+        with self._lock:
+            return repo in self._tokens.get(token, ())
+
+    def _find(self, kind, repo, ref):
+        with self._lock:
+            if kind == 'manifests':
+                return self._manifests.get(repo, {}).get(ref)
+            data = self._blobs.get(repo, {}).get(ref)
+            return ('application/octet-stream', data) if data is not None else None
+
+    def _wait_for_bandwidth(self, size):
+        if not self.bandwidth:
+            return
+        with self._lock:
+            start = max(time.monotonic(), self._next_send_time)
+            self._next_send_time = start + size / self.bandwidth
+        delay = self._next_send_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _sent(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+
+class RegistryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients are free to drop connections, e.g. when their connection pool is full
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class RegistryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    registry: LocalRegistry = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def _handle(self, send_body):
+        url = urlparse(self.path)
+        if url.path == LocalRegistry.TokenPath:
+            kind = 'token'
+        elif url.path == '/v2/':
+            kind = 'ping'
+        else:
+            match = LocalRegistry.UriPattern.match(url.path)
+            kind = match.group('kind')[:-1] if match else 'unknown'
+
+        if self.registry.latency:
+            time.sleep(self.registry.latency)
+        if self.registry._count_request(kind):
+            self._send(429, b'{"errors": [{"code": "TOOMANYREQUESTS"}]}',
+                       headers={'Retry-After': str(self.registry.retry_after)})
+            return
+
+        if kind == 'token':
+            self._handle_token(parse_qs(url.query))
+        elif kind == 'ping':
+            self._send_challenge()
+        elif kind == 'unknown':
+            self._send(404, b'{"errors": [{"code": "NAME_UNKNOWN"}]}')
+        else:
+            match = LocalRegistry.UriPattern.match(url.path)
+            self._handle_content(match.group('name'), match.group('kind'), match.group('ref'), send_body)
+
+    def _handle_token(self, params):
+        if self.registry.credentials:
+            auth = self.headers.get('Authorization', '')
+            expected = 'Basic ' + base64.b64encode('{}:{}'.format(*self.registry.credentials).encode()).decode()
+            if auth != expected:
+                self._send(401, b'{"errors": [{"code": "UNAUTHORIZED"}]}')
+                return
+        if params.get('service', [None])[0] != LocalRegistry.Service:
+            self._send(400, b'{"errors": [{"code": "UNSUPPORTED"}]}')
+            return
+        token = self.registry._issue_token(params.get('scope', []))
+        self._send(200, json.dumps({'token': token, 'expires_in': LocalRegistry.TokenExpiresIn}).encode(),
+                   content_type='application/json')
+
+    def _send_challenge(self, repo=None):
+        challenge = 'Bearer realm="{}{}",service="{}"'.format(self.registry.url, LocalRegistry.TokenPath,
+                                                             LocalRegistry.Service)
+        if repo:
+            challenge += ',scope="repository:{}:pull"'.format(repo)
+        self._send(401, b'{"errors": [{"code": "UNAUTHORIZED"}]}', headers={'www-authenticate': challenge})
+
+    def _handle_content(self, repo, kind, ref, send_body):
+        # the auth scheme is case-insensitive
+        auth_scheme, _, token = self.headers.get('Authorization', '').partition(' ')
+        if auth_scheme.lower() != 'bearer' or not self.registry._is_authorized(token.strip(), repo):
+            self._send_challenge(repo)
+            return
+        content = self.registry._find(kind, repo, ref)
+        if content is None:
+            self._send(404, b'{"errors": [{"code": "%s_UNKNOWN"}]}' % kind.upper()[:-1].encode())
+            return
+
+        media_type, data = content
+        headers = {'Docker-Content-Digest': ref}
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header and kind == 'blobs':
+            # bytes=<start>-[<end>]
+            start, end = range_header[len('bytes='):].split('-')
+            start = int(start)
+            end = int(end) if end else len(data) - 1
+            if start >= len(data):
+                self._send(416, b'', headers={'Content-Range': 'bytes */{}'.format(len(data))})
+                return
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(data))
+            data = data[start:end + 1]
+            status = 206
+        self._send(status, data, content_type=media_type, headers=headers, send_body=send_body)
+
+    def _send(self, status, body, content_type='application/json', headers=None, send_body=True):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not send_body:
+            return
+        try:
+            for offset in range(0, len(body), LocalRegistry.ChunkSize):
+                chunk = body[offset:offset + LocalRegistry.ChunkSize]
+                self.registry._wait_for_bandwidth(len(chunk))
+                self.wfile.write(chunk)
+                self.registry._sent(len(chunk))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
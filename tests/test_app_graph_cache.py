@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+import requests_mock
+
+from apps.app_graph_cache import AppGraphCache
+from apps.docker_registry_client import DockerRegistryClient
+
+
+def digest(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+class AppGraphCacheTest(unittest.TestCase):
+    RegistryHost = 'registry.example.com'
+
+    def setUp(self):
+        self.manifest = b'{"layers": [], "manifests": []}'
+        self.image_manifest = b'{"config": {}, "layers": []}'
+        self.app_uri = '{}/factory/app@{}'.format(self.RegistryHost, digest(self.manifest))
+
+    def test_store_and_load(self):
+        with TemporaryDirectory() as d:
+            cache = AppGraphCache(d)
+            cache.add(digest(self.manifest), self.manifest)
+            cache.add(digest(self.image_manifest), self.image_manifest)
+            cache.store(self.app_uri, [digest(self.manifest), digest(self.image_manifest)])
+
+            cache = AppGraphCache(d)
+            self.assertTrue(cache.load(self.app_uri))
+            self.assertEqual(self.manifest, cache.get(digest(self.manifest)))
+            self.assertEqual(self.image_manifest, cache.get(digest(self.image_manifest)))
+            self.assertIsNone(cache.get('sha256:' + '0' * 64))
+            self.assertEqual(2, cache.hits)
+            self.assertEqual(1, cache.misses)
+
+    def test_corrupted_graph_is_ignored(self):
+        with TemporaryDirectory() as d:
+            cache = AppGraphCache(d)
+            cache.add(digest(self.manifest), self.manifest)
+            cache.store(self.app_uri, [digest(self.manifest)])
+            graph_file = os.path.join(d, digest(self.manifest)[len('sha256:'):] + AppGraphCache.GraphFileExt)
+            with open(graph_file) as f:
+                graph = json.load(f)
+            graph['nodes'][digest(self.manifest)] = graph['nodes'][digest(self.manifest)][:-4]
+            with open(graph_file, 'w') as f:
+                json.dump(graph, f)
+
+            cache = AppGraphCache(d)
+            self.assertFalse(cache.load(self.app_uri))
+            self.assertIsNone(cache.get(digest(self.manifest)))
+
+    def test_manifest_is_served_from_cache(self):
+        with TemporaryDirectory() as d:
+            cache = AppGraphCache(d)
+            client = DockerRegistryClient('token', registry_host=self.RegistryHost, graph_cache=cache)
+            uri = DockerRegistryClient.parse_image_uri(self.app_uri)
+            with requests_mock.Mocker() as m:
+                m.get('https://{}/v2/'.format(self.RegistryHost))
+                m.get('https://{}/v2/factory/app/manifests/{}'.format(self.RegistryHost, uri.digest),
+                      content=self.manifest)
+                self.assertEqual(self.manifest, client.pull_manifest(uri))
+            cache.store(self.app_uri, [uri.digest])
+
+            cache = AppGraphCache(d)
+            client = DockerRegistryClient('token', registry_host=self.RegistryHost, graph_cache=cache)
+            cache.load(self.app_uri)
+            with requests_mock.Mocker() as m:
+                self.assertEqual(self.manifest, client.pull_manifest(uri))
+                self.assertEqual(0, m.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import glob
+import hashlib
+import os
+import time
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from apps.blob_pool import BlobPool, parse_size
+from apps.target_apps_fetcher import SkopeAppFetcher
+from factory_client import FactoryClient
+from fixtures import SyntheticTarget, local_factory_registry, tree_digest
+from local_registry import LocalRegistry
+
+
+class BlobPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.blob = os.urandom(1024)
+        self.digest = 'sha256:' + hashlib.sha256(self.blob).hexdigest()
+
+    def _fetch(self, path):
+        self.fetched += 1
+        with open(path, 'wb') as f:
+            f.write(self.blob)
+
+    def test_blob_is_fetched_once(self):
+        self.fetched = 0
+        with TemporaryDirectory() as d:
+            pool = BlobPool(os.path.join(d, 'pool'))
+            dsts = [os.path.join(d, 'dst-{}'.format(i)) for i in range(3)]
+            for dst in dsts:
+                pool.get(self.digest, dst, self._fetch)
+            self.assertEqual(1, self.fetched)
+            for dst in dsts:
+                self.assertTrue(os.path.samefile(pool.path(self.digest), dst))
+            self.assertEqual((1, 2, 3), (pool.downloaded, pool.reused, pool.hardlinks))
+
+    def test_copy_if_link_fails(self):
+        self.fetched = 0
+        with TemporaryDirectory() as d, mock.patch('os.link', side_effect=OSError(18, 'Invalid cross-device link')):
+            pool = BlobPool(os.path.join(d, 'pool'))
+            dst = os.path.join(d, 'dst')
+            pool.get(self.digest, dst, self._fetch)
+            self.assertFalse(os.path.samefile(pool.path(self.digest), dst))
+            with open(dst, 'rb') as f:
+                self.assertEqual(self.blob, f.read())
+            self.assertEqual(0, pool.hardlinks)
+            self.assertEqual(1, pool.reflinks + pool.copies)
+
+    def test_adopt(self):
+        with TemporaryDirectory() as d:
+            pool = BlobPool(os.path.join(d, 'pool'))
+            blob_files = [os.path.join(d, 'blob-{}'.format(i)) for i in range(2)]
+            for blob_file in blob_files:
+                with open(blob_file, 'wb') as f:
+                    f.write(self.blob)
+                pool.adopt(self.digest, blob_file)
+                self.assertTrue(os.path.samefile(pool.path(self.digest), blob_file))
+
+    def test_lru_eviction(self):
+        with TemporaryDirectory() as d:
+            pool = BlobPool(os.path.join(d, 'pool'), max_size=2 * 1024 + 512)
+            now = time.time()
+            blobs = []
+            for i in range(4):
+                blob = os.urandom(1024)
+                digest = 'sha256:' + hashlib.sha256(blob).hexdigest()
+                pool.put(digest, blob, os.path.join(d, 'dst-{}'.format(i)))
+                blobs.append(digest)
+            # the blobs were used in the reversed order, the first one is the most recently used
+            for i, digest in enumerate(blobs):
+                os.utime(pool.path(digest), (now - i * 60, now))
+            stale_tmp_file = pool.path(blobs[0]) + '.x' + BlobPool.TmpFileSuffix
+            with open(stale_tmp_file, 'wb') as f:
+                f.write(b'partial')
+            os.utime(stale_tmp_file, (now, now - BlobPool.StaleTmpFileAge - 1))
+
+            pool.evict()
+            self.assertEqual(sorted(d[len('sha256:'):] for d in blobs[:2]), sorted(os.listdir(pool.dir)))
+            self.assertEqual(2, pool.evicted)
+            # the evicted blobs are still present in the destinations
+            self.assertEqual(4, len([f for f in os.listdir(d) if f.startswith('dst-')]))
+
+            # a reused blob becomes the most recently used one
+            pool.get(blobs[1], os.path.join(d, 'dst-1'), None)
+            os.utime(pool.path(blobs[0]), (now - 3600, now))
+            pool.max_size = 1024
+            pool.evict()
+            self.assertEqual([blobs[1][len('sha256:'):]], os.listdir(pool.dir))
+
+    def test_parse_size(self):
+        self.assertEqual(1024, parse_size('1024'))
+        self.assertEqual(512 * 1024 * 1024, parse_size('512M'))
+        self.assertEqual(20 * 1024 ** 3, parse_size('20G'))
+        self.assertEqual(int(1.5 * 1024 ** 4), parse_size('1.5tb'))
+
+    def test_no_pool(self):
+        self.fetched = 0
+        with TemporaryDirectory() as d:
+            pool = BlobPool()
+            pool.get(self.digest, os.path.join(d, 'dst'), self._fetch)
+            pool.adopt(self.digest, os.path.join(d, 'dst'))
+            self.assertEqual(['dst'], os.listdir(d))
+
+
+class TargetsBlobSharingTest(unittest.TestCase):
+    def test_blobs_are_fetched_once_per_fetch_dir(self):
+        with LocalRegistry() as registry, local_factory_registry(registry), TemporaryDirectory() as d:
+            synthetic_target = SyntheticTarget(registry, apps=2, images=2, layers=3, layer_size=64 * 1024)
+            fetcher = SkopeAppFetcher('token', d)
+            fetcher.fetch_target(synthetic_target.target, force=True)
+            first_fetch = registry.stats['requests_by_kind']
+
+            registry.reset_stats()
+            target = FactoryClient.Target('another-target', synthetic_target.target.json)
+            fetcher.fetch_target(target, force=True)
+            self.assertNotIn('blob', registry.stats['requests_by_kind'])
+            self.assertGreater(first_fetch['blob'], 0)
+
+            # the per-Target layout is not changed, the blobs are hardlinks to the pool
+            self.assertEqual(tree_digest(os.path.join(d, synthetic_target.name))[0],
+                             tree_digest(os.path.join(d, target.name))[0])
+            self.assertEqual({'.blobs', synthetic_target.name, target.name, synthetic_target.name + '.size.json',
+                              target.name + '.size.json'}, set(os.listdir(d)))
+            blobs_dir = os.path.join(d, target.name, SkopeAppFetcher.BlobsDir, 'sha256')
+            for blob in os.listdir(blobs_dir):
+                self.assertTrue(os.path.samefile(os.path.join(d, '.blobs', 'sha256', blob),
+                                                 os.path.join(blobs_dir, blob)))
+            # the app manifest and archive are written once, the app dir's ones are links to the blobs
+            for app_dir in glob.glob(os.path.join(d, target.name, 'apps', '*', '*')):
+                self.assertTrue(os.path.samefile(os.path.join(blobs_dir, os.path.basename(app_dir)),
+                                                 os.path.join(app_dir, SkopeAppFetcher.ManifestFile)))
+                archive = glob.glob(os.path.join(app_dir, '*' + SkopeAppFetcher.ArchiveFileExt))[0]
+                self.assertTrue(os.path.samefile(os.path.join(blobs_dir, os.path.basename(archive)[:-4]), archive))
+                self.assertTrue(os.path.isfile(os.path.join(app_dir, 'docker-compose.yml')))
+
+    def test_persistent_blob_cache(self):
+        # The blob cache is shared by builds that preload apps to different OCI stores
+        with LocalRegistry() as registry, local_factory_registry(registry), TemporaryDirectory() as d:
+            synthetic_target = SyntheticTarget(registry, apps=2, images=2, layers=3, layer_size=64 * 1024)
+            cache_dir = os.path.join(d, 'cache')
+            for build in range(2):
+                registry.reset_stats()
+                store_dir = os.path.join(d, 'build-{}'.format(build))
+                fetcher = SkopeAppFetcher('token', store_dir, create_target_dir=False, blob_cache_dir=cache_dir,
+                                          blob_cache_size=10 * 1024 * 1024)
+                fetcher.fetch_target(synthetic_target.target, force=True)
+                self.assertEqual(['apps', 'blobs'], sorted(os.listdir(store_dir)))
+            self.assertNotIn('blob', registry.stats['requests_by_kind'])
+            # no size sidecar is written next to the OCI stores
+            self.assertEqual(['build-0', 'build-1', 'cache'], sorted(os.listdir(d)))
+            self.assertEqual(tree_digest(os.path.join(d, 'build-0'))[0], tree_digest(os.path.join(d, 'build-1'))[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,10 +5,12 @@ from apps.compose_apps import ComposeApps
 
 
 import shutil
+import subprocess
 import unittest
 import tempfile
 import os
 import yaml
+from unittest import mock
 
 
 class ComposeAppsTest(unittest.TestCase):
@@ -75,5 +77,105 @@ class ComposeAppsTest(unittest.TestCase):
     #         self.assertIn(image, expected_images)
 
 
+
+class ComposeAppsValidationTest(unittest.TestCase):
+    ComposeAppDesc = '''
+    services:
+      www:
+        image: hub.foundries.io/${FACTORY}/www:${TAG}
+    '''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.apps_root_dir = os.path.join(self.tmp_dir.name, 'apps')
+        for i in range(5):
+            os.makedirs(os.path.join(self.apps_root_dir, 'app-{}'.format(i)))
+            with open(os.path.join(self.apps_root_dir, 'app-{}'.format(i), ComposeApps.App.ComposeFile), 'w') as f:
+                f.write(self.ComposeAppDesc.replace('www', 'www-{}'.format(i)))
+        self.env = mock.patch.dict(os.environ, {ComposeApps.App.ConfigCacheDirEnv: os.path.join(self.tmp_dir.name,
+                                                                                                'cache'),
+                                                ComposeApps.App.ValidatorEnv: ComposeApps.App.DockerValidator,
+                                                'FACTORY': 'factory', 'TAG': 'main'})
+        self.env.start()
+        self.compose_version = mock.patch.object(ComposeApps.App, '_compose_version', '2.29.1')
+        self.compose_version.start()
+
+    def tearDown(self):
+        self.compose_version.stop()
+        self.env.stop()
+        self.tmp_dir.cleanup()
+
+    def test_validation_is_cached(self):
+        with mock.patch('apps.compose_apps.cmd_exe') as cmd:
+            apps = ComposeApps(self.apps_root_dir, quiet=True)
+            self.assertEqual(5, len(apps))
+            # the apps are validated on their first use
+            self.assertEqual(0, cmd.call_count)
+            apps.load()
+            self.assertEqual(5, cmd.call_count)
+            # the unchanged apps are not validated again
+            ComposeApps(self.apps_root_dir, quiet=True).load()
+            self.assertEqual(5, cmd.call_count)
+
+            with open(os.path.join(self.apps_root_dir, 'app-0', ComposeApps.App.ComposeFile), 'a') as f:
+                f.write('    restart: always\n')
+            ComposeApps(self.apps_root_dir, quiet=True).load()
+            self.assertEqual(6, cmd.call_count)
+
+            # the apps refer to the environment variable
+            os.environ['TAG'] = 'devel'
+            ComposeApps(self.apps_root_dir, quiet=True).load()
+            self.assertEqual(11, cmd.call_count)
+            self.assertEqual(['app-{}'.format(i) for i in range(5)], sorted(app.name for app in apps))
+
+            # the apps are validated again by another compose version
+            ComposeApps.App._compose_version = '2.30.0'
+            ComposeApps(self.apps_root_dir, quiet=True).load()
+            self.assertEqual(16, cmd.call_count)
+
+    def test_validation_cache_is_opt_in(self):
+        del os.environ[ComposeApps.App.ConfigCacheDirEnv]
+        with mock.patch('apps.compose_apps.cmd_exe') as cmd:
+            ComposeApps(self.apps_root_dir, quiet=True).load()
+            ComposeApps(self.apps_root_dir, quiet=True).load()
+            self.assertEqual(10, cmd.call_count)
+
+    def test_compose_version(self):
+        ComposeApps.App._compose_version = None
+        with mock.patch('apps.compose_apps.cmd_exe', return_value=b'2.29.1\n') as cmd:
+            ComposeApps(self.apps_root_dir, quiet=True).load()
+            # the version is got once
+            self.assertEqual(1, len([c for c in cmd.call_args_list if 'version' in c.args]))
+            self.assertEqual('2.29.1', ComposeApps.App._compose_version)
+
+    def test_failed_validation_is_not_cached(self):
+        with mock.patch('apps.compose_apps.cmd_exe', side_effect=subprocess.CalledProcessError(1, 'docker')):
+            self.assertRaises(subprocess.CalledProcessError, ComposeApps(self.apps_root_dir).load)
+        with mock.patch('apps.compose_apps.cmd_exe') as cmd:
+            ComposeApps(self.apps_root_dir).load()
+            self.assertEqual(5, cmd.call_count)
+
+    def test_lazy_load(self):
+        with mock.patch('apps.compose_apps.cmd_exe') as cmd:
+            apps = ComposeApps(self.apps_root_dir, quiet=True)
+            app = next(app for app in apps if app.name == 'app-1')
+            self.assertEqual(['hub.foundries.io/factory/www-1:main'], list(app.images(expand_env=True)))
+            # only the used app is validated
+            self.assertEqual(1, cmd.call_count)
+
+    def test_save(self):
+        # the saved compose file is the same as the one dumped by the pure-Python dumper
+        app = ComposeApps(self.apps_root_dir, quiet=True)[0]
+        with mock.patch('apps.compose_apps.cmd_exe'):
+            app.load()
+        app.load()['services']['www-0'] = {'image': 'hub.foundries.io/factory/www:main', 'restart': 'always',
+                                           'ports': ['8080:80'], 'command': ['sh', '-c', 'echo "$$HOME" \'x\'']}
+        app.save()
+        with open(app.file) as f:
+            saved = f.read()
+        self.assertEqual(yaml.dump(app.load(), Dumper=yaml.Dumper), saved)
+        self.assertEqual(app.load(), yaml.safe_load(saved))
+
+
 if __name__ == '__main__':
     unittest.main()
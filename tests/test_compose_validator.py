@@ -0,0 +1,119 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+from apps.compose_apps import ComposeApps
+from apps.compose_validator import ComposeValidator
+
+
+CorpusDir = os.path.join(os.path.dirname(__file__), 'compose_corpus')
+Env = {'FACTORY': 'factory', 'TAG': 'main', 'PATH': os.environ.get('PATH', '')}
+
+
+def corpus(kind):
+    # A corpus case is a compose file or a dir with a compose file and its .env file
+    cases_dir = os.path.join(CorpusDir, kind)
+    for name in sorted(os.listdir(cases_dir)):
+        path = os.path.join(cases_dir, name)
+        yield name, os.path.join(path, ComposeApps.App.ComposeFile) if os.path.isdir(path) else path
+
+
+def docker_compose_available():
+    if not shutil.which('docker'):
+        return False
+    return subprocess.run(['docker', 'compose', 'version'], stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+
+class ComposeValidatorTest(unittest.TestCase):
+    def test_valid_corpus(self):
+        for name, compose_file in corpus('valid'):
+            with self.subTest(case=name):
+                ComposeValidator(Env).validate(compose_file)
+
+    def test_invalid_corpus(self):
+        for name, compose_file in corpus('invalid'):
+            with self.subTest(case=name):
+                self.assertRaises(Exception, ComposeValidator(Env).validate, compose_file)
+
+    def test_interpolation(self):
+        env = dict(Env, GREETING='hi')
+        config = ComposeValidator(env).validate(os.path.join(CorpusDir, 'valid', 'defaults.yml'))
+        nginx = config['services']['nginx']
+        self.assertEqual('nginx:1.19.2-alpine', nginx['image'])
+        self.assertEqual('9999:80', nginx['ports'][0])
+        self.assertEqual(['GREETING=hello', 'LITERAL=$HOME'], nginx['environment'])
+
+        config = ComposeValidator(env).validate(os.path.join(CorpusDir, 'valid', 'nested_default.yml'))
+        self.assertEqual('hub.foundries.io/factory/app:main', config['services']['app']['image'])
+        self.assertEqual('echo ${PATH}', config['services']['app']['command'][2])
+
+        # the environment overrides the .env file
+        compose_file = os.path.join(CorpusDir, 'valid', 'env_file', ComposeApps.App.ComposeFile)
+        config = ComposeValidator(Env).validate(compose_file)
+        self.assertEqual('hub.foundries.io/svc:1.0', config['services']['svc']['image'])
+        config = ComposeValidator(dict(Env, SVC_TAG='2.0')).validate(compose_file)
+        self.assertEqual('hub.foundries.io/svc:2.0', config['services']['svc']['image'])
+
+    def test_yaml_1_2(self):
+        # the compose file is parsed as YAML 1.2, the same way as compose-go does it
+        config = ComposeValidator(Env).validate(os.path.join(CorpusDir, 'valid', 'yaml_1_2.yml'))
+        www = config['services']['www']
+        self.assertEqual('no', www['restart'])
+        self.assertEqual(['22:22'], www['ports'])
+        self.assertEqual({'ENABLED': 'yes', 'VERBOSE': 'off'}, config['services']['sidecar']['environment'])
+
+    def test_save(self):
+        # an app is loaded and saved the same way as before, only the validation parses the file as YAML 1.2
+        for name, compose_file in corpus('valid'):
+            with self.subTest(case=name), tempfile.TemporaryDirectory() as app_dir:
+                shutil.copy(compose_file, os.path.join(app_dir, ComposeApps.App.ComposeFile))
+                with open(compose_file) as f:
+                    expected = yaml.dump(yaml.safe_load(f))
+                app = ComposeApps.App('app', app_dir, validate=False)
+                app.save()
+                with open(app.file) as f:
+                    self.assertEqual(expected, f.read())
+
+    def test_compose_apps(self):
+        with tempfile.TemporaryDirectory() as apps_dir, \
+                mock.patch.dict(os.environ, {ComposeApps.App.ValidatorEnv: ComposeApps.App.NativeValidator}), \
+                mock.patch('apps.compose_apps.cmd_exe') as cmd:
+            os.makedirs(os.path.join(apps_dir, 'app'))
+            shutil.copy(os.path.join(CorpusDir, 'invalid', 'no_image.yml'),
+                        os.path.join(apps_dir, 'app', ComposeApps.App.ComposeFile))
+            self.assertRaises(Exception, ComposeApps(apps_dir).load)
+            shutil.copy(os.path.join(CorpusDir, 'valid', 'extensions.yml'),
+                        os.path.join(apps_dir, 'app', ComposeApps.App.ComposeFile))
+            self.assertEqual(['app'], [app.name for app in ComposeApps(apps_dir).load()])
+            # the docker CLI is not invoked
+            cmd.assert_not_called()
+
+    @unittest.skipUnless(docker_compose_available(), 'docker compose is not available')
+    def test_conformance(self):
+        # The validator accepts and rejects the same corpus files as `docker compose config` does
+        for name, compose_file in list(corpus('valid')) + list(corpus('invalid')):
+            with self.subTest(case=name):
+                with tempfile.TemporaryDirectory() as app_dir:
+                    shutil.copy(compose_file, os.path.join(app_dir, ComposeApps.App.ComposeFile))
+                    env_file = os.path.join(os.path.dirname(compose_file), ComposeValidator.EnvFile)
+                    if compose_file.endswith(ComposeApps.App.ComposeFile) and os.path.exists(env_file):
+                        shutil.copy(env_file, app_dir)
+                    cli = subprocess.run(['docker', 'compose', '-f', ComposeApps.App.ComposeFile, 'config',
+                                          '--quiet'], cwd=app_dir, env=Env, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL).returncode == 0
+                    try:
+                        ComposeValidator(Env).validate(os.path.join(app_dir, ComposeApps.App.ComposeFile))
+                        native = True
+                    except Exception:
+                        native = False
+                    self.assertEqual(cli, native)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import unittest
+from tempfile import TemporaryDirectory
+
+from apps.disk_usage import DiskUsage
+from apps.target_apps_fetcher import SkopeAppFetcher
+from fixtures import SyntheticTarget, local_factory_registry
+from local_registry import LocalRegistry
+
+
+def du(path):
+    return int(subprocess.check_output(['du', '-sk', path]).split()[0]) * 1024
+
+
+class DiskUsageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, 'root')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, path, size):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_usage(self):
+        usage = DiskUsage(self.root)
+        usage.add(self._write(os.path.join(self.root, 'a', 'b', 'file'), 10000))
+        usage.add(self._write(os.path.join(self.root, 'a', 'small'), 10))
+        os.link(os.path.join(self.root, 'a', 'small'), os.path.join(self.root, 'link'))
+        usage.add(os.path.join(self.root, 'link'))
+        os.symlink('a/small', os.path.join(self.root, 'symlink'))
+        usage.add(os.path.join(self.root, 'symlink'))
+        # the files, the hardlink is counted once, and the dirs up to the root
+        self.assertEqual(6, usage.files)
+        self.assertEqual(du(self.root), usage.usage)
+
+        # a file that's added again is counted once, a file that has grown is refreshed
+        usage.add(self._write(os.path.join(self.root, 'a', 'small'), 100000))
+        self.assertEqual(6, usage.files)
+        self.assertEqual(du(self.root), usage.usage)
+
+        # a file outside the root doesn't add its parent dirs
+        usage.add(self._write(os.path.join(self.tmp_dir.name, 'outside'), 10))
+        self.assertEqual(7, usage.files)
+
+    def test_tree(self):
+        for i in range(10):
+            self._write(os.path.join(self.root, 'dir-{}'.format(i % 3), 'file-{}'.format(i)), 1000 * i)
+        os.makedirs(os.path.join(self.root, 'empty'))
+        usage = DiskUsage(self.root)
+        usage.add_tree(self.root)
+        self.assertEqual(du(self.root), usage.usage)
+
+        usage.discard(os.path.join(self.root, 'dir-0'))
+        self.assertEqual(du(self.root) - du(os.path.join(self.root, 'dir-0')), usage.usage)
+
+        sidecar = os.path.join(self.tmp_dir.name, 'root.size.json')
+        self.assertIsNone(DiskUsage.load(sidecar))
+        usage.save(sidecar)
+        self.assertEqual(usage.usage, DiskUsage.load(sidecar))
+
+    def test_fetched_apps(self):
+        with LocalRegistry() as registry, local_factory_registry(registry):
+            target = SyntheticTarget(registry, apps=3, images=2, layers=3, layer_size=10000)
+            fetcher = SkopeAppFetcher('token', self.root)
+            fetcher.fetch_target(target.target, force=True)
+            self.assertEqual(du(fetcher.target_dir(target.name)), fetcher.get_target_apps_size(target.target))
+            # the size is saved next to the Target dir, so it's not archived along with the fetched apps
+            self.assertEqual(fetcher.get_target_apps_size(target.target),
+                             SkopeAppFetcher('token', self.root).get_target_apps_size(target.target))
+            self.assertEqual(os.path.join(self.root, target.name + '.size.json'), fetcher.size_file(target.name))
+
+            # the already fetched apps are accounted too
+            fetcher.fetch_target(target.target)
+            self.assertEqual(du(fetcher.target_dir(target.name)), fetcher.get_target_apps_size(target.target))
+
+
+if __name__ == '__main__':
+    unittest.main()
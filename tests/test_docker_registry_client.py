@@ -0,0 +1,298 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import requests_mock
+import urllib3
+
+from apps.docker_registry_client import DockerRegistryClient
+from helpers import rate_controller
+
+
+class DockerRegistryClientTest(unittest.TestCase):
+    RegistryHost = 'registry.example.com'
+
+    def setUp(self):
+        self.client = DockerRegistryClient('some-token', registry_host=self.RegistryHost)
+        self.blob = os.urandom(3 * DockerRegistryClient.BlobChunkSize + 123)
+        self.blob_digest = 'sha256:' + hashlib.sha256(self.blob).hexdigest()
+        self.uri = DockerRegistryClient.parse_image_uri(
+            '{}/factory/app@sha256:{}'.format(self.RegistryHost, '0' * 64))
+        self.blob_url = 'https://{}/v2/factory/app/blobs/{}'.format(self.RegistryHost, self.blob_digest)
+
+    def test_pull_layer_to_memory(self):
+        with requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, content=self.blob)
+            self.assertEqual(self.blob, self.client.pull_layer(self.uri, self.blob_digest))
+
+    def test_pull_layer_to_file(self):
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, content=self.blob)
+            dst = os.path.join(d, self.blob_digest[len('sha256:'):])
+            self.client.pull_layer(self.uri, self.blob_digest, dst=dst)
+            with open(dst, 'rb') as f:
+                self.assertEqual(self.blob, f.read())
+            self.assertEqual([os.path.basename(dst)], os.listdir(d))
+
+    def test_pull_layer_to_writer(self):
+        with requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, content=self.blob)
+            writer = BytesIO()
+            self.client.pull_layer(self.uri, self.blob_digest, dst=writer)
+            self.assertEqual(self.blob, writer.getvalue())
+
+    def test_pull_layer_to_file_hash_mismatch(self):
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, content=self.blob[:-1] + b'x')
+            dst = os.path.join(d, self.blob_digest[len('sha256:'):])
+            with self.assertRaises(Exception):
+                self.client.pull_layer(self.uri, self.blob_digest, dst=dst)
+            self.assertEqual([], os.listdir(d))
+
+    def test_download_layers_to_dir(self):
+        blobs = [os.urandom(1024 + i) for i in range(10)]
+        manifest = {'layers': [{'digest': 'sha256:' + hashlib.sha256(b).hexdigest()} for b in blobs]}
+        client = DockerRegistryClient('some-token', registry_host=self.RegistryHost, max_workers=4)
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            for layer, blob in zip(manifest['layers'], blobs):
+                m.get('https://{}/v2/factory/app/blobs/{}'.format(self.RegistryHost, layer['digest']), content=blob)
+            layer_files = client.download_layers(
+                '{}/factory/app@sha256:{}'.format(self.RegistryHost, '0' * 64), manifest, dst_dir=d)
+            self.assertEqual(len(blobs), len(layer_files))
+            for layer_file, blob in zip(layer_files, blobs):
+                with open(layer_file, 'rb') as f:
+                    self.assertEqual(blob, f.read())
+
+
+class DownloadComposeAppTest(unittest.TestCase):
+    RegistryHost = 'registry.example.com'
+
+    def setUp(self):
+        self.client = DockerRegistryClient('some-token', registry_host=self.RegistryHost)
+        compose = b'services:\n  app:\n    image: foo\n'
+        archive = BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as t:
+            for name, data in [('docker-compose.yml', compose), ('config/app.conf', os.urandom(4096))]:
+                ti = tarfile.TarInfo(name)
+                ti.size = len(data)
+                t.addfile(ti, BytesIO(data))
+        self.archive = archive.getvalue()
+        self.archive_digest = 'sha256:' + hashlib.sha256(self.archive).hexdigest()
+        self.manifest = json.dumps({'layers': [{'digest': self.archive_digest},
+                                               {'digest': 'sha256:' + '1' * 64}]}).encode()
+        self.app_uri = '{}/factory/app@sha256:{}'.format(self.RegistryHost, hashlib.sha256(self.manifest).hexdigest())
+
+    def _mock_registry(self, m, archive):
+        base_url = 'https://{}/v2/factory/app/'.format(self.RegistryHost)
+        m.get('https://{}/v2/'.format(self.RegistryHost))
+        m.get(base_url + 'manifests/' + self.app_uri.split('@')[1], content=self.manifest)
+        m.get(base_url + 'blobs/' + self.archive_digest, content=archive)
+
+    def test_download_compose_app(self):
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            self._mock_registry(m, self.archive)
+            self.client.download_compose_app(self.app_uri, d)
+            self.assertEqual(['config', 'docker-compose.yml'], sorted(os.listdir(d)))
+            self.assertTrue(os.path.isfile(os.path.join(d, 'config', 'app.conf')))
+            # only the app archive layer is downloaded
+            self.assertEqual(1, len([r for r in m.request_history if '/blobs/' in r.path]))
+
+    def test_download_compose_app_hash_mismatch(self):
+        corrupted_archive = BytesIO()
+        with tarfile.open(fileobj=corrupted_archive, mode='w:gz') as t:
+            ti = tarfile.TarInfo('docker-compose.yml')
+            t.addfile(ti, BytesIO())
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            self._mock_registry(m, corrupted_archive.getvalue())
+            with self.assertRaises(Exception):
+                self.client.download_compose_app(self.app_uri, d)
+            self.assertEqual([], os.listdir(d))
+
+
+class InterruptedBody(io.RawIOBase):
+    # Emulates a connection reset after the given number of bytes is sent
+    def __init__(self, data, reset_after):
+        self._data = data[:reset_after]
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._pos >= len(self._data):
+            raise urllib3.exceptions.ProtocolError('Connection reset by peer')
+        n = min(len(b), len(self._data) - self._pos)
+        b[:n] = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+@patch('time.sleep')
+class DockerRegistryClientResumeTest(unittest.TestCase):
+    RegistryHost = 'registry.example.com'
+
+    def setUp(self):
+        self.client = DockerRegistryClient('some-token', registry_host=self.RegistryHost)
+        self.blob = os.urandom(2 * DockerRegistryClient.BlobChunkSize + 321)
+        self.blob_digest = 'sha256:' + hashlib.sha256(self.blob).hexdigest()
+        self.uri = DockerRegistryClient.parse_image_uri(
+            '{}/factory/app@sha256:{}'.format(self.RegistryHost, '0' * 64))
+        self.blob_url = 'https://{}/v2/factory/app/blobs/{}'.format(self.RegistryHost, self.blob_digest)
+        self.range_requests = []
+
+    def _resumed_response(self, partial=True):
+        def callback(request, context):
+            self.range_requests.append(request.headers.get('range'))
+            start = int(request.headers['range'][len('bytes='):-1])
+            if not partial:
+                return self.blob
+            context.status_code = 206
+            context.headers['content-range'] = 'bytes {}-{}/{}'.format(start, len(self.blob) - 1, len(self.blob))
+            return self.blob[start:]
+        return {'content': callback}
+
+    def test_resume_with_range_request(self, sleep_mock):
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, [{'body': InterruptedBody(self.blob, len(self.blob) - 1000)},
+                                  self._resumed_response()])
+            dst = os.path.join(d, self.blob_digest[len('sha256:'):])
+            self.client.pull_layer(self.uri, self.blob_digest, dst=dst)
+            with open(dst, 'rb') as f:
+                self.assertEqual(self.blob, f.read())
+            self.assertEqual(1, len(self.range_requests))
+            self.assertNotEqual('bytes=0-', self.range_requests[0])
+
+    def test_resume_if_range_is_not_supported(self, sleep_mock):
+        with requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, [{'body': InterruptedBody(self.blob, len(self.blob) // 2)},
+                                  self._resumed_response(partial=False)])
+            writer = BytesIO()
+            self.client.pull_layer(self.uri, self.blob_digest, dst=writer)
+            self.assertEqual(self.blob, writer.getvalue())
+
+    def test_retry_budget(self, sleep_mock):
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, [{'status_code': 502}] * (DockerRegistryClient.BlobPullRetries + 1))
+            dst = os.path.join(d, self.blob_digest[len('sha256:'):])
+            with self.assertRaises(Exception):
+                self.client.pull_layer(self.uri, self.blob_digest, dst=dst)
+            self.assertEqual(DockerRegistryClient.BlobPullRetries + 1,
+                             len([r for r in m.request_history if r.url == self.blob_url]))
+
+    def test_throttled_pull_retries(self, sleep_mock):
+        # a throttled blob pull is retried by one retry loop, not by the rate controller's one too
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            m.get('https://{}/v2/'.format(self.RegistryHost))
+            m.get(self.blob_url, status_code=429, headers={'Retry-After': '0'})
+            dst = os.path.join(d, self.blob_digest[len('sha256:'):])
+            with self.assertRaises(Exception):
+                self.client.pull_layer(self.uri, self.blob_digest, dst=dst)
+            self.assertEqual(DockerRegistryClient.BlobPullRetries + 1,
+                             len([r for r in m.request_history if r.url == self.blob_url]))
+            self.assertEqual(0, rate_controller._hosts[self.RegistryHost].in_flight)
+            self.assertEqual([], os.listdir(d))
+
+
+class DockerRegistryClientTokenCacheTest(unittest.TestCase):
+    RegistryHost = DockerRegistryClient.DefaultRegistryHost
+    TokenUrl = 'https://{}/token-auth/'.format(DockerRegistryClient.DefaultRegistryHost)
+
+    def setUp(self):
+        self.client = DockerRegistryClient('some-token')
+        self.manifest = b'{"layers": []}'
+        self.manifest_hash = hashlib.sha256(self.manifest).hexdigest()
+
+    def _app_uri(self, app):
+        return '{}/factory/{}@sha256:{}'.format(self.RegistryHost, app, self.manifest_hash)
+
+    def _mock_registry(self, m, apps, token=None):
+        def manifest_callback(request, context):
+            if 'authorization' not in request.headers:
+                context.status_code = 401
+                context.headers['www-authenticate'] = \
+                    'Bearer realm="{}",service="registry",scope="repository:factory/app:pull"'.format(self.TokenUrl)
+                return b''
+            return self.manifest
+
+        for app in apps:
+            m.get('https://{}/v2/factory/{}/manifests/sha256:{}'.format(self.RegistryHost, app, self.manifest_hash),
+                  content=manifest_callback)
+        return m.get(self.TokenUrl, json=token or {'token': 'jwt-token', 'expires_in': 300})
+
+    def test_token_is_cached(self):
+        with requests_mock.Mocker() as m:
+            token_mock = self._mock_registry(m, ['app'])
+            uri = DockerRegistryClient.parse_image_uri(self._app_uri('app'))
+            for _ in range(3):
+                self.assertEqual(self.manifest, self.client.pull_manifest(uri))
+            self.assertEqual(1, token_mock.call_count)
+            self.assertEqual({'hits': 2, 'misses': 1, 'token_requests': 1}, self.client.token_stats)
+
+    def test_prefetch_tokens(self):
+        apps = ['app1', 'app2', 'app3']
+        with requests_mock.Mocker() as m:
+            token_mock = self._mock_registry(m, apps)
+            self.client.prefetch_tokens(self._app_uri(app) for app in apps)
+            self.assertEqual(1, token_mock.call_count)
+            self.assertEqual(sorted('repository:factory/{}:pull'.format(app) for app in apps),
+                             token_mock.last_request.qs['scope'])
+            for app in apps:
+                self.client.pull_manifest(DockerRegistryClient.parse_image_uri(self._app_uri(app)))
+            self.assertEqual(1, token_mock.call_count)
+            self.assertEqual(len(apps), self.client.token_cache_hits)
+            # the tokens are cached, so neither a challenge nor a token is requested
+            requests = m.call_count
+            self.client.prefetch_tokens(self._app_uri(app) for app in apps)
+            self.assertEqual(requests, m.call_count)
+
+    def test_prefetch_tokens_of_mixed_images(self):
+        # the challenge is probed with a factory repository even if the last image is not a factory one
+        apps = ['app1', 'app2']
+        with requests_mock.Mocker() as m:
+            token_mock = self._mock_registry(m, apps)
+            self.client.prefetch_tokens([self._app_uri(app) for app in apps] +
+                                        ['docker.io/library/busybox@sha256:' + self.manifest_hash])
+            self.assertEqual(1, token_mock.call_count)
+            self.assertEqual(['repository:factory/app1:pull', 'repository:factory/app2:pull'],
+                             token_mock.last_request.qs['scope'])
+            self.assertEqual('/v2/factory/app1/manifests/sha256:' + self.manifest_hash, m.request_history[0].path)
+
+    def test_concurrent_token_requests(self):
+        # A pending token request doesn't block the token requests of other repositories
+        app2_token_requested = threading.Event()
+
+        def token(request, context):
+            if request.qs['scope'] == ['repository:factory/app1:pull']:
+                if not app2_token_requested.wait(5):
+                    raise Exception('The token request of app2 is blocked')
+            else:
+                app2_token_requested.set()
+            return {'token': 'jwt-token-' + request.qs['scope'][0], 'expires_in': 300}
+
+        with requests_mock.Mocker() as m, ThreadPoolExecutor(2) as executor:
+            token_mock = self._mock_registry(m, ['app1', 'app2'], token)
+            pulls = [executor.submit(self.client.pull_manifest,
+                                     DockerRegistryClient.parse_image_uri(self._app_uri(app)))
+                     for app in ['app1', 'app2']]
+            self.assertEqual([self.manifest, self.manifest], [pull.result() for pull in pulls])
+            self.assertEqual(2, token_mock.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
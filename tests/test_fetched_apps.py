@@ -0,0 +1,171 @@
+import io
+import os
+import tarfile
+import unittest
+from tempfile import TemporaryDirectory
+
+import requests_mock
+
+from apps.fetched_apps import FetchedAppsArchive
+from apps.target_apps_fetcher import SkopeAppFetcher
+from factory_client import FactoryClient
+from fixtures import SyntheticTarget, local_factory_registry, tree_digest
+from local_registry import LocalRegistry
+
+
+class FetchedAppsArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.registry = LocalRegistry().start()
+        self.addCleanup(self.registry.stop)
+        factory_registry = local_factory_registry(self.registry)
+        factory_registry.__enter__()
+        self.addCleanup(factory_registry.__exit__, None, None, None)
+        self.target = SyntheticTarget(self.registry, apps=2, images=2, layers=3, layer_size=64 * 1024)
+        self.archive = os.path.join(self.tmp_dir.name, 'prev.apps.tar')
+        fetcher = SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'prev'))
+        fetcher.fetch_target(self.target.target, force=True)
+        with tarfile.open(self.archive, 'w') as t:
+            t.add(fetcher.target_dir(self.target.name), '.')
+
+    def _fetch(self, target, archive=None):
+        self.registry.reset_stats()
+        fetcher = SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'fetch-' + os.urandom(4).hex()))
+        if archive:
+            fetcher.seed(archive)
+        fetcher.fetch_target(target, force=True)
+        return fetcher, self.registry.stats['requests_by_kind']
+
+    def test_unchanged_target(self):
+        archive = FetchedAppsArchive(self.archive)
+        fetcher, requests = self._fetch(self.target.target, archive)
+        # only the registry token is requested, the manifest request is the token flow probe
+        self.assertEqual({'manifest': 1, 'token': 1}, requests)
+        self.assertEqual(archive.blobs, archive.imported)
+        self.assertEqual(tree_digest(os.path.join(self.tmp_dir.name, 'prev', self.target.name))[0],
+                         tree_digest(fetcher.target_dir(self.target.name))[0])
+
+    def test_changed_app(self):
+        # The new Target's `app-1` is changed, the other app is the same
+        changed_app = SyntheticTarget(self.registry, apps=1, images=2, layers=3, layer_size=64 * 1024, seed=1)
+        target_json = self.target.target.json
+        target_json['custom']['docker_compose_apps']['app-1'] = \
+            changed_app.target.json['custom']['docker_compose_apps']['app-0']
+        target = FactoryClient.Target('factory-lmp-2', target_json)
+
+        _, full_fetch_requests = self._fetch(target)
+        fetcher, requests = self._fetch(target, FetchedAppsArchive(self.archive))
+        # only the blobs and manifests missing in the previous Target's archive are pulled
+        with tarfile.open(self.archive) as t:
+            prev_blobs = set(os.path.basename(m.name) for m in t if m.name.startswith('./blobs/sha256/'))
+        new_blobs = set(os.listdir(os.path.join(fetcher.blobs_dir(target.name), 'sha256'))) - prev_blobs
+        self.assertEqual(len(new_blobs), requests['blob'] + requests['manifest'] - 1)
+        self.assertLess(requests['blob'], full_fetch_requests['blob'])
+
+    def test_streamed_archive(self):
+        uri = 'https://api.foundries.io/runs/1/factory-lmp-1.apps.tar'
+        with open(self.archive, 'rb') as f, requests_mock.Mocker(real_http=True) as m:
+            m.get(uri, body=f, request_headers={'OSF-TOKEN': 'token'})
+            archive = FetchedAppsArchive(uri, 'token')
+            _, requests = self._fetch(self.target.target, archive)
+        self.assertNotIn('blob', requests)
+        self.assertGreater(archive.manifests, 0)
+
+    def test_corrupted_blob(self):
+        corrupted = os.path.join(self.tmp_dir.name, 'corrupted.apps.tar')
+        corrupted_blobs = 0
+        with tarfile.open(self.archive) as src, tarfile.open(corrupted, 'w') as dst:
+            for m in src:
+                data = src.extractfile(m) if m.isfile() else None
+                if m.isfile() and m.name.startswith('./blobs/') and m.size == 64 * 1024:
+                    data = io.BytesIO(os.urandom(m.size))
+                    corrupted_blobs += 1
+                dst.addfile(m, data)
+        archive = FetchedAppsArchive(corrupted)
+        fetcher, requests = self._fetch(self.target.target, archive)
+        self.assertGreater(corrupted_blobs, 0)
+        self.assertEqual(archive.blobs - corrupted_blobs, archive.imported)
+        self.assertEqual(corrupted_blobs, requests['blob'])
+        self.assertEqual(tree_digest(os.path.join(self.tmp_dir.name, 'prev', self.target.name))[0],
+                         tree_digest(fetcher.target_dir(self.target.name))[0])
+
+    def _extract(self):
+        work_dir = os.path.join(self.tmp_dir.name, 'extracted-' + os.urandom(4).hex())
+        with tarfile.open(self.archive) as t:
+            t.extractall(os.path.join(work_dir, self.target.name))
+        return work_dir
+
+    def test_verify_fetched(self):
+        fetcher = SkopeAppFetcher('token', self._extract())
+        result = fetcher.verify_fetched(self.target.target)
+        self.assertTrue(result.ok)
+        self.assertGreater(len(result.verified), 0)
+        self.registry.reset_stats()
+        fetcher.fetch_target(self.target.target, force=True)
+        self.assertEqual({'manifest': 1, 'token': 1}, self.registry.stats['requests_by_kind'])
+        self.assertEqual(tree_digest(os.path.join(self.tmp_dir.name, 'prev', self.target.name))[0],
+                         tree_digest(fetcher.target_dir(self.target.name))[0])
+
+    def test_verify_corrupted_fetched(self):
+        work_dir = self._extract()
+        blobs_dir = os.path.join(work_dir, self.target.name, 'blobs', 'sha256')
+        layers = sorted(b for b in os.listdir(blobs_dir) if os.path.getsize(os.path.join(blobs_dir, b)) == 64 * 1024)
+        with open(os.path.join(blobs_dir, layers[0]), 'r+b') as f:
+            f.write(b'corrupted')
+        os.remove(os.path.join(blobs_dir, layers[1]))
+
+        fetcher = SkopeAppFetcher('token', work_dir)
+        result = fetcher.verify_fetched(self.target.target)
+        self.assertEqual({'sha256:' + layers[0]}, set(result.corrupted))
+        self.assertEqual({'sha256:' + layers[1]}, set(result.missing))
+        self.assertFalse(os.path.exists(os.path.join(blobs_dir, layers[0])))
+        self.registry.reset_stats()
+        fetcher.fetch_target(self.target.target, force=True)
+        # only the missing and corrupted blobs are pulled
+        self.assertEqual(2, self.registry.stats['requests_by_kind']['blob'])
+        self.assertEqual(tree_digest(os.path.join(self.tmp_dir.name, 'prev', self.target.name))[0],
+                         tree_digest(fetcher.target_dir(self.target.name))[0])
+
+    def test_verify_corrupted_app_archive_copy(self):
+        # The app dir's corrupted copy of the app archive is removed, the valid archive blob is reused
+        work_dir = self._extract()
+        app_dir = os.path.join(work_dir, self.target.name, 'apps', 'app-0')
+        app_dir = os.path.join(app_dir, os.listdir(app_dir)[0])
+        archive = os.path.join(app_dir, next(f for f in os.listdir(app_dir) if f.endswith('.tgz')))
+        os.remove(archive)
+        with open(archive, 'wb') as f:
+            f.write(b'corrupted')
+
+        fetcher = SkopeAppFetcher('token', work_dir)
+        result = fetcher.verify_fetched(self.target.target)
+        self.assertEqual({'sha256:' + os.path.basename(archive)[:-len('.tgz')]}, set(result.corrupted))
+        self.assertFalse(os.path.exists(archive))
+        self.registry.reset_stats()
+        fetcher.fetch_target(self.target.target, force=True)
+        self.assertNotIn('blob', self.registry.stats['requests_by_kind'])
+        self.assertTrue(fetcher.verify_fetched(self.target.target).ok)
+        self.assertEqual(tree_digest(os.path.join(self.tmp_dir.name, 'prev', self.target.name))[0],
+                         tree_digest(fetcher.target_dir(self.target.name))[0])
+
+    def test_verify_corrupted_pooled_blob(self):
+        # The fetched blobs are links to the blob pool's ones, so a corrupted blob is removed from the pool too
+        fetcher = SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'prev'))
+        blobs_dir = os.path.join(fetcher.blobs_dir(self.target.name), 'sha256')
+        layer = next(b for b in sorted(os.listdir(blobs_dir))
+                     if os.path.getsize(os.path.join(blobs_dir, b)) == 64 * 1024)
+        self.assertTrue(os.path.samefile(os.path.join(blobs_dir, layer), fetcher._blob_pool.path('sha256:' + layer)))
+        with open(fetcher._blob_pool.path('sha256:' + layer), 'r+b') as f:
+            f.write(b'corrupted')
+
+        result = fetcher.verify_fetched(self.target.target)
+        self.assertEqual({'sha256:' + layer}, set(result.corrupted))
+        self.assertFalse(os.path.exists(fetcher._blob_pool.path('sha256:' + layer)))
+        self.registry.reset_stats()
+        fetcher.fetch_target(self.target.target, force=True)
+        self.assertEqual(1, self.registry.stats['requests_by_kind']['blob'])
+        self.assertTrue(fetcher.verify_fetched(self.target.target).ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from apps.fsck import FetchedAppsVerifier, main
+from apps.target_apps_fetcher import SkopeAppFetcher
+from fixtures import SyntheticTarget, local_factory_registry
+from local_registry import LocalRegistry
+
+
+class FetchedAppsVerifierTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        with LocalRegistry() as registry, local_factory_registry(registry):
+            self.target = SyntheticTarget(registry, apps=2, images=2, layers=3, layer_size=64 * 1024)
+            self.fetcher = SkopeAppFetcher('token', self.tmp_dir.name)
+            self.fetcher.fetch_target(self.target.target, force=True)
+        self.target_dir = self.fetcher.target_dir(self.target.name)
+        self.blobs_dir = os.path.join(self.target_dir, 'blobs', 'sha256')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _layers(self):
+        return sorted(b for b in os.listdir(self.blobs_dir)
+                      if os.path.getsize(os.path.join(self.blobs_dir, b)) == 64 * 1024)
+
+    def test_verify(self):
+        result = FetchedAppsVerifier(self.target_dir, self.target.target.platform, max_workers=4).verify()
+        self.assertTrue(result.ok)
+        # all fetched blobs are nodes of the apps graph
+        self.assertEqual(set('sha256:' + b for b in os.listdir(self.blobs_dir)), result.verified)
+        self.assertEqual(sum(os.path.getsize(os.path.join(self.blobs_dir, b)) for b in os.listdir(self.blobs_dir)),
+                         result.verified_size)
+        # app manifests, layers indexes, image indexes and manifests
+        self.assertEqual(2 + 2 + 4 * 2, len(result.manifests))
+
+        # the layers indexes are not verified if the architecture is not known
+        result = FetchedAppsVerifier(self.target_dir).verify()
+        self.assertTrue(result.ok)
+        self.assertEqual(len(os.listdir(self.blobs_dir)) - 2, len(result.verified))
+
+    def test_broken(self):
+        layers = self._layers()
+        with open(os.path.join(self.blobs_dir, layers[0]), 'r+b') as f:
+            f.write(b'corrupted')
+        os.remove(os.path.join(self.blobs_dir, layers[1]))
+
+        result = FetchedAppsVerifier(self.target_dir, self.target.target.platform).verify()
+        self.assertFalse(result.ok)
+        self.assertEqual({'sha256:' + layers[0]: 64 * 1024}, result.corrupted)
+        self.assertEqual({'sha256:' + layers[1]: 64 * 1024}, result.missing)
+        self.assertEqual(64 * 1024, result.missing_size)
+
+        out_file = os.path.join(self.tmp_dir.name, 'fsck.json')
+        args = argparse.Namespace(target_dir=self.target_dir, arch=None, workers=2, out_file=out_file)
+        self.assertEqual(os.EX_DATAERR, main(args))
+        with open(out_file) as f:
+            report = json.load(f)
+        self.assertEqual(result.corrupted, report['corrupted'])
+        self.assertEqual(result.missing, report['missing'])
+
+    def test_corrupted_app_archive_copy(self):
+        # the app dir's copy of the app archive is verified too
+        app_dir = os.path.join(self.target_dir, 'apps', 'app-0')
+        app_dir = os.path.join(app_dir, os.listdir(app_dir)[0])
+        archive = next(f for f in os.listdir(app_dir) if f.endswith('.tgz'))
+        # e.g. the archive is copied, if it can't be linked to the blob
+        os.remove(os.path.join(app_dir, archive))
+        with open(os.path.join(app_dir, archive), 'wb') as f:
+            f.write(b'corrupted')
+        result = FetchedAppsVerifier(self.target_dir).verify()
+        self.assertEqual({'sha256:' + archive[:-len('.tgz')]}, set(result.corrupted))
+        # the blob itself is valid
+        self.assertIn('sha256:' + archive[:-len('.tgz')], result.verified)
+
+
+if __name__ == '__main__':
+    unittest.main()
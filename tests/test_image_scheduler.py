@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from apps.compose_apps import ComposeApps
+from apps.dockerd import DockerDaemon
+from apps.image_downloader import DockerDownloader
+from apps.image_scheduler import ImageFetchScheduler
+from apps.target_apps_fetcher import TargetAppsFetcher
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ImageFetchSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+        self.fetched = []
+
+    def _fetch(self, registry, image, delay=0.05):
+        with self.lock:
+            self.running[registry] = self.running.get(registry, 0) + 1
+            self.max_running[registry] = max(self.max_running.get(registry, 0), self.running[registry])
+            self.fetched.append(image)
+        time.sleep(delay)
+        with self.lock:
+            self.running[registry] -= 1
+        return image
+
+    def _add(self, scheduler, registry, image):
+        return scheduler.add(image, image, registry, lambda: self._fetch(registry, image))
+
+    def test_dedup(self):
+        scheduler = ImageFetchScheduler(max_workers=4)
+        jobs = [self._add(scheduler, 'hub.foundries.io', image) for image in ['a', 'b', 'a', 'a']]
+        self.assertIs(jobs[0], jobs[2])
+        scheduler.run()
+        self.assertEqual(['a', 'b'], sorted(self.fetched))
+        self.assertEqual(['a', 'b', 'a', 'a'], [job.result for job in jobs])
+        self.assertEqual(3, jobs[0].refs)
+
+    def test_per_registry_cap(self):
+        scheduler = ImageFetchScheduler(max_workers=8, max_per_registry=2)
+        for i in range(6):
+            self._add(scheduler, 'slow.registry.io', 'slow-{}'.format(i))
+            self._add(scheduler, 'hub.foundries.io', 'hub-{}'.format(i))
+        scheduler.run()
+        self.assertEqual(12, len(self.fetched))
+        self.assertEqual({'slow.registry.io': 2, 'hub.foundries.io': 2}, self.max_running)
+        # the registries are served concurrently
+        self.assertIn('hub-0', self.fetched[:2])
+
+    def test_grouped_logs(self):
+        handler = ListHandler()
+        logging.root.addHandler(handler)
+        logger = logging.getLogger('test_image_scheduler')
+        level = logger.level
+        logger.setLevel(logging.INFO)
+
+        def fetch(image):
+            for i in range(3):
+                logger.info('{}-{}'.format(image, i))
+                time.sleep(0.02)
+
+        try:
+            scheduler = ImageFetchScheduler(max_workers=2)
+            for image in ['a', 'b']:
+                scheduler.add(image, image, 'hub.foundries.io', lambda image=image: fetch(image))
+            scheduler.run()
+        finally:
+            logging.root.removeHandler(handler)
+            logger.setLevel(level)
+
+        messages = [m for m in handler.messages if m[0] in 'ab' and '-' in m]
+        self.assertEqual(6, len(messages))
+        first = messages[0][0]
+        second = 'b' if first == 'a' else 'a'
+        self.assertEqual(['{}-{}'.format(image, i) for image in (first, second) for i in range(3)], messages)
+        self.assertFalse(handler.filters)
+
+    def test_failure_stops_scheduling(self):
+        scheduler = ImageFetchScheduler(max_workers=1)
+
+        def fail():
+            raise Exception('manifest unknown')
+
+        scheduler.add('broken', 'broken', 'hub.foundries.io', fail)
+        for i in range(3):
+            self._add(scheduler, 'hub.foundries.io', 'image-{}'.format(i))
+        with self.assertRaisesRegex(Exception, 'manifest unknown'):
+            scheduler.run()
+        self.assertEqual([], self.fetched)
+
+
+
+class AppsImagesPullTest(unittest.TestCase):
+    ComposeAppDesc = '''
+    services:
+      www:
+        image: hub.foundries.io/factory/base@sha256:{base}
+      {name}:
+        image: hub.foundries.io/factory/{name}@sha256:{hash}
+      cache:
+        image: redis:7
+    '''
+
+    def test_dedup_and_parallel(self):
+        pulled = []
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def pull(downloader, image, platform):
+            with lock:
+                pulled.append((image, platform, downloader.dst_daemon_host))
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        with TemporaryDirectory() as apps_dir, mock.patch.object(DockerDownloader, 'pull', pull), \
+                mock.patch.dict(os.environ, {ComposeApps.App.ValidatorEnv: ComposeApps.App.NativeValidator}):
+            for i in range(4):
+                os.makedirs(os.path.join(apps_dir, 'app-{}'.format(i)))
+                with open(os.path.join(apps_dir, 'app-{}'.format(i), ComposeApps.App.ComposeFile), 'w') as f:
+                    f.write(self.ComposeAppDesc.format(base='0' * 64, name='app-{}'.format(i), hash=str(i) * 64))
+            dockerd = mock.Mock(spec=DockerDaemon, host='unix:///tmp/docker.sock')
+            TargetAppsFetcher._pull_apps_images(ComposeApps(apps_dir), 'arm64', dockerd)
+
+        # the base and redis images are pulled once
+        self.assertEqual(4 + 2, len(pulled))
+        self.assertEqual(6, len(set(pulled)))
+        self.assertEqual({('arm64', 'unix:///tmp/docker.sock')}, {p[1:] for p in pulled})
+        self.assertGreater(running[1], 1)
+        self.assertLessEqual(running[1], DockerDaemon.MaxConcurrentDownloads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import yaml
+
+from apps.fsck import FetchedAppsVerifier
+from apps.target_apps_fetcher import SkopeAppFetcher
+from factory_client import FactoryClient
+from fixtures import SyntheticTarget, local_factory_registry, tree_digest
+from local_registry import LocalRegistry
+
+
+class SkopeoSyncImagesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.registry = LocalRegistry().start()
+        self.addCleanup(self.registry.stop)
+        factory_registry = local_factory_registry(self.registry)
+        factory_registry.__enter__()
+        self.addCleanup(factory_registry.__exit__, None, None, None)
+        self.target = SyntheticTarget(self.registry, apps=3, images=2, layers=3, layer_size=16 * 1024)
+        self.synced = []
+
+    @staticmethod
+    def _normalize(host, name):
+        # The docker reference normalization, `docker.io` images are served by the local registry too
+        if host in ('docker.io', 'index.docker.io'):
+            return 'docker.io', name if '/' in name else 'library/' + name
+        return host, name
+
+    def _skopeo(self, args, **kwargs):
+        # A stand-in of `skopeo sync --src yaml --dest dir --scoped`, it writes a `dir:` layout of each image
+        # to the dir named by the image's normalized reference, e.g. docker.io/library/<name>@<digest>
+        self.assertIn('sync', args)
+        sync_file, dst_dir = args[-2:]
+        with open(sync_file) as f:
+            repos = yaml.safe_load(f)
+        for host, repo in repos.items():
+            for name, digests in repo['images'].items():
+                host, name = self._normalize(host, name)
+                for digest in digests:
+                    image_dir = os.path.join(dst_dir, host, '{}@{}'.format(name, digest))
+                    os.makedirs(image_dir)
+                    _, manifest_data = self.registry._manifests[name][digest]
+                    with open(os.path.join(image_dir, 'manifest.json'), 'wb') as f:
+                        f.write(manifest_data)
+                    for blob_digest, data in self.registry._blobs[name].items():
+                        if blob_digest.encode() in manifest_data:
+                            with open(os.path.join(image_dir, blob_digest[len('sha256:'):]), 'wb') as f:
+                                f.write(data)
+                    self.synced.append(digest)
+        return b''
+
+    def _fetch(self, target, image_copier):
+        fetcher = SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, image_copier), image_copier=image_copier)
+        with mock.patch('apps.target_apps_fetcher.subprocess.check_output', side_effect=self._skopeo) as skopeo:
+            fetcher.fetch_target(target, force=True)
+        return fetcher, skopeo
+
+    def test_sync(self):
+        fetcher, skopeo = self._fetch(self.target.target, SkopeAppFetcher.SkopeoSyncImageCopier)
+        # all images of the Target are synced by one process
+        self.assertEqual(1, skopeo.call_count)
+        self.assertEqual(len(set(self.target.images)), len(self.synced))
+        native, _ = self._fetch(self.target.target, SkopeAppFetcher.NativeImageCopier)
+        self.assertEqual(tree_digest(native.target_dir(self.target.name))[0],
+                         tree_digest(fetcher.target_dir(self.target.name))[0])
+        self.assertTrue(FetchedAppsVerifier(fetcher.target_dir(self.target.name), self.target.target.platform)
+                        .verify().ok)
+        # the sync dir is removed
+        self.assertEqual(['.blobs', self.target.name, self.target.name + '.size.json'],
+                         sorted(os.listdir(os.path.join(self.tmp_dir.name, SkopeAppFetcher.SkopeoSyncImageCopier))))
+
+        # the images that are present in the blob pool are not synced
+        self.synced.clear()
+        with mock.patch('apps.target_apps_fetcher.subprocess.check_output', side_effect=self._skopeo) as skopeo:
+            fetcher.fetch_target(FactoryClient.Target('another-target', self.target.target.json), force=True)
+        self.assertEqual(0, skopeo.call_count)
+        self.assertEqual(tree_digest(fetcher.target_dir(self.target.name))[0],
+                         tree_digest(fetcher.target_dir('another-target'))[0])
+
+    def test_sync_docker_hub_image(self):
+        config = b'{"architecture": "arm64", "os": "linux"}'
+        layer = os.urandom(1024)
+        manifest = {
+            'schemaVersion': 2,
+            'mediaType': SyntheticTarget.ImageManifestType,
+            'config': {'mediaType': 'application/vnd.docker.container.image.v1+json',
+                       'digest': self.registry.push_blob('library/busybox', config), 'size': len(config)},
+            'layers': [{'mediaType': SyntheticTarget.LayerType,
+                        'digest': self.registry.push_blob('library/busybox', layer), 'size': len(layer)}],
+        }
+        digest = self.registry.push_manifest('library/busybox', manifest)
+        blobs = [manifest['config']['digest'], manifest['layers'][0]['digest']]
+        fetcher = SkopeAppFetcher('token', self.tmp_dir.name, image_copier=SkopeAppFetcher.SkopeoSyncImageCopier)
+        blobs_dir = os.path.join(self.tmp_dir.name, 'blobs')
+        os.makedirs(blobs_dir)
+        for image in ('docker.io/busybox@' + digest, 'index.docker.io/busybox@' + digest,
+                      'docker.io/library/busybox@' + digest):
+            with self.subTest(image=image):
+                uri = fetcher._registry_client.parse_image_uri(image)
+                with TemporaryDirectory(dir=self.tmp_dir.name) as sync_dir, \
+                        mock.patch('apps.target_apps_fetcher.subprocess.check_output', side_effect=self._skopeo):
+                    fetcher._skopeo_sync_images({image: (uri, {'digest': digest}, [digest] + blobs, blobs)},
+                                                blobs_dir, sync_dir)
+                self.assertEqual(sorted(b[len('sha256:'):] for b in blobs), sorted(os.listdir(blobs_dir)))
+                for blob in os.listdir(blobs_dir):
+                    os.remove(os.path.join(blobs_dir, blob))
+
+
+if __name__ == '__main__':
+    unittest.main()
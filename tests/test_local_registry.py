@@ -0,0 +1,45 @@
+import os
+import unittest
+
+from apps.docker_registry_client import DockerRegistryClient
+from bench_apps_fetch import run, summarize
+from fixtures import SyntheticTarget
+from local_registry import LocalRegistry
+
+
+class LocalRegistryTest(unittest.TestCase):
+    def test_token_flow(self):
+        with LocalRegistry(credentials=('user', 'secret')) as registry:
+            blob = os.urandom(1024)
+            digest = registry.push_blob('org/image', blob)
+            uri = DockerRegistryClient.parse_image_uri('{}/org/image@{}'.format(registry.host, digest))
+
+            client = DockerRegistryClient('token', registry_host=registry.host, schema='http',
+                                          auth=('user', 'secret'))
+            self.assertEqual(blob, client.pull_layer(uri, digest))
+            self.assertEqual(blob, client.pull_layer(uri, digest))
+            self.assertEqual({'ping': 1, 'token': 1, 'blob': 2}, registry.stats['requests_by_kind'])
+
+            client = DockerRegistryClient('token', registry_host=registry.host, schema='http',
+                                          auth=('user', 'wrong-secret'))
+            with self.assertRaises(Exception):
+                client.pull_layer(uri, digest)
+
+    def test_fetch_synthetic_target(self):
+        with LocalRegistry(throttle_every=5) as registry:
+            target = SyntheticTarget(registry, apps=2, images=2, layers=3, layer_size=64 * 1024)
+            results = run(registry, target, ['oci', 'compose'], repeat=2, max_workers=4, isolate=False)
+            summary = summarize(results)
+
+        self.assertEqual(4, len(results))
+        self.assertGreater(summary['oci']['throttled'], 0)
+        # blobs: 2 apps x (manifest, archive, layers meta, layers index),
+        #   4 images x (index, manifest, config) + 9 distinct layers;
+        # app dirs: 2 apps x (uri, manifest.json, archive, compose file) + 4 images x (oci-layout, index.json)
+        self.assertEqual(2 * 4 + 4 * 3 + 9 + 2 * 4 + 4 * 2, summary['oci']['files'])
+        # 2 apps x (docker-compose.yml, config/settings.env)
+        self.assertEqual(2 * 2, summary['compose']['files'])
+
+
+if __name__ == '__main__':
+    unittest.main()
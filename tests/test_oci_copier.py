@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+import requests_mock
+
+from apps.oci_copier import OciImageCopier
+
+
+def digest(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+class OciImageCopierTest(unittest.TestCase):
+    RegistryHost = 'registry.example.com'
+
+    def setUp(self):
+        self.config = b'{"architecture": "arm64"}'
+        self.layers = [os.urandom(1024 * (i + 1)) for i in range(3)]
+        self.manifest = json.dumps({
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+            'config': {'mediaType': 'application/vnd.docker.container.image.v1+json',
+                       'digest': digest(self.config), 'size': len(self.config)},
+            'layers': [{'mediaType': 'application/vnd.docker.image.rootfs.diff.tar.gzip',
+                        'digest': digest(layer), 'size': len(layer)} for layer in self.layers]
+        }).encode()
+        self.index = json.dumps({
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.docker.distribution.manifest.list.v2+json',
+            'manifests': [
+                {'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+                 'digest': 'sha256:' + '0' * 64, 'size': 100,
+                 'platform': {'architecture': 'amd64', 'os': 'linux'}},
+                {'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+                 'digest': digest(self.manifest), 'size': len(self.manifest),
+                 'platform': {'architecture': 'arm64', 'os': 'linux'}},
+            ]
+        }).encode()
+
+    def _mock_registry(self, m):
+        base_url = 'https://{}/v2/'.format(self.RegistryHost)
+        m.get(base_url)
+        m.get(base_url + 'factory/image/manifests/' + digest(self.index), content=self.index)
+        m.get(base_url + 'factory/image/manifests/' + digest(self.manifest), content=self.manifest)
+        for blob in [self.config] + self.layers:
+            m.get(base_url + 'factory/image/blobs/' + digest(blob), content=blob)
+
+    def test_copy_multi_arch_image(self):
+        image = '{}/factory/image@{}'.format(self.RegistryHost, digest(self.index))
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            self._mock_registry(m)
+            blobs_dir = os.path.join(d, 'blobs')
+            image_dir = os.path.join(d, 'images', 'image')
+            OciImageCopier('token').copy(image, 'arm64', blobs_dir, image_dir)
+
+            for blob in [self.index, self.manifest, self.config] + self.layers:
+                with open(os.path.join(blobs_dir, 'sha256', digest(blob)[len('sha256:'):]), 'rb') as f:
+                    self.assertEqual(blob, f.read())
+            self.assertEqual(6, len(os.listdir(os.path.join(blobs_dir, 'sha256'))))
+
+            with open(os.path.join(image_dir, 'oci-layout')) as f:
+                self.assertEqual({'imageLayoutVersion': '1.0.0'}, json.load(f))
+            with open(os.path.join(image_dir, 'index.json')) as f:
+                index = json.load(f)
+            self.assertEqual([{'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+                               'digest': digest(self.manifest), 'size': len(self.manifest)}], index['manifests'])
+
+    def test_present_blobs_are_not_pulled(self):
+        image = '{}/factory/image@{}'.format(self.RegistryHost, digest(self.manifest))
+        with TemporaryDirectory() as d, requests_mock.Mocker() as m:
+            self._mock_registry(m)
+            blobs_dir = os.path.join(d, 'blobs')
+            os.makedirs(os.path.join(blobs_dir, 'sha256'))
+            for blob in self.layers:
+                with open(os.path.join(blobs_dir, 'sha256', digest(blob)[len('sha256:'):]), 'wb') as f:
+                    f.write(blob)
+            OciImageCopier('token').copy(image, 'arm64', blobs_dir, os.path.join(d, 'image'))
+            pulled_blobs = [r.path for r in m.request_history if '/blobs/' in r.path]
+            self.assertEqual(['/v2/factory/image/blobs/' + digest(self.config)], pulled_blobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
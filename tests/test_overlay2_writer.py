@@ -0,0 +1,201 @@
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import stat
+import subprocess
+import tarfile
+import unittest
+from tempfile import TemporaryDirectory
+
+from apps.disk_usage import DiskUsage
+from apps.docker_registry_client import DockerRegistryClient
+from apps.docker_store import DockerStore
+from apps.oci_copier import OciImageCopier
+from apps.overlay2_writer import Crc64, Overlay2Writer
+from fixtures import local_factory_registry
+from local_registry import LocalRegistry
+
+
+def sha256(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def make_layer(entries):
+    # entries: (TarInfo, content)
+    tar = io.BytesIO()
+    with tarfile.open(fileobj=tar, mode='w', format=tarfile.PAX_FORMAT) as t:
+        for info, content in entries:
+            if content is not None:
+                info.size = len(content)
+            t.addfile(info, io.BytesIO(content) if content is not None else None)
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb', mtime=0) as gz:
+        gz.write(tar.getvalue())
+    return compressed.getvalue(), sha256(tar.getvalue())
+
+
+def entry(name, type=tarfile.REGTYPE, mode=0o644, linkname='', pax_headers=None):
+    info = tarfile.TarInfo(name)
+    info.type = type
+    info.mode = mode
+    info.mtime = 1700000000
+    info.linkname = linkname
+    info.uid = info.gid = 1000
+    info.pax_headers = pax_headers or {}
+    return info
+
+
+class Crc64Test(unittest.TestCase):
+    def test_check_value(self):
+        crc = Crc64()
+        crc.update(b'123456789')
+        self.assertEqual('b90956c775a41001', crc.digest().hex())
+
+    def test_chunks(self):
+        data = os.urandom(100 * 1024 + 7)
+        crc = Crc64()
+        crc.update(data)
+        chunked = Crc64()
+        for i in range(0, len(data), 4099):
+            chunked.update(data[i:i + 4099])
+        self.assertEqual(crc.digest(), chunked.digest())
+
+
+class Overlay2WriterTest(unittest.TestCase):
+    LongName = 'usr/share/' + 'long-name-' * 12 + '.txt'
+
+    def setUp(self):
+        self.passwd = b'root:x:0:0:root:/root:/bin/sh\n'
+        self.sh = os.urandom(64 * 1024)
+        self.base_layer = make_layer([
+            (entry('./', tarfile.DIRTYPE, 0o755), None),
+            (entry('etc/', tarfile.DIRTYPE, 0o755), None),
+            (entry('etc/passwd'), self.passwd),
+            (entry('bin/', tarfile.DIRTYPE, 0o755), None),
+            (entry('bin/sh', mode=0o4755), self.sh),
+            (entry('bin/bash', tarfile.SYMTYPE, 0o777, linkname='sh'), None),
+            (entry('bin/sh2', tarfile.LNKTYPE, linkname='bin/sh'), None),
+            (entry('var/lib/', tarfile.DIRTYPE, 0o755), None),
+            (entry('var/lib/data'), b'data'),
+            (entry(self.LongName), b'long'),
+            (entry('empty'), b''),
+        ])
+        self.top_layer = make_layer([
+            (entry('etc/', tarfile.DIRTYPE, 0o755), None),
+            (entry('etc/.wh.passwd'), b''),
+            (entry('var/lib/', tarfile.DIRTYPE, 0o755), None),
+            (entry('var/lib/.wh..wh..opq'), b''),
+            (entry('var/lib/new', mode=0o600), b'new data'),
+        ])
+
+    def _push_image(self, registry, name, layers):
+        repo = 'factory/' + name
+        config = json.dumps({'architecture': 'arm64', 'os': 'linux',
+                             'rootfs': {'type': 'layers', 'diff_ids': [diff_id for _, diff_id in layers]}}).encode()
+        manifest = {
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+            'config': {'mediaType': 'application/vnd.docker.container.image.v1+json',
+                       'digest': registry.push_blob(repo, config), 'size': len(config)},
+            'layers': [{'mediaType': 'application/vnd.docker.image.rootfs.diff.tar.gzip',
+                        'digest': registry.push_blob(repo, blob), 'size': len(blob)} for blob, _ in layers]
+        }
+        manifest_data = json.dumps(manifest).encode()
+        index = {
+            'schemaVersion': 2,
+            'mediaType': 'application/vnd.docker.distribution.manifest.list.v2+json',
+            'manifests': [{'mediaType': manifest['mediaType'],
+                           'digest': registry.push_manifest(repo, manifest_data), 'size': len(manifest_data),
+                           'platform': {'architecture': 'arm64', 'os': 'linux'}}]
+        }
+        return '{}/{}@{}'.format(registry.host, repo, registry.push_manifest(repo, index)), sha256(config)
+
+    def _reassemble(self, store_layer: DockerStore.Layer):
+        # What dockerd does on `docker save`, the layer tar stream is reassembled from tar-split and the diff dir
+        tar = hashlib.sha256()
+        with gzip.open(os.path.join(store_layer._data_root, DockerStore.Layer._LAYER_DB_PATH,
+                                    store_layer.chain_id[len('sha256:'):], 'tar-split.json.gz')) as f:
+            for position, line in enumerate(f):
+                e = json.loads(line)
+                self.assertEqual(position, e['position'])
+                if e['type'] == 2:
+                    tar.update(base64.b64decode(e['payload']))
+                elif e.get('size'):
+                    with open(os.path.join(store_layer.data_path, 'diff', e['name']), 'rb') as content:
+                        data = content.read()
+                    crc = Crc64()
+                    crc.update(data)
+                    self.assertEqual(base64.b64decode(e['payload']), crc.digest())
+                    tar.update(data)
+        return 'sha256:' + tar.hexdigest()
+
+    def test_write(self):
+        with LocalRegistry() as registry, local_factory_registry(registry), TemporaryDirectory() as d:
+            image, image_id = self._push_image(registry, 'image', [self.base_layer, self.top_layer])
+            base_image, base_image_id = self._push_image(registry, 'base', [self.base_layer])
+            copier = OciImageCopier('token', registry_client=DockerRegistryClient('token'))
+            usage = DiskUsage(d)
+            writer = Overlay2Writer(d, copier, max_workers=4, disk_usage=usage)
+            writer.write([image, base_image, image], 'arm64')
+            self.assertEqual(2, writer.unpacked)
+            # the written files are accounted just like `du` reports them
+            self.assertEqual(int(subprocess.check_output(['du', '-sk', d]).split()[0]) * 1024, usage.usage)
+            self.assertEqual(['image', 'overlay2'], sorted(os.listdir(d)))
+            self.assertEqual([], os.listdir(os.path.join(d, 'image/overlay2/layerdb/tmp')))
+
+            store = DockerStore(d)
+            self.assertEqual({image: image_id, base_image: base_image_id},
+                             {ref: img.conf_hash for ref, img in store.images_by_ref.items()})
+            base, top = store.images_by_ref[image].layers
+            self.assertEqual(base.chain_id, store.images_by_ref[base_image].layers[0].chain_id)
+            self.assertEqual(base.cache_id, store.images_by_ref[base_image].layers[0].cache_id)
+            # regular files (a hardlinked file is counted once) and the symlink
+            self.assertEqual(len(self.passwd) + len(self.sh) + len('data') + len('long') + len('sh'), base.size)
+            self.assertEqual(len('new data'), top.size)
+            self.assertEqual(self.base_layer[1], self._reassemble(base))
+            self.assertEqual(self.top_layer[1], self._reassemble(top))
+
+            base_diff = os.path.join(base.data_path, 'diff')
+            st = os.lstat(os.path.join(base_diff, 'bin/sh'))
+            self.assertEqual(0o4755, stat.S_IMODE(st.st_mode))
+            self.assertEqual((1000, 1000, 1700000000), (st.st_uid, st.st_gid, st.st_mtime))
+            self.assertTrue(os.path.samefile(os.path.join(base_diff, 'bin/sh'), os.path.join(base_diff, 'bin/sh2')))
+            self.assertEqual('sh', os.readlink(os.path.join(base_diff, 'bin/bash')))
+            self.assertEqual(1700000000, os.stat(os.path.join(base_diff, 'etc')).st_mtime)
+
+            top_diff = os.path.join(top.data_path, 'diff')
+            st = os.lstat(os.path.join(top_diff, 'etc/passwd'))
+            self.assertTrue(stat.S_ISCHR(st.st_mode))
+            self.assertEqual(0, st.st_rdev)
+            self.assertEqual(b'y', os.getxattr(os.path.join(top_diff, 'var/lib'), 'trusted.overlay.opaque'))
+            self.assertEqual(['new'], os.listdir(os.path.join(top_diff, 'var/lib')))
+
+            # overlay2 metadata
+            with open(os.path.join(base.data_path, 'link')) as f:
+                base_link = f.read()
+            self.assertTrue(os.path.samefile(base_diff, os.path.join(d, 'overlay2', 'l', base_link)))
+            with open(os.path.join(top.data_path, 'lower')) as f:
+                self.assertEqual('l/' + base_link, f.read())
+            self.assertTrue(os.path.isdir(os.path.join(top.data_path, 'work')))
+            self.assertFalse(os.path.exists(os.path.join(base.data_path, 'lower')))
+
+            # the images are already present
+            writer = Overlay2Writer(d, copier)
+            writer.write([image], 'arm64')
+            self.assertEqual(0, writer.unpacked)
+
+    def test_incorrect_diff_id(self):
+        with LocalRegistry() as registry, local_factory_registry(registry), TemporaryDirectory() as d:
+            image, _ = self._push_image(registry, 'image', [(self.base_layer[0], sha256(b'something else'))])
+            copier = OciImageCopier('token', registry_client=DockerRegistryClient('token'))
+            with self.assertRaisesRegex(Exception, 'Incorrect layer diff ID'):
+                Overlay2Writer(d, copier).write([image], 'arm64')
+            self.assertEqual(['l'], os.listdir(os.path.join(d, 'overlay2')))
+            self.assertEqual([], os.listdir(os.path.join(d, 'overlay2', 'l')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+import requests
+import requests_mock
+
+from helpers import HostRateController
+
+
+class HostRateControllerTest(unittest.TestCase):
+    Url = 'https://hub.example.com/v2/factory/app/manifests/sha256:0000'
+
+    def test_throttled_request_is_retried(self):
+        controller = HostRateController(initial_limit=8)
+        with requests_mock.Mocker() as m:
+            m.get(self.Url, [{'status_code': 429, 'headers': {'Retry-After': '0'}},
+                             {'status_code': 503, 'headers': {'Retry-After': '0'}},
+                             {'text': 'ok'}])
+            resp = controller.get(self.Url)
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual(3, m.call_count)
+
+        host = controller._hosts['hub.example.com']
+        self.assertEqual(2, host.throttled)
+        self.assertEqual(3, host.requests)
+        self.assertEqual(0, host.in_flight)
+        # halved twice and then increased by 1/limit
+        self.assertAlmostEqual(2.5, host.limit)
+
+    def test_retries_are_capped(self):
+        controller = HostRateController()
+        with requests_mock.Mocker() as m:
+            m.get(self.Url, status_code=429, headers={'Retry-After': '0'})
+            resp = controller.get(self.Url)
+            self.assertEqual(429, resp.status_code)
+            self.assertEqual(HostRateController.MaxThrottleRetries + 1, m.call_count)
+        self.assertEqual(1, controller._hosts['hub.example.com'].limit)
+
+    def test_throttle_retries(self):
+        # the caller retries the throttled request itself
+        controller = HostRateController()
+        with requests_mock.Mocker() as m:
+            m.get(self.Url, status_code=429, headers={'Retry-After': '0'})
+            self.assertEqual(429, controller.get(self.Url, throttle_retries=0).status_code)
+            self.assertEqual(1, m.call_count)
+
+    def test_streamed_response_holds_slot(self):
+        controller = HostRateController(initial_limit=1)
+        with requests_mock.Mocker() as m:
+            m.get(self.Url, content=b'0' * 1024)
+            with controller.get(self.Url, stream=True) as resp:
+                # the slot is held until the body has been consumed
+                self.assertEqual(1, controller._hosts['hub.example.com'].in_flight)
+                self.assertEqual(1024, len(resp.content))
+            self.assertEqual(0, controller._hosts['hub.example.com'].in_flight)
+            resp.close()
+            self.assertEqual(0, controller._hosts['hub.example.com'].in_flight)
+            controller.get(self.Url)
+            self.assertEqual(0, controller._hosts['hub.example.com'].in_flight)
+
+    def test_failed_request(self):
+        # a connection error backs off the host's limit, it doesn't grow it
+        controller = HostRateController(initial_limit=4)
+        with requests_mock.Mocker() as m:
+            m.get(self.Url, exc=requests.exceptions.ConnectionError)
+            self.assertRaises(requests.exceptions.ConnectionError, controller.get, self.Url)
+        h = controller._hosts['hub.example.com']
+        self.assertEqual(0, h.in_flight)
+        self.assertEqual(2, h.limit)
+        self.assertEqual(0, h.throttled)
+
+    def test_limit_growth_is_capped(self):
+        controller = HostRateController(initial_limit=2, max_limit=4)
+        with requests_mock.Mocker() as m:
+            m.get(self.Url, text='ok')
+            for _ in range(100):
+                controller.get(self.Url)
+        self.assertEqual(4, controller._hosts['hub.example.com'].limit)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from apps.docker_registry_client import DockerRegistryClient
+from apps.registry_mirrors import RegistryMirrors
+from local_registry import LocalRegistry
+
+
+class RegistryMirrorsTest(unittest.TestCase):
+    Repo = 'org/image'
+
+    def setUp(self):
+        self.origin = LocalRegistry().start()
+        self.mirror = LocalRegistry().start()
+        self.addCleanup(self.origin.stop)
+        self.addCleanup(self.mirror.stop)
+        self.blob = os.urandom(3 * 1024 * 1024)
+        self.digest = self.origin.push_blob(self.Repo, self.blob)
+        self.manifest = json.dumps({'layers': [{'digest': self.digest}]}).encode()
+        self.manifest_digest = self.origin.push_manifest(self.Repo, self.manifest)
+        self.uri = DockerRegistryClient.parse_image_uri(
+            '{}/{}@{}'.format(self.origin.host, self.Repo, self.manifest_digest))
+
+    def _client(self, mirrors):
+        mirrors = RegistryMirrors('{}={}'.format(self.origin.host, ','.join(mirrors)))
+        patcher = mock.patch('apps.docker_registry_client.registry_mirrors', mirrors)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return DockerRegistryClient('token', registry_host=self.origin.host, schema='http'), mirrors
+
+    def test_content_is_served_by_mirror(self):
+        self.mirror.push_blob(self.Repo, self.blob)
+        self.mirror.push_manifest(self.Repo, self.manifest)
+        client, mirrors = self._client([self.mirror.url])
+
+        self.assertEqual({'layers': [{'digest': self.digest}]}, client.download_manifest(
+            '{}/{}@{}'.format(self.origin.host, self.Repo, self.manifest_digest)))
+        self.assertEqual(self.blob, client.pull_layer(self.uri, self.digest))
+        self.assertEqual(0, self.origin.stats['requests'])
+        self.assertEqual({self.mirror.url: {'hits': 2, 'misses': 0, 'bytes': len(self.blob) + len(self.manifest)}}, mirrors.stats)
+
+    def test_fallback_to_origin(self):
+        # the first mirror is down, the second one doesn't have the blob
+        client, mirrors = self._client(['http://127.0.0.1:1', self.mirror.url])
+        self.assertEqual(self.blob, client.pull_layer(self.uri, self.digest))
+        self.assertEqual({'hits': 0, 'misses': 1, 'bytes': 0}, mirrors.stats['http://127.0.0.1:1'])
+        self.assertEqual({'hits': 0, 'misses': 1, 'bytes': 0}, mirrors.stats[self.mirror.url])
+        self.assertEqual({'hits': 1, 'misses': 0, 'bytes': len(self.blob)}, mirrors.stats[self.origin.url])
+
+    def test_mirror_cannot_alter_content(self):
+        self.mirror._blobs[self.Repo][self.digest] = os.urandom(len(self.blob))
+        client, mirrors = self._client([self.mirror.url])
+        # the blob is pulled from the origin once the mirror's one turns out to be corrupted
+        self.assertEqual(self.blob, client.pull_layer(self.uri, self.digest))
+        self.assertEqual(1, mirrors.stats[self.mirror.url]['misses'])
+
+        # the corrupted content that has been already consumed can't be rewound
+        with self.assertRaises(Exception):
+            for _ in client._iter_blob(self.uri, self.digest):
+                pass
+
+    def test_authenticated_factory_registry_mirror(self):
+        # a mirror of the factory registry that challenges requests gets the factory credentials
+        mirror = LocalRegistry(credentials=(DockerRegistryClient.FactoryAuthUser, 'token')).start()
+        self.addCleanup(mirror.stop)
+        mirror.push_blob(self.Repo, self.blob)
+        with mock.patch.object(DockerRegistryClient, 'DefaultRegistryHost', self.origin.host):
+            client, mirrors = self._client([mirror.url])
+            self.assertTrue(client.is_factory_registry)
+            self.assertEqual(self.blob, client.pull_layer(self.uri, self.digest))
+        self.assertEqual(0, self.origin.stats['requests'])
+        self.assertEqual({'hits': 1, 'misses': 0, 'bytes': len(self.blob)}, mirrors.stats[mirror.url])
+
+    def test_registries_conf(self):
+        mirrors = RegistryMirrors('hub.example.com=http://10.0.0.5:5000,mirror.local; docker.io = mirror.gcr.io')
+        self.assertEqual(['http://10.0.0.5:5000', 'https://mirror.local'], mirrors.get('hub.example.com'))
+        self.assertEqual(['https://mirror.gcr.io'], mirrors.get('registry-1.docker.io'))
+        self.assertEqual([], mirrors.get('quay.io'))
+        self.assertEqual(['--registry-mirror', 'https://mirror.gcr.io'], mirrors.docker_daemon_args())
+
+        with mirrors.skopeo_args() as args:
+            self.assertEqual('--registries-conf', args[0])
+            conf = args[1]
+            with open(conf) as f:
+                self.assertIn('[[registry]]\nlocation = "hub.example.com"\n\n'
+                              '[[registry.mirror]]\nlocation = "10.0.0.5:5000"\ninsecure = true\n\n'
+                              '[[registry.mirror]]\nlocation = "mirror.local"\n', f.read())
+        # the config file is removed once skopeo is done
+        self.assertFalse(os.path.exists(conf))
+        with RegistryMirrors('').skopeo_args() as args:
+            self.assertEqual([], args)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from apps.app_graph_cache import AppGraphCache
+from apps.target_apps_fetcher import SkopeAppFetcher, TargetAppsFetcher
+from fixtures import SyntheticTarget, local_factory_registry
+from local_registry import LocalRegistry
+
+
+class AppsSizePlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.registry = LocalRegistry().start()
+        self.addCleanup(self.registry.stop)
+        factory_registry = local_factory_registry(self.registry)
+        factory_registry.__enter__()
+        self.addCleanup(factory_registry.__exit__, None, None, None)
+
+    def test_plan(self):
+        target = SyntheticTarget(self.registry, apps=3, images=2, layers=3, layer_size=10000, shared_layers=1)
+        fetcher = SkopeAppFetcher('token', self.tmp_dir.name)
+        self.registry.reset_stats()
+        plan = fetcher.plan_target(target.target)
+        # neither app archives nor image blobs are pulled, only the layers metadata blob of each app
+        self.assertEqual(3, self.registry.stats['requests_by_kind']['blob'])
+        self.assertTrue(plan.complete)
+        self.assertEqual(3, plan.apps)
+
+        layers = {layer: len(layer) for image_layers in target.image_layers.values() for layer in image_layers}
+        self.assertEqual(sum(SyntheticTarget.layer_usage(size) for size in layers.values()), plan.layers_usage)
+
+        self.registry.reset_stats()
+        fetcher.fetch_target(target.target, force=True)
+        planned_fetch_blobs = self.registry.stats['requests_by_kind']['blob']
+        # the planned blobs are the fetched ones, except image manifests and configs
+        blobs_dir = os.path.join(fetcher.blobs_dir(target.name), 'sha256')
+        fetched_blobs = {'sha256:' + name: os.path.getsize(os.path.join(blobs_dir, name))
+                         for name in os.listdir(blobs_dir)}
+        for digest, size in plan.blobs.items():
+            self.assertEqual(size, fetched_blobs.get(digest), digest)
+        # app manifests, archives, layers metadata and indexes, and image layers
+        self.assertEqual(3 * 4 + len(layers), len(plan.blobs))
+        self.assertLess(plan.blobs_usage, fetcher.get_target_apps_size(target.target))
+        self.assertLess(plan.download, sum(fetched_blobs.values()))
+        self.assertEqual(plan.apps_usage + plan.blobs_usage, fetcher.get_planned_apps_size(plan))
+
+        # the layers metadata blobs pulled by the planner are not pulled again by the fetch
+        self.registry.reset_stats()
+        SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'unplanned')).fetch_target(target.target, force=True)
+        self.assertEqual(self.registry.stats['requests_by_kind']['blob'] - 3, planned_fetch_blobs)
+
+    def test_graph_cache(self):
+        target = SyntheticTarget(self.registry, apps=3, images=2, layers=3, layer_size=10000)
+        cache_dir = os.path.join(self.tmp_dir.name, 'graph-cache')
+        with mock.patch.dict(os.environ, {AppGraphCache.CacheDirEnv: cache_dir}):
+            plan = SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'cold')).plan_target(target.target)
+            # the app graphs, including the layers metadata, are read from the cache, nothing is requested
+            self.registry.reset_stats()
+            warm_plan = SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'warm')).plan_target(target.target)
+            self.assertEqual({}, self.registry.stats['requests_by_kind'])
+            self.assertEqual(plan.blobs, warm_plan.blobs)
+            self.assertEqual(plan.layers_usage, warm_plan.layers_usage)
+
+            # a fetch keeps the planned nodes in the cached app graphs
+            fetcher = SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'fetch'))
+            fetcher.plan_target(target.target)
+            fetcher.fetch_target(target.target, force=True)
+            self.registry.reset_stats()
+            SkopeAppFetcher('token', os.path.join(self.tmp_dir.name, 'warm')).plan_target(target.target)
+            self.assertEqual({}, self.registry.stats['requests_by_kind'])
+
+    def test_shortlist(self):
+        target = SyntheticTarget(self.registry, apps=3, images=1, layers=2, layer_size=1024)
+        fetcher = TargetAppsFetcher('token', self.tmp_dir.name)
+        plan = fetcher.plan_target(target.target, shortlist=['app-1'])
+        self.assertEqual(1, plan.apps)
+        self.assertEqual(plan.apps_usage + plan.layers_usage, fetcher.get_planned_apps_size(plan))
+
+    def test_unknown_layers(self):
+        target = SyntheticTarget(self.registry, apps=2, images=1, layers=2, layer_size=1024, layers_meta=False)
+        plan = TargetAppsFetcher('token', self.tmp_dir.name).plan_target(target.target)
+        self.assertFalse(plan.complete)
+        self.assertEqual(3, len(plan.unknown_layers))
+        self.assertEqual(0, plan.layers_usage)
+
+        target.json['custom']['arch'] = SyntheticTarget.OEArch['amd64']
+        plan = TargetAppsFetcher('token', self.tmp_dir.name).plan_target(target.target)
+        self.assertFalse(plan.complete)
+        self.assertEqual(['app-0', 'app-1'], sorted(plan.unknown_apps))
+
+
+if __name__ == '__main__':
+    unittest.main()